@@ -0,0 +1,170 @@
+# Sales analytics rollup.
+# SalesRollup keeps units, revenue and order lines per (order day, category,
+# size, vendor). Orders are counted in incrementally, in the transaction that
+# moves them to Delivered or Received, and purchaseOrders.rolledUpAt makes sure
+# each order is counted exactly once. Run this module to rebuild the rollup
+# from the order history:
+#
+#   cd API && python analytics.py [chunk size]
+import asyncio
+import json
+import sys
+import database
+
+# Order statuses that count as a sale
+SALE_STATUSES = ("Delivered", "Received")
+# Orders rolled up per transaction by the backfill
+BACKFILL_CHUNK_SIZE = 5000
+
+# Add the orders listed in @rolled to the rollup, reading them from the given tables.
+# Revenue is the order-time line total.
+MERGE_ROLLUP_SQL = '''
+MERGE SalesRollup WITH (HOLDLOCK) AS t
+USING (
+    SELECT CAST(ISNULL(po.orderDate, po.statusDate) AS DATE) AS salesDate, p.category, p.size,
+           ISNULL(po.vendorID, 0) AS vendorID,
+           SUM(pod.orderQuantity) AS units,
+           ISNULL(SUM(pod.lineTotal), 0) AS revenue,  -- lines stored without a price count no revenue
+           COUNT(*) AS orderLines
+    FROM @rolled AS r
+    JOIN {orders} AS po ON po.orderID = r.orderID
+    JOIN {lines} AS pod ON pod.orderID = po.orderID
+    JOIN {products} AS p ON p.productID = pod.productID
+    GROUP BY CAST(ISNULL(po.orderDate, po.statusDate) AS DATE), p.category, p.size, ISNULL(po.vendorID, 0)
+) AS s
+ON t.salesDate = s.salesDate AND t.category = s.category AND t.size = s.size AND t.vendorID = s.vendorID
+WHEN MATCHED THEN
+    UPDATE SET units = t.units + s.units, revenue = t.revenue + s.revenue, orderLines = t.orderLines + s.orderLines
+WHEN NOT MATCHED THEN
+    INSERT (salesDate, category, size, vendorID, units, revenue, orderLines)
+    VALUES (s.salesDate, s.category, s.size, s.vendorID, s.units, s.revenue, s.orderLines);
+'''
+
+# Count the given orders in, skipping orders already counted or not (yet) sold
+ROLLUP_ORDERS_SQL = f'''
+SET NOCOUNT ON;
+DECLARE @rolled TABLE (orderID INT PRIMARY KEY);
+
+UPDATE po
+SET rolledUpAt = GETUTCDATE()
+OUTPUT inserted.orderID INTO @rolled
+FROM purchaseOrders AS po
+JOIN OPENJSON(?) WITH (orderID INT '$') AS o ON o.orderID = po.orderID
+WHERE po.rolledUpAt IS NULL AND po.orderStatus IN ({", ".join(f"'{status}'" for status in SALE_STATUSES)});
+{MERGE_ROLLUP_SQL.format(orders="purchaseOrders", lines="purchaseOrderDetails", products="Products")}
+SELECT COUNT(*) FROM @rolled;
+'''
+
+# Count in the next chunk of archived sold orders (archive.py). Only the backfill
+# reads them: an order is archived after it was counted and never changes again.
+ROLLUP_ARCHIVED_SQL = f'''
+SET NOCOUNT ON;
+DECLARE @rolled TABLE (orderID INT PRIMARY KEY);
+
+INSERT INTO @rolled (orderID)
+SELECT TOP (?) orderID FROM purchaseOrdersArchive
+WHERE orderID > ? AND orderStatus IN ({", ".join(f"'{status}'" for status in SALE_STATUSES)})
+ORDER BY orderID;
+{MERGE_ROLLUP_SQL.format(orders="purchaseOrdersArchive", lines="purchaseOrderDetailsArchive", products="AllProducts")}
+SELECT COUNT(*), MAX(orderID) FROM @rolled;
+'''
+
+# Dimensions /analytics/sales can group by -> rollup expression
+GROUP_COLUMNS = {
+    "day": "salesDate",
+    "month": "DATEFROMPARTS(YEAR(salesDate), MONTH(salesDate), 1)",
+    "year": "YEAR(salesDate)",
+    "category": "category",
+    "size": "size",
+    "vendor": "NULLIF(vendorID, 0)",
+}
+
+
+async def rollup_orders(cursor, order_ids) -> int:
+    """Count sold orders into the rollup in the caller's unit of work; returns how many were new."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return 0
+    await cursor.execute(ROLLUP_ORDERS_SQL, (json.dumps(order_ids),))
+    return (await cursor.fetchone())[0]
+
+
+async def sales(date_from, date_to, group_by, category=None, size=None, vendor_id=None):
+    """Sum units, revenue and order lines over [date_from, date_to] grouped by the given dimensions."""
+    columns = [f"{GROUP_COLUMNS[name]} AS {name}" for name in group_by]
+    filters, params = ["salesDate BETWEEN ? AND ?"], [date_from, date_to]
+    if category is not None:
+        filters.append("category = ?")
+        params.append(category)
+    if size is not None:
+        filters.append("size = ?")
+        params.append(size)
+    if vendor_id is not None:
+        filters.append("vendorID = ?")
+        params.append(vendor_id)
+    group_clause = f"GROUP BY {', '.join(GROUP_COLUMNS[name] for name in group_by)}" if group_by else ""
+    order_clause = f"ORDER BY {', '.join(GROUP_COLUMNS[name] for name in group_by)}" if group_by else ""
+    async with database.unit_of_work() as cursor:
+        await cursor.execute(f'''
+            SELECT {"".join(column + ", " for column in columns)}
+                   SUM(units), SUM(revenue), SUM(orderLines)
+            FROM SalesRollup
+            WHERE {" AND ".join(filters)}
+            {group_clause}
+            {order_clause}''', params)
+        rows = await cursor.fetchall()
+    return [
+        {
+            **dict(zip(group_by, row[:len(group_by)])),
+            "units": row[-3] or 0,
+            "revenue": row[-2] or 0,
+            "orderLines": row[-1] or 0,
+        }
+        for row in rows
+    ]
+
+
+async def backfill(chunk_size: int = BACKFILL_CHUNK_SIZE):
+    """Rebuild the rollup from the order history (archived orders first), one chunk of orders per transaction."""
+    # orders sold while the backfill runs are counted once, by whichever side flags them first
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('DELETE FROM SalesRollup')
+        await cursor.execute('UPDATE purchaseOrders SET rolledUpAt = NULL WHERE rolledUpAt IS NOT NULL')
+
+    last_order_id, total = 0, 0
+    while True:
+        async with database.unit_of_work() as cursor:
+            await cursor.execute(ROLLUP_ARCHIVED_SQL, (int(chunk_size), last_order_id))
+            rolled, last_archived_id = await cursor.fetchone()
+        if not rolled:
+            break
+        total += rolled
+        last_order_id = last_archived_id
+        print(f"Rolled up {total} archived orders (up to orderID {last_order_id})")
+
+    last_order_id = 0
+    while True:
+        async with database.unit_of_work() as cursor:
+            await cursor.execute(f'''
+                SELECT TOP ({int(chunk_size)}) orderID FROM purchaseOrders
+                WHERE orderID > ? AND rolledUpAt IS NULL AND orderStatus IN (?, ?)
+                ORDER BY orderID''', (last_order_id, *SALE_STATUSES))
+            order_ids = [row[0] for row in await cursor.fetchall()]
+            if not order_ids:
+                break
+            total += await rollup_orders(cursor, order_ids)
+        last_order_id = order_ids[-1]
+        print(f"Rolled up {total} orders (up to orderID {last_order_id})")
+    return total
+
+
+async def main(chunk_size: int):
+    try:
+        total = await backfill(chunk_size)
+        print(f"Sales rollup rebuilt from {total} sold orders")
+    finally:
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else BACKFILL_CHUNK_SIZE))
@@ -0,0 +1,238 @@
+# Archive tier.
+# Closed orders (with the variants they consumed), the other consumed variants
+# and inactive products that nothing hot refers to any more move out of the hot
+# tables into their *Archive twins (migration 010), one batch per transaction, so
+# the catalogue and order queries only scan live rows. Each batch is moved with
+# DELETE ... OUTPUT deleted.* INTO, so a row is in exactly one of the two tables.
+# Reads that ask for archived rows go through the All* views. The server archives
+# in the background; run this module to archive everything due right away:
+#
+#   cd API && python archive.py [batch size]
+import asyncio
+import sys
+import analytics
+import barcode_index
+import database
+import invalidation
+
+# Orders are archived this long after their last status change. The dashboards
+# read the last 30 days from the hot tables only, so this must stay above that.
+ARCHIVE_AFTER_DAYS = 90
+MIN_ARCHIVE_AFTER_DAYS = 31
+# Order statuses after which an order is closed
+CLOSED_STATUSES = ("Delivered", "Received", "Rejected", "Cancelled")
+# Rows picked per transaction (orders, variants or products)
+ARCHIVE_BATCH_SIZE = 2000
+# How often the background task archives
+ARCHIVE_CHECK_SECONDS = 3600
+
+# Hot table -> its archive table and the view over both
+ARCHIVE_TABLES = {
+    "Products": "ProductsArchive",
+    "ProductVariants": "ProductVariantsArchive",
+    "purchaseOrders": "purchaseOrdersArchive",
+    "purchaseOrderDetails": "purchaseOrderDetailsArchive",
+}
+ALL_ROWS_VIEWS = {
+    "Products": "AllProducts",
+    "ProductVariants": "AllProductVariants",
+    "purchaseOrders": "AllPurchaseOrders",
+    "purchaseOrderDetails": "AllPurchaseOrderDetails",
+}
+
+# Closed orders whose sale is already in the rollup, their consumed variants and their lines.
+# UPDLOCK + READPAST lets two archivers take disjoint batches.
+ARCHIVE_ORDERS_SQL = f'''
+SET NOCOUNT ON;
+DECLARE @orders TABLE (orderID INT PRIMARY KEY);
+DECLARE @variants TABLE (variantID INT PRIMARY KEY);
+
+INSERT INTO @orders (orderID)
+SELECT TOP (?) orderID FROM purchaseOrders WITH (UPDLOCK, READPAST)
+WHERE orderStatus IN ({", ".join(f"'{status}'" for status in CLOSED_STATUSES)})
+  AND statusDate < ?
+  AND (rolledUpAt IS NOT NULL OR orderStatus NOT IN ({", ".join(f"'{status}'" for status in analytics.SALE_STATUSES)}))
+ORDER BY orderID;
+
+INSERT INTO @variants (variantID)
+SELECT pv.variantID FROM ProductVariants AS pv
+JOIN @orders AS o ON o.orderID = pv.reservedOrderID
+WHERE pv.isAvailable = 0;
+
+{{variants}}
+
+DELETE pod
+OUTPUT {{details_deleted}} INTO purchaseOrderDetailsArchive ({{details_columns}})
+FROM purchaseOrderDetails AS pod
+JOIN @orders AS o ON o.orderID = pod.orderID;
+
+DELETE po
+OUTPUT {{orders_deleted}} INTO purchaseOrdersArchive ({{orders_columns}})
+FROM purchaseOrders AS po
+JOIN @orders AS o ON o.orderID = po.orderID;
+
+SELECT COUNT(*) FROM @orders;
+SELECT barcode FROM ProductVariantsArchive WHERE variantID IN (SELECT variantID FROM @variants);
+'''
+
+# Consumed variants no hot order holds: soft-deleted or flagged ones, and those
+# of orders archived a whole month at a time (order_partitions.py)
+ARCHIVE_VARIANTS_SQL = '''
+SET NOCOUNT ON;
+DECLARE @variants TABLE (variantID INT PRIMARY KEY);
+
+INSERT INTO @variants (variantID)
+SELECT TOP (?) pv.variantID FROM ProductVariants AS pv WITH (UPDLOCK, READPAST)
+WHERE pv.isAvailable = 0
+  AND (pv.reservedOrderID IS NULL
+       OR NOT EXISTS (SELECT 1 FROM purchaseOrders AS po WHERE po.orderID = pv.reservedOrderID))
+ORDER BY pv.variantID;
+
+{variants}
+
+SELECT COUNT(*) FROM @variants;
+SELECT barcode FROM ProductVariantsArchive WHERE variantID IN (SELECT variantID FROM @variants);
+'''
+
+# Moves the variants listed in @variants; shared by the two statements above
+MOVE_VARIANTS_SQL = '''
+DELETE pv
+OUTPUT {variants_deleted} INTO ProductVariantsArchive ({variants_columns})
+FROM ProductVariants AS pv
+JOIN @variants AS v ON v.variantID = pv.variantID;
+'''
+
+# Inactive products without hot variants or hot order lines. Their stock level
+# row goes with them; their alerts and ledger movements stay as history.
+ARCHIVE_PRODUCTS_SQL = '''
+SET NOCOUNT ON;
+DECLARE @products TABLE (productID INT PRIMARY KEY);
+
+INSERT INTO @products (productID)
+SELECT TOP (?) p.productID FROM Products AS p WITH (UPDLOCK, READPAST)
+WHERE p.isActive = 0
+  AND NOT EXISTS (SELECT 1 FROM ProductVariants AS pv WHERE pv.productID = p.productID)
+  AND NOT EXISTS (SELECT 1 FROM purchaseOrderDetails AS pod WHERE pod.productID = p.productID)
+ORDER BY p.productID;
+
+DELETE s FROM ProductStockLevels AS s JOIN @products AS a ON a.productID = s.productID;
+
+DELETE p
+OUTPUT {products_deleted} INTO ProductsArchive ({products_columns})
+FROM Products AS p
+JOIN @products AS a ON a.productID = p.productID;
+
+SELECT COUNT(*) FROM @products;
+'''
+
+# Statements with the column lists filled in, built on first use
+_statements = {}
+
+
+# Function to name the view to read a hot table from
+def source(table: str, include_archived: bool) -> str:
+    return ALL_ROWS_VIEWS[table] if include_archived else table
+
+
+# Function to list the columns a hot table shares with its archive table
+async def shared_columns(cursor, table: str):
+    archive_table = ARCHIVE_TABLES[table]
+    await cursor.execute('''
+        SELECT name, CASE WHEN object_id = OBJECT_ID(?) THEN 1 ELSE 0 END FROM sys.columns
+        WHERE object_id IN (OBJECT_ID(?), OBJECT_ID(?)) ORDER BY column_id''', (table, table, archive_table))
+    rows = await cursor.fetchall()
+    hot = [name for name, is_hot in rows if is_hot]
+    archived = {name for name, is_hot in rows if not is_hot}
+    missing = [name for name in hot if name not in archived]
+    if missing:
+        raise RuntimeError(f"{archive_table} lacks the columns {', '.join(missing)} of {table}")
+    return hot
+
+
+async def _load_statements(cursor):
+    if _statements:
+        return _statements
+    lists = {}
+    for table, prefix in (("Products", "products"), ("ProductVariants", "variants"),
+                          ("purchaseOrders", "orders"), ("purchaseOrderDetails", "details")):
+        columns = await shared_columns(cursor, table)
+        lists[f"{prefix}_columns"] = ", ".join(f"[{name}]" for name in columns)
+        lists[f"{prefix}_deleted"] = ", ".join(f"deleted.[{name}]" for name in columns)
+    move_variants = MOVE_VARIANTS_SQL.format(**lists)
+    _statements.update({
+        "orders": ARCHIVE_ORDERS_SQL.format(variants=move_variants, **lists),
+        "variants": ARCHIVE_VARIANTS_SQL.format(variants=move_variants),
+        "products": ARCHIVE_PRODUCTS_SQL.format(**lists),
+    })
+    return _statements
+
+
+async def _archive_batch(kind: str, params) -> int:
+    """Move one batch in its own transaction; returns how many orders, variants or products moved."""
+    async def move(cursor):
+        statements = await _load_statements(cursor)
+        await cursor.execute(statements[kind], params)
+        count = (await cursor.fetchone())[0]
+        if kind != "products":
+            # the barcodes of the archived variants leave the scanner index
+            await cursor.nextset()
+            barcodes = [row[0] for row in await cursor.fetchall()]
+            if barcodes:
+                database.after_commit(lambda: barcode_index.index.remove(barcodes))
+                invalidation.publish_after_commit("ProductVariants", barcodes)
+        return count
+
+    return await database.run_in_transaction(move)
+
+
+async def archive_due(after_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE):
+    """Archive every closed order, consumed variant and inactive product that is due; returns the counts."""
+    if after_days < MIN_ARCHIVE_AFTER_DAYS:
+        raise ValueError(f"Orders must stay hot for at least {MIN_ARCHIVE_AFTER_DAYS} days")
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('SELECT DATEADD(DAY, ?, GETDATE())', (-after_days,))
+        closed_before = (await cursor.fetchone())[0]
+
+    # orders first: their variants and lines are what keeps products hot
+    moved = {"orders": 0, "variants": 0, "products": 0}
+    for kind, params in (("orders", (batch_size, closed_before)),
+                         ("variants", (batch_size,)),
+                         ("products", (batch_size,))):
+        while True:
+            count = await _archive_batch(kind, params)
+            moved[kind] += count
+            if count < batch_size:
+                break
+    return moved
+
+
+async def archive_loop():
+    """Archive whatever is due every ARCHIVE_CHECK_SECONDS, for as long as the server runs."""
+    while True:
+        try:
+            moved = await archive_due()
+            if any(moved.values()):
+                print(f"Archived {moved['orders']} orders, {moved['variants']} variants, {moved['products']} products")
+        except Exception as e:
+            print(f"Error archiving: {e}")
+        await asyncio.sleep(ARCHIVE_CHECK_SECONDS)
+
+
+async def is_archived_order(cursor, order_id: int) -> bool:
+    await cursor.execute('SELECT 1 FROM purchaseOrdersArchive WHERE orderID = ?', (order_id,))
+    return await cursor.fetchone() is not None
+
+
+async def main(batch_size: int):
+    # join the running server's invalidation bus so its workers forget the archived barcodes
+    await invalidation.start_bus()
+    try:
+        moved = await archive_due(batch_size=batch_size)
+        print(f"Archived {moved['orders']} orders, {moved['variants']} variants, {moved['products']} products")
+    finally:
+        await invalidation.stop_bus()
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_BATCH_SIZE))
@@ -0,0 +1,142 @@
+from array import array
+import database
+import invalidation
+import loaders
+
+# Rows fetched per round-trip while the index loads
+LOAD_BATCH_SIZE = 10000
+# Barcodes per IN (...) query when reading variants the index has not seen (SQL Server allows 2100 parameters)
+FETCH_CHUNK_SIZE = 1000
+
+
+# In-memory barcode index for the scanner endpoints. Every variant owns one slot:
+# the dict maps barcode -> slot and the slot's variantID, productID and
+# availability live in flat arrays, so a million variants cost a dict entry
+# plus 9 bytes each instead of a Python object per row.
+class BarcodeIndex:
+    def __init__(self):
+        self._slots = {}
+        self._variant_ids = array('i')
+        self._product_ids = array('i')
+        self._available = bytearray()
+        self.loaded = False
+        # barcodes removed or changed while a load is reading ProductVariants (requests run during the
+        # warm-up); the fresh index forgets them too and reads them again on their next scan
+        self._removed_while_loading = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _add(self, barcode: str, variant_id: int, product_id: int, available: bool):
+        slot = self._slots.get(barcode)
+        if slot is None:
+            self._slots[barcode] = len(self._variant_ids)
+            self._variant_ids.append(variant_id)
+            self._product_ids.append(product_id)
+            self._available.append(1 if available else 0)
+        else:
+            self._variant_ids[slot] = variant_id
+            self._product_ids[slot] = product_id
+            self._available[slot] = 1 if available else 0
+
+    async def load(self):
+        """(Re)build the index from ProductVariants."""
+        fresh = BarcodeIndex()
+        self._removed_while_loading = removed = set()
+        try:
+            async with database.unit_of_work() as cursor:
+                await cursor.execute('SELECT barcode, variantID, productID, isAvailable FROM ProductVariants')
+                while True:
+                    rows = await cursor.fetchmany(LOAD_BATCH_SIZE)
+                    if not rows:
+                        break
+                    for barcode, variant_id, product_id, available in rows:
+                        fresh._add(barcode, variant_id, product_id, available)
+        finally:
+            self._removed_while_loading = None
+        for barcode in removed:
+            fresh._slots.pop(barcode, None)
+        self._slots, self._variant_ids = fresh._slots, fresh._variant_ids
+        self._product_ids, self._available = fresh._product_ids, fresh._available
+        self.loaded = True
+        print(f"Barcode index loaded: {len(self)} variants")
+
+    def lookup(self, barcode: str):
+        """Return the variant scanned as barcode, or None when it is not indexed."""
+        slot = self._slots.get(barcode)
+        if slot is None:
+            return None
+        return {
+            "barcode": barcode,
+            "variantID": self._variant_ids[slot],
+            "productID": self._product_ids[slot],
+            "isAvailable": bool(self._available[slot]),
+        }
+
+    # Hooks called after the variant writes commit
+
+    def add_variants(self, product_id: int, variants):
+        """Index new variants given as (variantID, barcode) pairs."""
+        for variant_id, barcode in variants:
+            self._add(barcode, variant_id, product_id, True)
+
+    def set_available(self, barcodes, available: bool):
+        flag = 1 if available else 0
+        for barcode in barcodes:
+            slot = self._slots.get(barcode)
+            if slot is not None:
+                self._available[slot] = flag
+        if self._removed_while_loading is not None:
+            self._removed_while_loading.update(barcodes)
+
+    def remove(self, barcodes):
+        """Forget archived variants (or ones another worker changed); their slots stay unused until the next load."""
+        for barcode in barcodes:
+            self._slots.pop(barcode, None)
+        if self._removed_while_loading is not None:
+            self._removed_while_loading.update(barcodes)
+
+
+async def fetch_variants(barcodes):
+    """Read variants the index has not seen (e.g. inserted by another worker) and index them."""
+    found = {}
+    for start in range(0, len(barcodes), FETCH_CHUNK_SIZE):
+        seen = invalidation.version("ProductVariants")
+        rows = await loaders.fetch_in('''SELECT barcode, variantID, productID, isAvailable
+            FROM ProductVariants WHERE barcode IN ({placeholders})''', barcodes[start:start + FETCH_CHUNK_SIZE])
+        # rows read while a change arrived may predate it; answer with them but do not index them
+        keep = invalidation.version("ProductVariants") == seen
+        for barcode, variant_id, product_id, available in rows:
+            if keep:
+                index._add(barcode, variant_id, product_id, available)
+            found[barcode] = {
+                "barcode": barcode,
+                "variantID": variant_id,
+                "productID": product_id,
+                "isAvailable": bool(available),
+            }
+    return found
+
+
+async def fetch_archived_variants(barcodes):
+    """Read variants moved to the archive (archive.py); they are never indexed."""
+    found = {}
+    for start in range(0, len(barcodes), FETCH_CHUNK_SIZE):
+        rows = await loaders.fetch_in('''SELECT barcode, variantID, productID
+            FROM ProductVariantsArchive WHERE barcode IN ({placeholders})''', barcodes[start:start + FETCH_CHUNK_SIZE])
+        for barcode, variant_id, product_id in rows:
+            found[barcode] = {
+                "barcode": barcode,
+                "variantID": variant_id,
+                "productID": product_id,
+                "isAvailable": False,
+                "isArchived": True,
+            }
+    return found
+
+
+# Index shared by every request in this process
+index = BarcodeIndex()
+# Variants changed by other workers are read again on their next scan; this worker's
+# own writes update the index in place
+invalidation.subscribe("ProductVariants", index.remove, own_writes=False)
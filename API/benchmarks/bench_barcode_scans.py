@@ -0,0 +1,75 @@
+# Benchmark: /variants/by-barcode/{code} latency served from the in-memory barcode index.
+#
+#   cd API && python benchmarks/bench_barcode_scans.py [variants] [scans]
+#
+# Needs no database: the index is filled with synthetic variants and the app is
+# called in-process as a raw ASGI request (middleware included, no HTTP client
+# or socket), so the numbers are the server-side cost of a scan.
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import barcode_index
+from main import app
+
+DEFAULT_VARIANTS = 1_000_000
+DEFAULT_SCANS = 20_000
+
+
+def fill_index(variants: int):
+    tracemalloc.start()
+    barcodes = []
+    for variant_id in range(1, variants + 1):
+        barcode = f"{variant_id:013d}"
+        barcode_index.index.add_variants(variant_id // 10 + 1, [(variant_id, barcode)])
+        barcodes.append(barcode)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return barcodes, size
+
+
+async def scan(code: str) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": f"/variants/by-barcode/{code}", "raw_path": b"", "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def main(variants: int, scans: int):
+    barcodes, index_bytes = fill_index(variants)
+    codes = [random.choice(barcodes) for _ in range(scans)]
+    timings = []
+    started = time.perf_counter()
+    for code in codes:
+        scan_started = time.perf_counter()
+        status = await scan(code)
+        timings.append(time.perf_counter() - scan_started)
+        assert status == 200, status
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    print(f"{variants} indexed variants (~{index_bytes / variants:.0f} bytes each incl. barcode strings), {scans} scans")
+    print(f"  throughput: {scans / elapsed:8.0f} scans/s")
+    print(f"  p50       : {timings[len(timings) // 2] * 1000:8.3f} ms")
+    print(f"  p99       : {timings[int(len(timings) * 0.99)] * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_VARIANTS,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SCANS))
@@ -0,0 +1,103 @@
+# Benchmark: POST /products/products/import with a generated 100k-row catalogue.
+#
+#   cd API && python migrate.py && python benchmarks/bench_catalogue_import.py [rows]
+#   cd API && python benchmarks/bench_catalogue_import.py [rows] --parse-only
+#
+# The catalogue is written to a temporary CSV (10 sizes per product, one unit per
+# size) and posted to the app in-process. The imported products are put in their
+# own category and deleted afterwards; run it against a scratch copy of the
+# database. --parse-only skips the database and times reading, validating and
+# grouping the rows, at the given size and a tenth of it, to show that peak memory
+# does not follow the file size.
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalogue_import
+
+DEFAULT_ROWS = 100_000
+SIZES = ("5", "5.5", "6", "6.5", "7", "7.5", "8", "8.5", "9", "10")
+
+
+def write_catalogue(path: str, rows: int, category: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(catalogue_import.REQUIRED_COLUMNS + ("color",))
+        for row in range(rows):
+            product = row // len(SIZES)
+            writer.writerow((f"Bench shoe {product}", f"Generated product {product}",
+                             SIZES[row % len(SIZES)], category, "49.95", 1, "black"))
+
+
+def parse(path: str):
+    report = catalogue_import.ImportReport()
+    tracemalloc.start()
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        rows = catalogue_import.iter_rows(f, path)
+        while catalogue_import.next_chunk(rows, report) is not None:
+            pass
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return report, elapsed, peak
+
+
+async def import_file(path: str):
+    import httpx
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        with open(path, "rb") as f:
+            started = time.perf_counter()
+            response = await client.post("/products/products/import", files={"file": ("catalogue.csv", f, "text/csv")})
+            elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    return response.json(), elapsed
+
+
+async def delete_category(category: str):
+    import database
+
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('''DELETE pv FROM ProductVariants AS pv
+            JOIN Products AS p ON p.productID = pv.productID WHERE p.category = ?''', (category,))
+        await cursor.execute('DELETE FROM Products WHERE category = ?', (category,))
+        await cursor.execute('DELETE FROM ProductGroups WHERE category = ?', (category,))
+    await database.close_pool()
+
+
+async def main(rows: int, parse_only: bool):
+    category = f"bench-import-{int(time.time())}"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalogue.csv")
+        if parse_only:
+            for size in (rows // 10, rows):
+                write_catalogue(path, size, category)
+                report, elapsed, peak = parse(path)
+                print(f"{size} rows ({os.path.getsize(path) / 1e6:.1f} MB), parse only")
+                print(f"  throughput: {size / elapsed:8.0f} rows/s")
+                print(f"  peak heap : {peak / 1e6:8.2f} MB")
+            return
+
+        write_catalogue(path, rows, category)
+        try:
+            result, elapsed = await import_file(path)
+        finally:
+            await delete_category(category)
+    print(f"{rows} rows, {result['productsCreated']} products, {result['variantsCreated']} variants, "
+          f"{result['errorCount']} errors")
+    print(f"  elapsed   : {elapsed:8.1f} s")
+    print(f"  throughput: {rows / elapsed:8.0f} rows/s")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--parse-only"]
+    asyncio.run(main(int(args[0]) if args else DEFAULT_ROWS, "--parse-only" in sys.argv))
@@ -0,0 +1,95 @@
+# Benchmark: memory held by the catalogue replica per 100k products, and the
+# time of the reads it serves (product listing, one category, one product
+# group's sizes, one product).
+#
+#   cd API && python benchmarks/bench_catalogue_replica.py [products]
+#
+# The replica is filled with synthetic products (no database needed): 4
+# categories, 8 sizes per product group, a handful of colours, names and
+# descriptions of realistic length. Memory is reported twice: tracemalloc around
+# the fill counts the records and indexes the replica adds on top of the column
+# values the driver hands over; the replica's own estimate (as served by
+# /metrics/catalogue-replica) also counts the values it keeps alive. Reads are
+# timed with the listings rebuilt on every call, as right after a change.
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalogue_replica
+
+DEFAULT_PRODUCTS = 100_000
+SIZES_PER_GROUP = 8
+CATEGORIES = ("Women", "men", "girls", "boys")
+COLORS = ("Black", "Brown", "Tan", "White", "Burgundy")
+RUNS = 20
+
+
+def synthetic_row(product_id: int):
+    group_id = (product_id - 1) // SIZES_PER_GROUP + 1
+    return (
+        product_id,
+        f"Leather Shoe {group_id:06d}",
+        f"Hand-stitched full-grain leather shoe, model {group_id}, with a cushioned insole and rubber sole",
+        str(36 + (product_id - 1) % SIZES_PER_GROUP),
+        COLORS[group_id % len(COLORS)],
+        CATEGORIES[group_id % len(CATEGORIES)],
+        round(random.uniform(40, 250), 2),
+        f"images_upload\\{group_id:016d}.png",
+        random.randint(0, 60),
+        5,
+        100,
+        group_id,
+        random.randint(0, 60),
+    )
+
+
+def time_read(replica, read):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        replica._listings.clear()
+        read()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main(products: int):
+    random.seed(1)
+    # the synthetic rows are built outside the measurement, as the driver would hand them over
+    rows = [synthetic_row(product_id) for product_id in range(1, products + 1)]
+    replica = catalogue_replica.CatalogueReplica()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for row in rows:
+        replica._put(catalogue_replica.ProductRecord(row))
+    replica.loaded = True
+    traced = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del rows
+
+    stats = replica.stats()
+    print(f"{products:,} products")
+    print(f"  tracemalloc:        {traced / 2**20:8.1f} MiB  ({traced * 100_000 / products / 2**20:.1f} MiB per 100k products)")
+    print(f"  replica estimate:   {stats['bytes'] / 2**20:8.1f} MiB  "
+          f"({stats['bytesPer100kProducts'] / 2**20:.1f} MiB per 100k products)")
+
+    group_ids = [products // SIZES_PER_GROUP // 2]
+    reads = {
+        "product listing": replica.listing,
+        "one category": lambda: replica.category_listing("Women"),
+        "one group's sizes": lambda: [(r.size, r.currentStock) for r in replica.group_products(group_ids)],
+        "one product": lambda: replica.product(products // 2),
+    }
+    print(f"{'read':<20} {'median ms':>10}")
+    for name, read in reads.items():
+        print(f"{name:<20} {time_read(replica, read) * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PRODUCTS)
@@ -0,0 +1,81 @@
+# Benchmark: decoding IMS order payloads, dict + strptime vs the strict ims_schemas models.
+#
+#   cd API && python benchmarks/bench_ims_decoding.py [orders] [lines]
+#
+# Needs no database: payloads are synthetic JSON bodies shaped like IMS order pushes.
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ims_schemas
+
+DEFAULT_ORDERS = 1000
+DEFAULT_LINES = 50
+
+
+def make_bodies(orders: int, lines: int):
+    return [
+        json.dumps({
+            "customerID": order + 1,
+            "orderDate": "2024-11-05 09:30:00.125",
+            "products": [
+                {"productID": line + 1, "quantity": line % 5 + 1,
+                 **({"expectedDate": "2024-11-12"} if line % 2 else {})}
+                for line in range(lines)
+            ],
+        }).encode("utf-8")
+        for order in range(orders)
+    ]
+
+
+# The date parsing receive_order used to do per field
+def parse_datetime(date_str):
+    if isinstance(date_str, str):
+        try:
+            return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            try:
+                return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S.%f')
+            except ValueError:
+                return datetime.strptime(date_str, '%Y-%m-%d')
+    return date_str
+
+
+def legacy_decode(body: bytes):
+    order = json.loads(body)
+    customer_id = order.get('customerID')
+    order_date = parse_datetime(order.get('orderDate', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')))
+    rows = []
+    for product in order.get('products', []):
+        expected_date = parse_datetime(product.get('expectedDate', (datetime.utcnow() + timedelta(days=7))))
+        rows.append((product.get('quantity'), expected_date, product.get('productID')))
+    return customer_id, order_date, rows
+
+
+def schema_decode(body: bytes):
+    order = ims_schemas.IMSOrder.model_validate_json(body)
+    default_expected_date = datetime.utcnow() + timedelta(days=7)
+    rows = [(line.quantity, line.expectedDate or default_expected_date, line.productID) for line in order.products]
+    return order.customerID, order.orderDate, rows
+
+
+def timed(decode, bodies) -> float:
+    started = time.perf_counter()
+    for body in bodies:
+        decode(body)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ORDERS
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LINES
+    bodies = make_bodies(orders, lines)
+    legacy = timed(legacy_decode, bodies)
+    schema = timed(schema_decode, bodies)
+    print(f"{orders} orders x {lines} lines")
+    print(f"  dict + strptime : {legacy * 1000:8.1f} ms")
+    print(f"  strict schema   : {schema * 1000:8.1f} ms")
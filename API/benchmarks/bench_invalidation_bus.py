@@ -0,0 +1,139 @@
+# Benchmark and consistency check: caches in 4 worker processes kept in step by
+# the invalidation bus (invalidation.py).
+#
+#   cd API && python benchmarks/bench_invalidation_bus.py [workers] [operations per worker]
+#
+# The "database" is an array of row versions in shared memory. Every worker
+# caches the rows it reads, the way the barcode index and the product-group
+# cache do (a read that overlapped a change is answered but not cached), and
+# writes random rows, publishing each write. Once every worker has finished,
+# each compares its cache with the array: with the bus no cached row may be
+# stale. The same run without the bus shows what it prevents. Then worker 0
+# publishes pings to measure how long a change takes to reach the others.
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import invalidation
+
+DEFAULT_WORKERS = 4
+DEFAULT_OPERATIONS = 20_000
+ROWS = 1_000
+WRITE_RATIO = 0.1
+PINGS = 200
+PING_INTERVAL_SECONDS = 0.005
+# Time left for the last messages to arrive before the caches are checked
+SETTLE_SECONDS = 0.5
+
+
+async def run_worker(number, directory, use_bus, operations, versions, lock, barrier, results):
+    loop = asyncio.get_running_loop()
+    cache = {}
+    latencies = []
+
+    def drop(keys):
+        for key in keys:
+            cache.pop(key, None)
+
+    invalidation.subscribe("BenchRows", drop, own_writes=False)
+    invalidation.subscribe("BenchPing", lambda keys: latencies.extend(time.time() - sent for sent in keys),
+                           own_writes=False)
+    if use_bus:
+        await invalidation.start_bus(directory)
+    # every worker has bound its socket before anyone writes
+    await loop.run_in_executor(None, barrier.wait)
+
+    rng = random.Random(number)
+    for operation in range(operations):
+        key = rng.randrange(ROWS)
+        if rng.random() < WRITE_RATIO:
+            with lock:
+                versions[key] += 1
+            cache.pop(key, None)
+            invalidation.publish("BenchRows", [key])
+        elif key not in cache:
+            seen = invalidation.version("BenchRows")
+            value = versions[key]
+            # the database round-trip, during which changes can arrive
+            await asyncio.sleep(0)
+            if invalidation.version("BenchRows") == seen:
+                cache[key] = value
+        if operation % 50 == 0:
+            await asyncio.sleep(0)
+
+    await loop.run_in_executor(None, barrier.wait)
+    await asyncio.sleep(SETTLE_SECONDS)
+    cached = len(cache)
+    stale = sum(1 for key, value in cache.items() if versions[key] != value)
+
+    if use_bus:
+        await loop.run_in_executor(None, barrier.wait)
+        if number == 0:
+            for _ in range(PINGS):
+                invalidation.publish("BenchPing", [time.time()])
+                await asyncio.sleep(PING_INTERVAL_SECONDS)
+        await loop.run_in_executor(None, barrier.wait)
+        await asyncio.sleep(SETTLE_SECONDS)
+        await invalidation.stop_bus()
+    results.put((number, cached, stale, latencies))
+
+
+def worker(*args):
+    asyncio.run(run_worker(*args))
+
+
+def run(workers: int, operations: int, use_bus: bool):
+    context = multiprocessing.get_context("spawn")
+    versions = context.Array("q", ROWS, lock=False)
+    lock = context.Lock()
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    directory = tempfile.mkdtemp(prefix="bench-invalidation-bus-")
+    processes = [
+        context.Process(target=worker, args=(number, directory, use_bus, operations, versions, lock, barrier, results))
+        for number in range(workers)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        outcomes = sorted(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return outcomes
+
+
+def main(workers: int, operations: int):
+    print(f"{workers} workers, {operations:,} operations each over {ROWS:,} rows, {WRITE_RATIO:.0%} writes")
+    print(f"{'mode':<10} {'worker':>6} {'cached rows':>12} {'stale rows':>11}")
+    consistent = True
+    latencies = []
+    for use_bus in (False, True):
+        outcomes = run(workers, operations, use_bus)
+        for number, cached, stale, worker_latencies in outcomes:
+            print(f"{'bus' if use_bus else 'no bus':<10} {number:>6} {cached:>12,} {stale:>11,}")
+            if use_bus:
+                consistent = consistent and stale == 0
+                latencies.extend(worker_latencies)
+    print(f"consistent with the bus: {consistent}")
+    if latencies:
+        latencies.sort()
+        print(f"ping delivery over {len(latencies)} messages: "
+              f"median {statistics.median(latencies) * 1000:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+    return consistent
+
+
+if __name__ == "__main__":
+    ok = main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_WORKERS,
+              int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_OPERATIONS)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,105 @@
+# Benchmark: 200 concurrent IMS order intakes, the old statement-by-statement path vs dbo.usp_IntakeOrder.
+#
+#   cd API && python migrate.py && python benchmarks/bench_order_intake.py [concurrency]
+#
+# Both paths insert real orders for an existing product, vendor and customer;
+# the benchmark deletes them afterwards. Explicit orderIDs advance the
+# purchaseOrders identity, so run it against a scratch copy of the database.
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import product_groups
+from routers.orderdetails import INTAKE_ORDER_SQL
+
+DEFAULT_CONCURRENCY = 200
+
+
+# What display_order used to do: one connection, eight statements, a commit after most of them
+async def legacy_intake(order_id: int, sample):
+    product, vendor_id, customer_id = sample
+    conn = await database.get_db_connection()
+    try:
+        cursor = await conn.cursor()
+        await cursor.execute('''SELECT productID FROM Products
+            WHERE productName = ? AND productDescription = ? AND size = ? AND color = ? AND category = ?''', product)
+        product_id = (await cursor.fetchone())[0]
+        await cursor.execute('SELECT customerID FROM Customers WHERE customerID = ?', (customer_id,))
+        await cursor.fetchone()
+        await cursor.execute('SET IDENTITY_INSERT purchaseOrders ON')
+        await cursor.execute('''INSERT INTO purchaseOrders (orderID, vendorID, customerID, orderDate, orderStatus, statusDate)
+            VALUES (?, ?, ?, ?, 'Pending', ?)''', (order_id, vendor_id, customer_id, '2024-11-05', datetime.utcnow()))
+        await cursor.execute('SET IDENTITY_INSERT purchaseOrders OFF')
+        await conn.commit()
+        await cursor.execute('''INSERT INTO purchaseOrderDetails (orderID, productID, orderQuantity, expectedDate, orderMonth)
+            VALUES (?, ?, 1, ?, ?)''', (order_id, product_id, '2024-11-12', '2024-11-01'))
+        await conn.commit()
+        await cursor.execute('SELECT VendorName, isActive FROM Vendors WHERE VendorID = ?', (vendor_id,))
+        await cursor.fetchone()
+        await cursor.close()
+    finally:
+        await conn.close()
+
+
+async def procedure_intake(order_id: int, sample):
+    product, vendor_id, customer_id = sample
+    name, description, size, color, category = product
+    group_ids = await product_groups.resolve_group_ids(None, name, category, description)
+    params = (order_id, vendor_id, customer_id, None, None, None, group_ids[0], size, color, 1,
+              '2024-11-05', '2024-11-12', datetime.utcnow())
+
+    async def save_order(cursor):
+        await cursor.execute(INTAKE_ORDER_SQL, params)
+        return await cursor.fetchone()
+
+    await database.run_in_transaction(save_order)
+
+
+async def load_sample():
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('''SELECT TOP 1 productName, productDescription, size, color, category
+            FROM Products WHERE isActive = 1''')
+        product = tuple(await cursor.fetchone())
+        await cursor.execute('SELECT TOP 1 VendorID FROM Vendors WHERE isActive = 1')
+        vendor_id = (await cursor.fetchone())[0]
+        await cursor.execute('SELECT TOP 1 customerID FROM Customers')
+        customer_id = (await cursor.fetchone())[0]
+        await cursor.execute('SELECT ISNULL(MAX(orderID), 0) FROM purchaseOrders')
+        next_order_id = (await cursor.fetchone())[0] + 1
+    return (product, vendor_id, customer_id), next_order_id
+
+
+async def delete_orders(order_ids):
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('DELETE FROM purchaseOrderDetails WHERE orderID BETWEEN ? AND ?', (min(order_ids), max(order_ids)))
+        await cursor.execute('DELETE FROM purchaseOrders WHERE orderID BETWEEN ? AND ?', (min(order_ids), max(order_ids)))
+
+
+async def run(intake, order_ids, sample) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(intake(order_id, sample) for order_id in order_ids))
+    return time.perf_counter() - started
+
+
+async def main(concurrency: int):
+    sample, next_order_id = await load_sample()
+    legacy_ids = range(next_order_id, next_order_id + concurrency)
+    procedure_ids = range(next_order_id + concurrency, next_order_id + 2 * concurrency)
+    try:
+        legacy = await run(legacy_intake, legacy_ids, sample)
+        procedure = await run(procedure_intake, procedure_ids, sample)
+    finally:
+        await delete_orders(range(next_order_id, next_order_id + 2 * concurrency))
+        await database.close_pool()
+    print(f"{concurrency} concurrent intakes")
+    print(f"  statement by statement: {legacy * 1000:8.1f} ms")
+    print(f"  usp_IntakeOrder       : {procedure * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CONCURRENCY))
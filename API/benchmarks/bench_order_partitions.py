@@ -0,0 +1,195 @@
+# Benchmark: the 30-day dashboard queries over 10M order lines, on the order
+# tables as they were before migration 011 (clustered on orderID, the date
+# filter scans every order) and partitioned by month (the orderMonth filter
+# reads the last one or two partitions).
+#
+#   cd API && python benchmarks/bench_order_partitions.py [order lines] [months of history]
+#
+# Both layouts are built in scratch Bench* tables (two lines per order, spread
+# evenly over the history) that are dropped again when the run ends.
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+DEFAULT_LINES = 10_000_000
+DEFAULT_MONTHS = 60
+LINES_PER_ORDER = 2
+# Orders generated per INSERT
+FILL_CHUNK = 500_000
+RUNS = 5
+
+SETUP_SQL = [
+    '''CREATE TABLE BenchOrdersFlat (
+        orderID INT NOT NULL PRIMARY KEY CLUSTERED,
+        orderDate DATETIME NOT NULL,
+        orderStatus NVARCHAR(50) NOT NULL)''',
+    '''CREATE TABLE BenchOrderLinesFlat (
+        orderID INT NOT NULL,
+        lineNo TINYINT NOT NULL,
+        orderQuantity INT NOT NULL,
+        lineTotal DECIMAL(18, 2) NOT NULL,
+        CONSTRAINT PK_BenchOrderLinesFlat PRIMARY KEY CLUSTERED (orderID, lineNo))''',
+    '''CREATE TABLE BenchOrders (
+        orderID INT NOT NULL,
+        orderDate DATETIME NOT NULL,
+        orderStatus NVARCHAR(50) NOT NULL,
+        orderMonth AS (DATEFROMPARTS(YEAR(orderDate), MONTH(orderDate), 1)) PERSISTED NOT NULL,
+        CONSTRAINT PK_BenchOrders PRIMARY KEY CLUSTERED (orderMonth, orderID) ON PS_BenchOrderMonth (orderMonth))''',
+    '''CREATE INDEX IX_BenchOrders_orderDate ON BenchOrders (orderMonth, orderDate)
+        INCLUDE (orderStatus) ON PS_BenchOrderMonth (orderMonth)''',
+    '''CREATE TABLE BenchOrderLines (
+        orderMonth DATE NOT NULL,
+        orderID INT NOT NULL,
+        lineNo TINYINT NOT NULL,
+        orderQuantity INT NOT NULL,
+        lineTotal DECIMAL(18, 2) NOT NULL,
+        CONSTRAINT PK_BenchOrderLines PRIMARY KEY CLUSTERED (orderMonth, orderID, lineNo)
+            ON PS_BenchOrderMonth (orderMonth))''',
+]
+
+TEARDOWN_SQL = [
+    "IF OBJECT_ID('BenchOrderLines') IS NOT NULL DROP TABLE BenchOrderLines",
+    "IF OBJECT_ID('BenchOrders') IS NOT NULL DROP TABLE BenchOrders",
+    "IF OBJECT_ID('BenchOrderLinesFlat') IS NOT NULL DROP TABLE BenchOrderLinesFlat",
+    "IF OBJECT_ID('BenchOrdersFlat') IS NOT NULL DROP TABLE BenchOrdersFlat",
+    "IF EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = 'PS_BenchOrderMonth') DROP PARTITION SCHEME PS_BenchOrderMonth",
+    "IF EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'PF_BenchOrderMonth') DROP PARTITION FUNCTION PF_BenchOrderMonth",
+]
+
+# Orders @first..@last, the newest first: order i is placed i * @spacing minutes ago
+FILL_SQL = '''
+SET NOCOUNT ON;
+DECLARE @first INT = ?, @last INT = ?, @spacing FLOAT = ?;
+DECLARE @now DATETIME = GETDATE();
+WITH numbers AS (
+    SELECT TOP (@last - @first + 1) @first - 1 + ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS i
+    FROM sys.all_columns AS a CROSS JOIN sys.all_columns AS b CROSS JOIN sys.all_columns AS c
+)
+INSERT INTO BenchOrdersFlat (orderID, orderDate, orderStatus)
+SELECT i, DATEADD(MINUTE, -CAST(i * @spacing AS INT), @now),
+       CASE i % 10 WHEN 0 THEN 'Pending' WHEN 1 THEN 'Delivered' ELSE 'Received' END
+FROM numbers;
+
+INSERT INTO BenchOrderLinesFlat (orderID, lineNo, orderQuantity, lineTotal)
+SELECT o.orderID, l.lineNo, 1 + o.orderID % 5, (1 + o.orderID % 5) * 49.95
+FROM BenchOrdersFlat AS o
+CROSS JOIN (SELECT TOP ({lines_per_order}) CAST(ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS TINYINT) AS lineNo
+            FROM sys.all_columns) AS l
+WHERE o.orderID BETWEEN @first AND @last;
+
+INSERT INTO BenchOrders (orderID, orderDate, orderStatus)
+SELECT orderID, orderDate, orderStatus FROM BenchOrdersFlat WHERE orderID BETWEEN @first AND @last;
+
+INSERT INTO BenchOrderLines (orderMonth, orderID, lineNo, orderQuantity, lineTotal)
+SELECT DATEFROMPARTS(YEAR(o.orderDate), MONTH(o.orderDate), 1), l.orderID, l.lineNo, l.orderQuantity, l.lineTotal
+FROM BenchOrderLinesFlat AS l
+JOIN BenchOrdersFlat AS o ON o.orderID = l.orderID
+WHERE l.orderID BETWEEN @first AND @last;
+'''
+
+# Dashboard query -> (as before migration 011, partition-eliminating form)
+QUERIES = {
+    "orders last 30 days": (
+        '''SELECT COUNT(*) FROM BenchOrdersFlat
+           WHERE orderDate >= DATEADD(DAY, -30, GETDATE()) AND orderStatus IS NOT NULL''',
+        '''DECLARE @since DATETIME = DATEADD(DAY, -30, GETDATE());
+           SELECT COUNT(*) FROM BenchOrders
+           WHERE orderMonth >= DATEFROMPARTS(YEAR(@since), MONTH(@since), 1)
+             AND orderDate >= @since AND orderStatus IS NOT NULL''',
+    ),
+    "delivered last 30 days": (
+        '''SELECT COUNT(*) FROM BenchOrdersFlat
+           WHERE orderDate >= DATEADD(DAY, -30, GETDATE()) AND orderStatus = 'Delivered' ''',
+        '''DECLARE @since DATETIME = DATEADD(DAY, -30, GETDATE());
+           SELECT COUNT(*) FROM BenchOrders
+           WHERE orderMonth >= DATEFROMPARTS(YEAR(@since), MONTH(@since), 1)
+             AND orderDate >= @since AND orderStatus = 'Delivered' ''',
+    ),
+    "revenue last 30 days": (
+        '''SELECT SUM(l.lineTotal) FROM BenchOrderLinesFlat AS l
+           JOIN BenchOrdersFlat AS o ON o.orderID = l.orderID
+           WHERE o.orderStatus = 'Received' AND o.orderDate >= DATEADD(DAY, -30, GETDATE())''',
+        '''DECLARE @since DATETIME = DATEADD(DAY, -30, GETDATE());
+           DECLARE @sinceMonth DATE = DATEFROMPARTS(YEAR(@since), MONTH(@since), 1);
+           SELECT SUM(l.lineTotal) FROM BenchOrderLines AS l
+           JOIN BenchOrders AS o ON o.orderMonth = l.orderMonth AND o.orderID = l.orderID
+           WHERE o.orderStatus = 'Received' AND o.orderMonth >= @sinceMonth AND l.orderMonth >= @sinceMonth
+             AND o.orderDate >= @since''',
+    ),
+}
+
+
+async def create_partition_function(cursor, months: int):
+    await cursor.execute('''
+        DECLARE @current DATE = DATEFROMPARTS(YEAR(GETDATE()), MONTH(GETDATE()), 1);
+        DECLARE @month DATE = DATEADD(MONTH, -?, @current), @boundaries NVARCHAR(MAX) = N'';
+        WHILE @month <= DATEADD(MONTH, 3, @current)
+        BEGIN
+            SET @boundaries += CASE WHEN @boundaries = N'' THEN N'' ELSE N', ' END
+                + N'''' + CONVERT(NCHAR(8), @month, 112) + N'''';
+            SET @month = DATEADD(MONTH, 1, @month);
+        END
+        EXEC (N'CREATE PARTITION FUNCTION PF_BenchOrderMonth (DATE) AS RANGE RIGHT FOR VALUES (' + @boundaries + N')');
+        ''', (months,))
+    await cursor.execute('CREATE PARTITION SCHEME PS_BenchOrderMonth AS PARTITION PF_BenchOrderMonth ALL TO ([PRIMARY])')
+
+
+async def fill(conn, cursor, lines: int, months: int):
+    orders = lines // LINES_PER_ORDER
+    spacing = months * 30 * 24 * 60 / orders
+    fill_sql = FILL_SQL.format(lines_per_order=LINES_PER_ORDER)
+    for first in range(1, orders + 1, FILL_CHUNK):
+        last = min(first + FILL_CHUNK - 1, orders)
+        await cursor.execute(fill_sql, (first, last, spacing))
+        await conn.commit()
+        print(f"  {last * LINES_PER_ORDER:,} / {orders * LINES_PER_ORDER:,} lines")
+
+
+async def time_query(cursor, query: str):
+    timings, result = [], None
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        await cursor.execute(query)
+        result = (await cursor.fetchone())[0]
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+async def main(lines: int, months: int):
+    conn = await database.get_db_connection()
+    cursor = await conn.cursor()
+    try:
+        for statement in TEARDOWN_SQL:
+            await cursor.execute(statement)
+        await create_partition_function(cursor, months)
+        for statement in SETUP_SQL:
+            await cursor.execute(statement)
+        await conn.commit()
+        print(f"Filling {lines:,} order lines over {months} months")
+        await fill(conn, cursor, lines, months)
+        await cursor.execute('UPDATE STATISTICS BenchOrdersFlat; UPDATE STATISTICS BenchOrders')
+        await conn.commit()
+
+        print(f"{'query':<24} {'flat ms':>10} {'partitioned ms':>16} {'same result':>12}")
+        for name, (flat_query, partitioned_query) in QUERIES.items():
+            flat, flat_result = await time_query(cursor, flat_query)
+            partitioned, partitioned_result = await time_query(cursor, partitioned_query)
+            print(f"{name:<24} {flat * 1000:>10.1f} {partitioned * 1000:>16.1f} "
+                  f"{str(flat_result == partitioned_result):>12}")
+    finally:
+        for statement in TEARDOWN_SQL:
+            await cursor.execute(statement)
+        await conn.commit()
+        await cursor.close()
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MONTHS))
@@ -0,0 +1,97 @@
+# Benchmark: confirm + deliver latency for large orders, legacy scans vs reservations.
+#
+#   cd API && python benchmarks/bench_order_reservation.py [quantity ...]
+#
+# Every run happens inside a transaction that is rolled back, so the scratch
+# product, variants and order never become visible to the application.
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import reservations
+from routers.products import generate_barcode, generate_sku
+
+DEFAULT_QUANTITIES = [100, 1000, 10000]
+
+
+async def create_scratch_order(cursor, quantity: int) -> int:
+    await cursor.execute('''
+        INSERT INTO Products (productName, productDescription, size, category, unitPrice, image_path, currentStock, isActive)
+        OUTPUT inserted.productID
+        VALUES ('bench-product', 'bench', '42', 'bench', 1.0, 'placeholder.png', ?, 1)''', (quantity,))
+    product_id = (await cursor.fetchone())[0]
+    await cursor.executemany(
+        'INSERT INTO ProductVariants (barcode, productCode, productID) VALUES (?, ?, ?)',
+        [(generate_barcode(), generate_sku(), product_id) for _ in range(quantity)])
+    await cursor.execute('SELECT TOP 1 customerID FROM Customers')
+    customer_id = (await cursor.fetchone())[0]
+    await cursor.execute('''
+        INSERT INTO purchaseOrders (orderDate, orderStatus, statusDate, customerID)
+        OUTPUT inserted.orderID, inserted.orderMonth
+        VALUES (GETUTCDATE(), 'To Ship', GETUTCDATE(), ?)''', (customer_id,))
+    order_id, order_month = await cursor.fetchone()
+    await cursor.execute('''
+        INSERT INTO purchaseOrderDetails (orderQuantity, expectedDate, productID, orderID, orderMonth)
+        VALUES (?, GETUTCDATE(), ?, ?, ?)''', (quantity, product_id, order_id, order_month))
+    return order_id
+
+
+async def legacy_confirm_and_deliver(cursor, order_id: int):
+    # confirm: availability scan whose result is thrown away
+    await cursor.execute('SELECT productID, orderQuantity FROM purchaseOrderDetails WHERE orderID = ?', (order_id,))
+    products = await cursor.fetchall()
+    for product_id, quantity in products:
+        await cursor.execute('''SELECT TOP (?) pv.barcode, pv.productCode, p.productName, p.category, p.size
+            FROM productVariants pv JOIN Products p ON pv.productID = p.productID
+            WHERE pv.productID = ? AND pv.isAvailable = 1 ORDER BY pv.variantID''', (quantity, product_id))
+        await cursor.fetchall()
+    # deliver: scan again, re-check stock and flip variants one barcode at a time
+    barcodes = []
+    for product_id, quantity in products:
+        await cursor.execute('''SELECT TOP (?) pv.barcode FROM productVariants pv
+            WHERE pv.productID = ? AND pv.isAvailable = 1 ORDER BY pv.variantID''', (quantity, product_id))
+        barcodes.extend(row[0] for row in await cursor.fetchall())
+        await cursor.execute('SELECT currentStock FROM Products WHERE productID = ?', (product_id,))
+        stock = (await cursor.fetchone())[0]
+        await cursor.execute('UPDATE Products SET currentStock = ? WHERE productID = ?', (stock - quantity, product_id))
+    await cursor.executemany('UPDATE productVariants SET isAvailable = 0 WHERE barcode = ?', [(b,) for b in barcodes])
+    await cursor.execute("UPDATE purchaseOrders SET orderStatus = 'Delivered' WHERE orderID = ?", (order_id,))
+
+
+async def reserved_confirm_and_deliver(cursor, order_id: int):
+    await reservations.reserve_order(cursor, order_id)
+    variants = await reservations.get_reserved_variants(cursor, order_id)
+    await reservations.claim_order(cursor, order_id, [variant["barcode"] for variant in variants])
+
+
+async def time_path(conn, quantity: int, path) -> float:
+    cursor = await conn.cursor()
+    try:
+        await cursor.execute('BEGIN TRANSACTION')
+        order_id = await create_scratch_order(cursor, quantity)
+        started = time.perf_counter()
+        await path(cursor, order_id)
+        return time.perf_counter() - started
+    finally:
+        await cursor.execute('IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION')
+        await cursor.close()
+
+
+async def main(quantities):
+    conn = await database.get_db_connection()
+    try:
+        print(f"{'quantity':>10} {'legacy ms':>12} {'reserved ms':>12}")
+        for quantity in quantities:
+            legacy = await time_path(conn, quantity, legacy_confirm_and_deliver)
+            reserved = await time_path(conn, quantity, reserved_confirm_and_deliver)
+            print(f"{quantity:>10} {legacy * 1000:>12.1f} {reserved * 1000:>12.1f}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or DEFAULT_QUANTITIES))
@@ -0,0 +1,64 @@
+# Benchmark: 500 concurrent product point lookups, one query each vs the batching loader.
+#
+#   cd API && python benchmarks/bench_point_lookups.py [concurrency]
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import loaders
+
+DEFAULT_CONCURRENCY = 500
+
+
+async def single_lookup(product_id: int):
+    conn = await database.get_db_connection()
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute('''select p.productName, p.productDescription, p.size, p.color, p.unitPrice,
+                p.minStockLevel, p.maxStockLevel, count(pv.variantID) as 'available quantity'
+                from products as p left join ProductVariants as pv on p.productID = pv.productID
+                where p.isActive = 1 and pv.isAvailable = 1 and p.productID = ?
+                group by p.productName, p.productDescription, p.size, p.color, p.unitPrice,
+                p.minStockLevel, p.maxStockLevel''', product_id)
+            return await cursor.fetchone()
+    finally:
+        await conn.close()
+
+
+async def batched_lookup(product_id: int):
+    return await loaders.product_loader.load(product_id)
+
+
+async def run(lookup, product_ids) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(lookup(product_id) for product_id in product_ids))
+    return time.perf_counter() - started
+
+
+async def main(concurrency: int):
+    conn = await database.get_db_connection()
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute('SELECT productID FROM Products WHERE isActive = 1')
+            known_ids = [row[0] for row in await cursor.fetchall()]
+    finally:
+        await conn.close()
+    if not known_ids:
+        print("No active products to look up.")
+        return
+
+    product_ids = [random.choice(known_ids) for _ in range(concurrency)]
+    single = await run(single_lookup, product_ids)
+    batched = await run(batched_lookup, product_ids)
+    print(f"{concurrency} concurrent lookups")
+    print(f"  one query each : {single * 1000:.1f} ms")
+    print(f"  batching loader: {batched * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CONCURRENCY))
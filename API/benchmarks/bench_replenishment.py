@@ -0,0 +1,89 @@
+# Benchmark: replenishment forecasting over 5 years x 50k SKUs.
+#
+#   cd API && python benchmarks/bench_replenishment.py [skus] [weeks]
+#
+# Needs no database: synthetic (productID, weeksAgo, quantity) history rows with
+# a yearly season are fed to forecasting.Forecast, the same path the streamed
+# history query takes. Times the build and vectorized fit, planning the whole
+# catalogue, refitting after a burst of new orders, and a per-product Python
+# loop over a sample of SKUs for comparison.
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forecasting
+
+DEFAULT_SKUS = 50_000
+DEFAULT_WEEKS = forecasting.HISTORY_WEEKS
+# Chance that a SKU is ordered in a given week
+ORDER_RATE = 0.3
+LOOP_SAMPLE = 1000
+
+
+def synthetic_history(skus: int, weeks: int, rng):
+    base = rng.gamma(2.0, 3.0, skus)
+    season = 1 + 0.4 * np.sin(2 * np.pi * np.arange(weeks) / 52)
+    ordered = rng.random((skus, weeks)) < ORDER_RATE
+    product_row, week = np.nonzero(ordered)
+    quantity = rng.poisson(base[product_row] * season[week] / ORDER_RATE) + 1
+    return product_row + 1, weeks - 1 - week, quantity.astype(np.float64)
+
+
+def python_loop(history, as_of, skus):
+    # what a per-product implementation does: one EWMA per SKU over its own weeks
+    product_col, weeks_ago, quantity = history
+    sample = product_col <= skus
+    series = {}
+    for product_id, ago, ordered in zip(product_col[sample].tolist(), weeks_ago[sample].tolist(),
+                                        quantity[sample].tolist()):
+        series.setdefault(product_id, {})[ago] = ordered
+    levels = {}
+    for product_id, weeks in series.items():
+        level = None
+        for ago in range(max(weeks), -1, -1):
+            value = weeks.get(ago, 0.0)
+            level = value if level is None else forecasting.ALPHA * value + (1 - forecasting.ALPHA) * level
+        levels[product_id] = level
+    return levels
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main(skus: int, weeks: int):
+    rng = np.random.default_rng(7)
+    as_of = datetime.utcnow().date()
+    history = synthetic_history(skus, weeks, rng)
+    print(f"{skus} SKUs x {weeks} weeks, {len(history[0])} history rows")
+
+    forecast, build = timed(forecasting.Forecast.from_rows, as_of, history, weeks)
+    print(f"  build + fit      : {build * 1000:8.1f} ms  (demand matrix {forecast.demand.nbytes / 1e6:.0f} MB)")
+
+    product_ids = np.arange(1, skus + 1)
+    available = rng.integers(0, 50, skus).astype(np.float32)
+    no_level = np.full(skus, np.nan, dtype=np.float32)
+    (_, _, suggested), plan = timed(forecast.plan, product_ids, available, no_level, no_level, 2, 4, 1.645)
+    print(f"  plan catalogue   : {plan * 1000:8.1f} ms  ({int((suggested > 0).sum())} SKUs to reorder)")
+
+    for product_id in rng.integers(1, skus + 1, 1000):
+        forecast.record(product_id, as_of - timedelta(days=int(rng.integers(0, 14))), 3)
+    _, refit = timed(forecast.refit_dirty)
+    print(f"  refit 1000 orders: {refit * 1000:8.1f} ms")
+
+    sample = min(LOOP_SAMPLE, skus)
+    _, loop = timed(python_loop, history, as_of, sample)
+    print(f"  python loop      : {loop * 1000:8.1f} ms for {sample} SKUs "
+          f"(~{loop * skus / sample:.1f} s for the catalogue)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SKUS,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WEEKS)
@@ -0,0 +1,58 @@
+# Benchmark: serialization time per 10k order summary rows, FastAPI default path vs row mapper + orjson.
+#
+#   cd API && python benchmarks/bench_serialization.py [rows]
+#
+# Needs no database: the rows are synthetic tuples shaped like ORDER_SUMMARY_QUERY results.
+import decimal
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+import serialization
+from routers.orders import OrderSummary, ORDER_SUMMARY_MAPPER
+
+DEFAULT_ROWS = 10_000
+REPEAT = 5
+
+
+def make_rows(count: int):
+    return [
+        (i, f"Leather Shoe {i % 500}", str(36 + i % 10), "Women", i % 20 + 1,
+         decimal.Decimal("1499.00") * (i % 20 + 1), f"Customer {i % 97}",
+         f"{i % 300} Warehouse Street", f"images_upload\\img{i % 500}.png")
+        for i in range(count)
+    ]
+
+
+def default_path(rows) -> bytes:
+    # What the handlers used to do: build a model per row, then FastAPI's jsonable_encoder + json.dumps
+    summaries = [OrderSummary(**dict(zip(OrderSummary.model_fields, row))) for row in rows]
+    return json.dumps(jsonable_encoder(summaries)).encode("utf-8")
+
+
+def fast_path(rows) -> bytes:
+    return serialization.rows_response(rows, ORDER_SUMMARY_MAPPER).body
+
+
+def best_of(func, rows) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func(rows)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    rows = make_rows(count)
+    default = best_of(default_path, rows)
+    fast = best_of(fast_path, rows)
+    per_10k = 10_000 / count
+    print(f"{count} rows, best of {REPEAT}")
+    print(f"  pydantic + jsonable_encoder: {default * 1000 * per_10k:8.1f} ms per 10k rows")
+    print(f"  row mapper + orjson        : {fast * 1000 * per_10k:8.1f} ms per 10k rows")
@@ -0,0 +1,101 @@
+# Benchmark: how long a worker takes to import, to answer /healthz and to be
+# ready (/readyz), with the import-time breakdown of main.py.
+#
+#   cd API && python benchmarks/bench_startup.py [workers]
+#
+# The breakdown comes from `python -X importtime -c "import main"`: the modules
+# main.py imports directly, and the packages that cost the most overall. Then
+# serve.py is started on BENCH_PORT and polled until /healthz and /readyz answer
+# 200; /readyz needs the database, as the warm-up loads the caches from it. The
+# worker's own timings (/metrics/startup) are printed last.
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+API_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_PORT = 8098
+TOP_MODULES = 15
+POLL_SECONDS = 0.05
+READY_TIMEOUT_SECONDS = 120
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_breakdown():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=API_DIRECTORY, capture_output=True, text=True)
+    direct, packages, total = [], {}, 0
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        own, cumulative, indent, name = int(match[1]), int(match[2]), len(match[3]), match[4]
+        packages[name.split(".")[0]] = packages.get(name.split(".")[0], 0) + own
+        if name == "main":
+            total = cumulative
+        elif indent == 3:
+            # imported by main.py itself (main is at indent 1)
+            direct.append((cumulative, name))
+    return total, sorted(direct, reverse=True), sorted(((t, n) for n, t in packages.items()), reverse=True)
+
+
+def wait_for(url: str, server: subprocess.Popen, started: float):
+    while time.perf_counter() - started < READY_TIMEOUT_SECONDS:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {server.returncode}")
+        try:
+            if httpx.get(url, timeout=5).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(POLL_SECONDS)
+    return None
+
+
+def time_to_ready(workers: int):
+    bus_directory = tempfile.mkdtemp(prefix="bench-startup-")
+    env = dict(os.environ, PORT=str(BENCH_PORT), WORKERS=str(workers), INVALIDATION_BUS_DIR=bus_directory)
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "serve.py"], cwd=API_DIRECTORY, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{BENCH_PORT}"
+    try:
+        healthy = wait_for(f"{base}/healthz", server, started)
+        ready = wait_for(f"{base}/readyz", server, started)
+        metrics = httpx.get(f"{base}/metrics/startup", timeout=5).json()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(bus_directory, ignore_errors=True)
+    return healthy, ready, metrics
+
+
+def main(workers: int):
+    total, direct, packages = import_breakdown()
+    print(f"import main: {total / 1000:.0f} ms")
+    print(f"{'imported by main.py':<40} {'ms':>8}")
+    for cumulative, name in direct[:TOP_MODULES]:
+        print(f"{name:<40} {cumulative / 1000:>8.1f}")
+    print(f"{'package (own time)':<40} {'ms':>8}")
+    for own, name in packages[:TOP_MODULES]:
+        print(f"{name:<40} {own / 1000:>8.1f}")
+
+    healthy, ready, metrics = time_to_ready(workers)
+    print(f"serve.py with {workers} worker(s), from launch:")
+    print(f"  /healthz 200 after {healthy:.2f} s")
+    print(f"  /readyz  200 after {ready:.2f} s" if ready is not None
+          else f"  /readyz  not ready after {READY_TIMEOUT_SECONDS} s: {metrics['components']}")
+    for milestone, seconds in metrics["milestones"].items():
+        print(f"  {milestone:<30} {seconds:>7.3f} s after main.py started")
+    for phase, seconds in metrics["phases"].items():
+        print(f"  {phase:<30} {seconds:>7.3f} s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
@@ -0,0 +1,123 @@
+# Benchmark: requests per second of serve.py with 1, 2, 4 and 8 workers.
+#
+#   cd API && python benchmarks/bench_workers.py [path] [seconds per run]
+#
+# For each worker count serve.py is started on BENCH_PORT, warmed up until the
+# path answers, and then driven by LOAD_PROCESSES client processes that each
+# keep CONNECTIONS keep-alive requests in flight. The default path is the
+# product listing, served from the catalogue replica. /api/data measures the
+# server alone, without the database. Give the load generator its own cores,
+# or run it from another machine, or it will share the CPUs it is measuring.
+import asyncio
+import multiprocessing
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+API_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_COUNTS = (1, 2, 4, 8)
+DEFAULT_PATH = "/products/products"
+DEFAULT_SECONDS = 15
+BENCH_PORT = 8099
+LOAD_PROCESSES = 4
+CONNECTIONS = 32
+STARTUP_TIMEOUT_SECONDS = 120
+
+
+async def drive(url: str, seconds: float):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=CONNECTIONS, max_keepalive_connections=CONNECTIONS)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def connection():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(connection() for _ in range(CONNECTIONS)))
+    return latencies, errors
+
+
+def load_process(url: str, seconds: float, results):
+    results.put(asyncio.run(drive(url, seconds)))
+
+
+def wait_until_ready(url: str, server: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {server.returncode}")
+        try:
+            if httpx.get(url, timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not answer within {STARTUP_TIMEOUT_SECONDS} s")
+
+
+def run(workers: int, path: str, seconds: float):
+    bus_directory = tempfile.mkdtemp(prefix="bench-workers-")
+    env = dict(os.environ, PORT=str(BENCH_PORT), WORKERS=str(workers), INVALIDATION_BUS_DIR=bus_directory)
+    server = subprocess.Popen([sys.executable, "serve.py"], cwd=API_DIRECTORY, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{BENCH_PORT}{path}"
+    try:
+        wait_until_ready(url, server)
+        # every worker loads its caches before it is measured
+        asyncio.run(drive(url, 2))
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        clients = [context.Process(target=load_process, args=(url, seconds, results)) for _ in range(LOAD_PROCESSES)]
+        for client in clients:
+            client.start()
+        latencies, errors = [], 0
+        for _ in clients:
+            client_latencies, client_errors = results.get()
+            latencies.extend(client_latencies)
+            errors += client_errors
+        for client in clients:
+            client.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+        shutil.rmtree(bus_directory, ignore_errors=True)
+    latencies.sort()
+    return {
+        "rps": len(latencies) / seconds,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p99": latencies[int(len(latencies) * 0.99) - 1] if latencies else float("nan"),
+        "errors": errors,
+    }
+
+
+def main(path: str, seconds: float):
+    print(f"GET {path}, {seconds:g} s per run, {LOAD_PROCESSES} x {CONNECTIONS} connections, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'speed-up':>9}")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        result = run(workers, path, seconds)
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>10.0f} {result['p50'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f} "
+              f"{result['errors']:>7} {result['rps'] / baseline if baseline else 0:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH,
+         float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SECONDS)
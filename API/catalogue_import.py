@@ -0,0 +1,158 @@
+import codecs
+import csv
+from itertools import islice
+from typing import Optional
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+import product_groups
+
+# Rows validated, grouped and written per transaction
+IMPORT_CHUNK_ROWS = 500
+# Row errors listed in the report; later ones are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Columns every upload must have (matched case-insensitively)
+REQUIRED_COLUMNS = ("productName", "productDescription", "size", "category", "unitPrice", "quantity")
+
+
+# One catalogue row. The schema is compiled once with the class; CSV cells arrive
+# as text and spreadsheet sizes as numbers, so both are coerced.
+class CatalogueRow(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, coerce_numbers_to_str=True, extra="ignore")
+
+    productName: str = Field(min_length=1, max_length=255)
+    productDescription: str = Field(default="", max_length=4000)
+    size: str = Field(min_length=1, max_length=50)
+    color: Optional[str] = Field(default=None, max_length=50)
+    category: str = Field(min_length=1, max_length=50)
+    unitPrice: float = Field(gt=0)
+    quantity: int = Field(ge=0)
+    image_path: Optional[str] = Field(default=None, max_length=255)
+
+
+_validate_row = CatalogueRow.model_validate
+_FIELDS = {name.lower(): name for name in CatalogueRow.model_fields}
+
+
+# Function to map the header cells of an upload onto CatalogueRow fields
+def _header_fields(header):
+    fields = [_FIELDS.get(str(cell or "").strip().lower()) for cell in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in fields]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+    return fields
+
+
+def _cells_to_row(fields, cells):
+    # blank cells are left out so optional columns fall back to their defaults
+    return {field: value for field, value in zip(fields, cells)
+            if field is not None and value is not None and value != ""}
+
+
+def _iter_csv(file):
+    reader = csv.reader(codecs.getreader("utf-8-sig")(file))
+    header = next(reader, None)
+    if header is None:
+        raise HTTPException(status_code=400, detail="The file is empty")
+    fields = _header_fields(header)
+    while True:
+        # line_num counts physical lines read so far; a record with quoted multi-line
+        # cells is reported at its first line, the one after the previous record
+        line_number = reader.line_num + 1
+        cells = next(reader, None)
+        if cells is None:
+            break
+        if any(cells):
+            yield line_number, _cells_to_row(fields, cells)
+
+
+def _iter_xlsx(file):
+    # openpyxl is only needed for spreadsheet uploads
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise HTTPException(status_code=415, detail="XLSX imports need openpyxl installed; upload a CSV instead")
+    # read-only mode streams the sheet instead of building the whole workbook
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise HTTPException(status_code=400, detail="The file is empty")
+        fields = _header_fields(header)
+        for line_number, cells in enumerate(rows, start=2):
+            if any(cell is not None for cell in cells):
+                yield line_number, _cells_to_row(fields, cells)
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, filename: str):
+    """Yield (line number, raw row) from a CSV or XLSX upload, one row at a time."""
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension == "csv":
+        return _iter_csv(file)
+    if extension == "xlsx":
+        return _iter_xlsx(file)
+    raise HTTPException(status_code=415, detail="Upload a .csv or .xlsx file")
+
+
+# Function to read, validate and group the next chunk of rows (runs in a worker thread)
+def next_chunk(rows, report):
+    """
+    Return the valid rows of the next IMPORT_CHUNK_ROWS lines grouped by product group
+    and size, or None at the end of the file. Invalid lines go into the report.
+    """
+    lines = list(islice(rows, IMPORT_CHUNK_ROWS))
+    if not lines:
+        return None
+    report.lines += len(lines)
+    sizes = {}
+    for line_number, raw in lines:
+        try:
+            row = _validate_row(raw)
+        except ValidationError as e:
+            report.add_error(line_number, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in e.errors()))
+            continue
+        key_hash = product_groups.group_hash(row.productName, row.productDescription, row.category)
+        key = (key_hash, product_groups.normalize(row.size))
+        size = sizes.get(key)
+        if size is None:
+            sizes[key] = {"row": row, "groupHash": key_hash, "quantity": row.quantity, "lines": [line_number]}
+        else:
+            # the same size listed twice: the quantities add up, the first row's details win
+            size["quantity"] += row.quantity
+            size["lines"].append(line_number)
+    return list(sizes.values())
+
+
+# Per-import counters and row error report
+class ImportReport:
+    def __init__(self):
+        self.lines = 0
+        self.imported_rows = 0
+        self.products_created = 0
+        self.sizes_restocked = 0
+        self.variants_created = 0
+        self.jobs = []
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_number: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def as_dict(self):
+        return {
+            "rows": self.lines,
+            "importedRows": self.imported_rows,
+            "productsCreated": self.products_created,
+            "sizesRestocked": self.sizes_restocked,
+            "variantsCreated": self.variants_created,
+            "backgroundJobs": self.jobs,
+            "errorCount": self.error_count,
+            "errors": self.errors,
+            "errorsTruncated": self.error_count > len(self.errors),
+        }
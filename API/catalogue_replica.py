@@ -0,0 +1,258 @@
+# In-process replica of the catalogue for the read endpoints of routers/products.py.
+# One __slots__ record per active product (with its count of available variants)
+# and secondary indexes by category, product group and size. The replica loads
+# in one streamed pass at startup, then follows the change feed (change_feed.py)
+# from its rowversion watermark every REFRESH_SECONDS, or at once when a write
+# publishes an invalidation of Products or ProductVariants. The listings are
+# built once per change rather than once per request. Reads may lag the database
+# by up to one refresh; the endpoints take bypass_replica=true to read the
+# database instead.
+import asyncio
+import json
+import sys
+import change_feed
+import database
+import invalidation
+
+# How often the replica follows the change feed
+REFRESH_SECONDS = 2
+# Rows fetched per round-trip while the replica loads
+LOAD_BATCH_SIZE = 5000
+# Products recounted per query after their variants changed
+RECOUNT_CHUNK_SIZE = 1000
+
+LOAD_SQL = '''
+SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1;
+
+SELECT p.productID, p.productName, p.productDescription, p.size, p.color, p.category, p.unitPrice,
+       p.image_path, p.currentStock, p.minStockLevel, p.maxStockLevel, p.productGroupID,
+       ISNULL(a.available, 0)
+FROM Products AS p
+LEFT JOIN (
+    SELECT productID, COUNT(*) AS available FROM ProductVariants WHERE isAvailable = 1 GROUP BY productID
+) AS a ON a.productID = p.productID
+WHERE p.isActive = 1
+'''
+
+RECOUNT_SQL = '''
+SELECT c.productID,
+       (SELECT COUNT(*) FROM ProductVariants AS pv WHERE pv.productID = c.productID AND pv.isAvailable = 1)
+FROM OPENJSON(?) WITH (productID INT '$') AS c
+'''
+
+
+# Function to give the key SQL Server's case-insensitive, trailing-space-blind equality compares on
+def text_key(value):
+    return value.rstrip().lower() if value else ""
+
+
+class ProductRecord:
+    __slots__ = (
+        "productID", "productName", "productDescription", "size", "color", "category", "unitPrice",
+        "image_path", "currentStock", "minStockLevel", "maxStockLevel", "productGroupID", "available",
+    )
+
+    def __init__(self, row):
+        (self.productID, self.productName, self.productDescription, size, color, category, self.unitPrice,
+         self.image_path, self.currentStock, self.minStockLevel, self.maxStockLevel, self.productGroupID,
+         self.available) = row
+        # sizes, colours and categories repeat across the catalogue; keep one copy of each
+        self.size = sys.intern(size) if size else size
+        self.color = sys.intern(color) if color else color
+        self.category = sys.intern(category) if category else category
+
+
+class CatalogueReplica:
+    def __init__(self):
+        self.products = {}
+        self.by_category = {}
+        self.by_group = {}
+        self.by_size = {}
+        self.watermark = 0
+        self.loaded = False
+        # listings built since the last change, by (read, argument)
+        self._listings = {}
+        self._wake = asyncio.Event()
+
+    def __len__(self):
+        return len(self.products)
+
+    def _put(self, record: ProductRecord):
+        self._drop(record.productID)
+        self._listings.clear()
+        self.products[record.productID] = record
+        self.by_category.setdefault(text_key(record.category), set()).add(record.productID)
+        self.by_group.setdefault(record.productGroupID, set()).add(record.productID)
+        self.by_size.setdefault(text_key(record.size), set()).add(record.productID)
+
+    def _drop(self, product_id: int):
+        record = self.products.pop(product_id, None)
+        if record is None:
+            return
+        self._listings.clear()
+        for index, key in ((self.by_category, text_key(record.category)),
+                           (self.by_group, record.productGroupID),
+                           (self.by_size, text_key(record.size))):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del index[key]
+
+    async def load(self):
+        """(Re)build the replica from the active products in one streamed pass."""
+        fresh = CatalogueReplica()
+        async with database.unit_of_work() as cursor:
+            await cursor.execute(LOAD_SQL)
+            # changes committed while the rows stream in are applied again by the next refresh
+            watermark = (await cursor.fetchone())[0]
+            await cursor.nextset()
+            while True:
+                rows = await cursor.fetchmany(LOAD_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    fresh._put(ProductRecord(row))
+        self.products, self.by_category = fresh.products, fresh.by_category
+        self.by_group, self.by_size = fresh.by_group, fresh.by_size
+        self._listings.clear()
+        self.watermark = watermark
+        self.loaded = True
+        print(f"Catalogue replica loaded: {len(self)} products")
+
+    async def refresh(self) -> int:
+        """Apply the changes since the watermark; returns how many changed rows were read."""
+        read = 0
+        while True:
+            page = await change_feed.changes(self.watermark)
+            recount = {variant["productID"] for variant in page["variants"]}
+            for product in page["products"]:
+                if product["change"] != "upserted":
+                    self._drop(product["productID"])
+                    continue
+                previous = self.products.get(product["productID"])
+                if previous is None:
+                    recount.add(product["productID"])
+                self._put(ProductRecord(
+                    tuple(product[column] for column in ProductRecord.__slots__[:-1])
+                    + (previous.available if previous else 0,)))
+            await self._recount([product_id for product_id in recount if product_id in self.products])
+            read += len(page["products"]) + len(page["variants"])
+            self.watermark = int(page["token"])
+            if not page["hasMore"]:
+                return read
+
+    async def _recount(self, product_ids):
+        for start in range(0, len(product_ids), RECOUNT_CHUNK_SIZE):
+            async with database.unit_of_work() as cursor:
+                await cursor.execute(RECOUNT_SQL, (json.dumps(product_ids[start:start + RECOUNT_CHUNK_SIZE]),))
+                for product_id, available in await cursor.fetchall():
+                    record = self.products.get(product_id)
+                    if record is not None:
+                        record.available = available
+        if product_ids:
+            self._listings.clear()
+
+    async def refresh_loop(self):
+        """Follow the change feed for as long as the server runs."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), REFRESH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                if self.loaded:
+                    await self.refresh()
+                else:
+                    # the startup load failed; keep trying until the replica can serve reads
+                    await self.load()
+            except Exception as e:
+                print(f"Error refreshing the catalogue replica: {e}")
+
+    def request_refresh(self, keys=()):
+        """Invalidation hook: refresh now instead of at the next tick."""
+        self._wake.set()
+
+    # Reads over the active products, shaped like the rows of the queries they replace
+
+    def _in_stock(self, product_ids):
+        for product_id in product_ids:
+            record = self.products[product_id]
+            if record.available > 0:
+                yield record
+
+    def listing(self):
+        """(name, description, size, color, unitPrice, available quantity), summed over identical rows."""
+        listing = self._listings.get(("listing", None))
+        if listing is not None:
+            return listing
+        totals = {}
+        for record in self._in_stock(self.products):
+            key = (record.productName, record.productDescription, record.size, record.color, record.unitPrice)
+            totals[key] = totals.get(key, 0) + record.available
+        listing = self._listings[("listing", None)] = [key + (available,) for key, available in totals.items()]
+        return listing
+
+    def category_listing(self, category: str):
+        """(name, description, category, size, unitPrice, image_path, available quantity, currentStock, productGroupID)."""
+        key = ("category", text_key(category))
+        listing = self._listings.get(key)
+        if listing is None:
+            listing = self._listings[key] = [
+                (record.productName, record.productDescription, record.category, record.size, record.unitPrice,
+                 record.image_path, record.available, record.currentStock, record.productGroupID)
+                for record in self._in_stock(self.by_category.get(key[1], ()))
+            ]
+        return listing
+
+    def group_products(self, group_ids):
+        """Active products of the given product groups."""
+        return [self.products[product_id]
+                for group_id in group_ids for product_id in self.by_group.get(group_id, ())]
+
+    def product(self, product_id: int):
+        """The product as the product loader returns it, or None when it is inactive or out of stock."""
+        record = self.products.get(product_id)
+        if record is None or record.available <= 0:
+            return None
+        return {
+            "productName": record.productName,
+            "productDescription": record.productDescription,
+            "size": record.size,
+            "color": record.color,
+            "unitPrice": record.unitPrice,
+            "minStockLevel": record.minStockLevel,
+            "maxStockLevel": record.maxStockLevel,
+            "available quantity": record.available,
+        }
+
+    def stats(self):
+        """Product count, watermark and approximate memory held by the records and indexes."""
+        seen = set()
+
+        def size_of(value):
+            if id(value) in seen:
+                return 0
+            seen.add(id(value))
+            return sys.getsizeof(value)
+
+        record_bytes = sum(size_of(record) + sum(size_of(getattr(record, name)) for name in ProductRecord.__slots__)
+                           for record in self.products.values())
+        index_bytes = sys.getsizeof(self.products) + sum(
+            sys.getsizeof(index) + sum(sys.getsizeof(ids) for ids in index.values())
+            for index in (self.by_category, self.by_group, self.by_size))
+        total = record_bytes + index_bytes
+        return {
+            "loaded": self.loaded,
+            "products": len(self),
+            "watermark": str(self.watermark),
+            "bytes": total,
+            "bytesPer100kProducts": round(total * 100000 / len(self)) if self.products else 0,
+        }
+
+
+# Replica shared by every request in this process
+replica = CatalogueReplica()
+invalidation.subscribe("Products", replica.request_refresh)
+invalidation.subscribe("ProductVariants", replica.request_refresh)
@@ -0,0 +1,92 @@
+# Change feed of the catalogue for delta sync (GET /products/products/changes).
+# A token is the rowversion (migration 012) up to which a client has seen every
+# change of Products and ProductVariants. A page returns the rows changed after
+# it, oldest change first, and the token to ask with next. Rows are only read
+# below MIN_ACTIVE_ROWVERSION(), so a transaction that commits late can never
+# land below a token that was already handed out.
+import database
+
+# Most changed rows one page may return
+MAX_CHANGES_PAGE = 5000
+
+PRODUCT_COLUMNS = (
+    "productID", "productName", "productDescription", "size", "color", "category", "unitPrice",
+    "image_path", "currentStock", "minStockLevel", "maxStockLevel", "isActive", "productGroupID",
+)
+VARIANT_COLUMNS = (
+    "variantID", "barcode", "productCode", "productID", "isAvailable",
+    "isDamaged", "isWrongItem", "isReturned",
+)
+
+# Archived rows are read too: their last version may be newer than the token
+CHANGES_SQL = f'''
+SET NOCOUNT ON;
+DECLARE @since BINARY(8) = CAST(CAST(? AS BIGINT) AS BINARY(8));
+DECLARE @upper BINARY(8) = MIN_ACTIVE_ROWVERSION();
+DECLARE @page TABLE (rv BINARY(8) NOT NULL, kind CHAR(1) NOT NULL, id INT NOT NULL, archived BIT NOT NULL);
+
+INSERT INTO @page (rv, kind, id, archived)
+SELECT TOP (?) rv, kind, id, archived
+FROM (
+    SELECT rowVersion AS rv, 'p' AS kind, productID AS id, CAST(0 AS BIT) AS archived
+    FROM Products WHERE rowVersion > @since AND rowVersion < @upper
+    UNION ALL
+    SELECT rowVersion, 'v', variantID, 0
+    FROM ProductVariants WHERE rowVersion > @since AND rowVersion < @upper
+    UNION ALL
+    SELECT rowVersion, 'p', productID, 1
+    FROM ProductsArchive WHERE rowVersion > @since AND rowVersion < @upper
+    UNION ALL
+    SELECT rowVersion, 'v', variantID, 1
+    FROM ProductVariantsArchive WHERE rowVersion > @since AND rowVersion < @upper
+) AS changed
+ORDER BY rv;
+
+SELECT CAST(@upper AS BIGINT) - 1, CAST((SELECT MAX(rv) FROM @page) AS BIGINT), (SELECT COUNT(*) FROM @page);
+
+SELECT {", ".join(f"p.{column}" for column in PRODUCT_COLUMNS)}, page.archived
+FROM @page AS page
+JOIN AllProducts AS p ON p.productID = page.id AND p.isArchived = page.archived
+WHERE page.kind = 'p'
+ORDER BY page.rv;
+
+SELECT {", ".join(f"v.{column}" for column in VARIANT_COLUMNS)}, page.archived
+FROM @page AS page
+JOIN AllProductVariants AS v ON v.variantID = page.id AND v.isArchived = page.archived
+WHERE page.kind = 'v'
+ORDER BY page.rv;
+'''
+
+
+# Function to name what happened to a row: deactivated rows stay listed with their last values
+def _change(active: bool, archived: bool) -> str:
+    if archived:
+        return "archived"
+    return "upserted" if active else "deactivated"
+
+
+async def changes(since: int = 0, limit: int = MAX_CHANGES_PAGE):
+    """Return the products and variants changed after the token since, at most limit rows, and the next token."""
+    async with database.unit_of_work() as cursor:
+        await cursor.execute(CHANGES_SQL, (since, limit))
+        committed, last, count = await cursor.fetchone()
+        await cursor.nextset()
+        products = await cursor.fetchall()
+        await cursor.nextset()
+        variants = await cursor.fetchall()
+
+    # a full page continues after its last row; otherwise everything committed so far was read
+    has_more = count >= limit
+    token = last if has_more else max(since, committed)
+    return {
+        "token": str(token),
+        "hasMore": has_more,
+        "products": [
+            {**dict(zip(PRODUCT_COLUMNS, row)), "change": _change(row[PRODUCT_COLUMNS.index("isActive")], row[-1])}
+            for row in products
+        ],
+        "variants": [
+            {**dict(zip(VARIANT_COLUMNS, row)), "change": _change(row[VARIANT_COLUMNS.index("isAvailable")], row[-1])}
+            for row in variants
+        ],
+    }
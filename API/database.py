@@ -1,17 +1,35 @@
+import asyncio
+import contextvars
+import random
 import aioodbc
 
 
 # Connection credentials for the database
-server = 'LAPTOP-8KPHOHE5\\SQLEXPRESS'  
+server = 'LAPTOP-8KPHOHE5\\SQLEXPRESS'
 database_name = 'Vendor_SM'
 username = 'Angel'
 password = 'Angel123'
 driver = 'ODBC Driver 17 for SQL Server'
 
+dsn = f"DRIVER={driver};SERVER={server};DATABASE={database_name};UID={username};PWD={password}"
+
+# Connection pool used by the units of work
+POOL_MIN_SIZE = 5
+POOL_MAX_SIZE = 20
+
+# Deadlock victims (error 1205) are retried with jittered exponential backoff
+DEADLOCK_RETRIES = 3
+DEADLOCK_BACKOFF_SECONDS = 0.05
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+# The unit of work the current task is running in (see after_commit)
+_current_unit = contextvars.ContextVar("current_unit_of_work", default=None)
+
 
 # Function to debug connection
 async def test_connection():
-    dsn = f"DRIVER={driver};SERVER={server};DATABASE={database_name};UID={username};PWD={password}"
     try:
         print(f"Attempting connection to: {dsn}")
         conn = await aioodbc.connect(dsn=dsn, autocommit=True)
@@ -21,12 +39,117 @@ async def test_connection():
         print(f"Connection failed: {e}")
 
 
-# Function to connect to DB
+# Function to connect to DB (autocommit; used by maintenance scripts and benchmarks)
 async def get_db_connection():
-    dsn = f"DRIVER={driver};SERVER={server};DATABASE={database_name};UID={username};PWD={password}"
     try:
         conn = await aioodbc.connect(dsn=dsn, autocommit=True)
         return conn
     except Exception as e:
         print(f"Error establishing database connection: {e}")
         raise
+
+
+# Function to get the shared pool of explicit-transaction connections
+async def get_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await aioodbc.create_pool(
+                    dsn=dsn, minsize=POOL_MIN_SIZE, maxsize=POOL_MAX_SIZE, autocommit=False
+                )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+# A request-scoped unit of work: one explicit transaction on a pooled
+# connection, committed once when the block exits normally and rolled back
+# when it raises.
+#
+#     async with database.unit_of_work() as cursor:
+#         await cursor.execute(...)
+#
+# Writes go through run_in_transaction(work) instead, which runs the same unit
+# again when SQL Server picks it as a deadlock victim; a with-block cannot be re-run.
+class UnitOfWork:
+    async def __aenter__(self):
+        self._pool = await get_pool()
+        self.conn = await self._pool.acquire()
+        try:
+            self.cursor = await self.conn.cursor()
+        except Exception:
+            await self._pool.release(self.conn)
+            raise
+        self._after_commit = []
+        self._token = _current_unit.set(self)
+        return self.cursor
+
+    async def __aexit__(self, exc_type, exc, tb):
+        _current_unit.reset(self._token)
+        try:
+            if exc_type is None:
+                await self.conn.commit()
+            else:
+                await self.conn.rollback()
+        except Exception:
+            if exc_type is None:
+                await self.conn.rollback()
+            raise
+        finally:
+            try:
+                # SET NOCOUNT ON in a batch stays on the session; the next unit on this connection needs its row counts
+                await self.cursor.execute("SET NOCOUNT OFF")
+            except Exception as e:
+                print(f"Error resetting pooled connection: {e}")
+            await self.cursor.close()
+            await self._pool.release(self.conn)
+        if exc_type is None:
+            for callback in self._after_commit:
+                callback()
+        return False
+
+
+def unit_of_work() -> UnitOfWork:
+    return UnitOfWork()
+
+
+def after_commit(callback):
+    """
+    Call callback() once the current unit of work has committed; it is dropped on
+    rollback. Outside a unit of work (autocommit scripts) it runs immediately.
+    """
+    unit = _current_unit.get()
+    if unit is None:
+        callback()
+    else:
+        unit._after_commit.append(callback)
+
+
+# Function to tell whether SQL Server chose this transaction as a deadlock victim
+def is_deadlock(error: Exception) -> bool:
+    sqlstate = error.args[0] if getattr(error, "args", None) else None
+    return sqlstate == "40001" or "(1205)" in str(error)
+
+
+async def run_in_transaction(work, retries: int = DEADLOCK_RETRIES):
+    """
+    Run await work(cursor) in a unit of work and return its result.
+    The whole unit is retried when it is chosen as a deadlock victim.
+    """
+    for attempt in range(retries + 1):
+        try:
+            async with unit_of_work() as cursor:
+                return await work(cursor)
+        except Exception as e:
+            if attempt == retries or not is_deadlock(e):
+                raise
+            delay = random.uniform(0, DEADLOCK_BACKOFF_SECONDS * 2 ** attempt)
+            print(f"Deadlock victim, retrying in {delay:.3f}s (attempt {attempt + 1} of {retries})")
+            await asyncio.sleep(delay)
@@ -0,0 +1,228 @@
+# Replenishment forecasting.
+# Order history (purchaseOrderDetails.orderQuantity by orderDate) is loaded in
+# one streamed query into a products x weeks NumPy matrix of 7-day buckets
+# ending today. Every product's weekly demand is forecast in one vectorized pass:
+# the history is deseasonalized with a catalogue-wide week-of-year index, an
+# exponentially weighted moving average gives the level and an EW deviation the
+# safety stock, and the seasonal index of the coming weeks scales the level back.
+from array import array
+from datetime import date, datetime, timedelta
+import asyncio
+import math
+import database
+import startup
+
+# Imported with the first forecast, not when the routers are
+np = startup.lazy_import("numpy")
+
+# Weeks of order history kept (5 years)
+HISTORY_WEEKS = 260
+# Smoothing factor of the weekly EWMA
+ALPHA = 0.2
+# Years of history needed before the seasonal index is used
+MIN_SEASONAL_YEARS = 2
+# Weight of the neighbouring weeks when smoothing the seasonal index
+SEASONAL_SMOOTHING = 0.25
+# Products fitted per block (bounds the temporary matrices)
+FIT_BLOCK_ROWS = 8192
+# Rows read per round-trip while the history loads
+LOAD_BATCH_SIZE = 10000
+# The whole model is reloaded at most this often (orders of other workers, cancellations)
+RELOAD_AFTER_SECONDS = 3600
+
+# Demand per product and 7-day bucket ending asOf, archived orders included; cancelled
+# and rejected orders are not demand
+HISTORY_SQL = '''
+SELECT pod.productID,
+       DATEDIFF(DAY, CAST(po.orderDate AS DATE), ?) / 7 AS weeksAgo,
+       SUM(pod.orderQuantity)
+FROM AllPurchaseOrderDetails AS pod
+JOIN AllPurchaseOrders AS po ON po.orderID = pod.orderID
+WHERE po.orderDate >= ? AND CAST(po.orderDate AS DATE) <= ?
+  AND po.orderStatus NOT IN ('Cancelled', 'Rejected')
+GROUP BY pod.productID, DATEDIFF(DAY, CAST(po.orderDate AS DATE), ?) / 7
+'''
+
+
+# Function to give the week-of-year bin (0-51) of the 7-day buckets ending on the given dates
+def _season_bins(end_dates):
+    return np.minimum((np.array([d.timetuple().tm_yday for d in end_dates]) - 4) % 365 // 7, 51)
+
+
+class Forecast:
+    """
+    Demand model of the whole catalogue as of one day. demand[i, w] is the quantity
+    ordered of product_ids[i] in bucket w (the last column is the 7 days ending asOf).
+    """
+
+    def __init__(self, as_of: date, product_ids, demand):
+        self.as_of = as_of
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)  # sorted
+        self.demand = np.asarray(demand, dtype=np.float32)
+        self._rows = {int(product_id): row for row, product_id in enumerate(self.product_ids)}
+        self._dirty = set()
+        # set when an order could not be counted in; the next read reloads
+        self.stale = False
+        self.loaded_at = datetime.utcnow()
+        weeks = self.demand.shape[1]
+        self._bins = _season_bins([as_of - timedelta(days=7 * (weeks - 1 - w)) for w in range(weeks)])
+        # EWMA weights of the weeks, newest last; applying them is one matrix-vector product
+        self._weights = (ALPHA * (1 - ALPHA) ** np.arange(weeks - 1, -1, -1)).astype(np.float32)
+        self._fit()
+
+    @classmethod
+    def from_rows(cls, as_of: date, rows, weeks: int = HISTORY_WEEKS):
+        """Build from (productID, weeksAgo, quantity) rows given as three parallel sequences."""
+        product_col, weeks_ago, quantity = (np.asarray(column) for column in rows)
+        product_ids, row_index = np.unique(product_col, return_inverse=True)
+        demand = np.zeros((len(product_ids), weeks), dtype=np.float32)
+        keep = (weeks_ago >= 0) & (weeks_ago < weeks)
+        np.add.at(demand, (row_index[keep], weeks - 1 - weeks_ago[keep]), quantity[keep])
+        return cls(as_of, product_ids, demand)
+
+    def _fit(self):
+        weeks = self.demand.shape[1]
+        # Catalogue-wide seasonal index per week-of-year bin, smoothed with its neighbours
+        totals = self.demand.sum(axis=0)
+        seasonal = np.ones(52, dtype=np.float32)
+        if weeks >= 52 * MIN_SEASONAL_YEARS and totals.mean() > 0:
+            per_bin = np.bincount(self._bins, weights=totals, minlength=52) / np.maximum(
+                np.bincount(self._bins, minlength=52), 1)
+            per_bin = per_bin / per_bin[per_bin > 0].mean()
+            per_bin = ((1 - 2 * SEASONAL_SMOOTHING) * per_bin
+                       + SEASONAL_SMOOTHING * (np.roll(per_bin, 1) + np.roll(per_bin, -1)))
+            seasonal = np.where(per_bin > 0, per_bin, 1).astype(np.float32)
+        self.seasonal = seasonal
+        self._factors = seasonal[self._bins]
+        self.level = np.zeros(len(self.product_ids), dtype=np.float32)
+        self.deviation = np.zeros(len(self.product_ids), dtype=np.float32)
+        self._fit_rows(slice(None))
+
+    def _fit_rows(self, rows):
+        # deseasonalized demand -> EWMA level and EW mean absolute deviation per product,
+        # in blocks so the temporaries stay small
+        rows = np.arange(len(self.product_ids)) if isinstance(rows, slice) else rows
+        weeks = self.demand.shape[1]
+        for start in range(0, len(rows), FIT_BLOCK_ROWS):
+            block = rows[start:start + FIT_BLOCK_ROWS]
+            adjusted = self.demand[block] / self._factors
+            # each product's average starts at its first order, not at the start of the history
+            ordered = adjusted > 0
+            first = np.where(ordered.any(axis=1), ordered.argmax(axis=1), weeks - 1)
+            first_value = adjusted[np.arange(len(block)), first]
+            initial = ((1 - ALPHA) ** (weeks - first)).astype(np.float32)
+            level = adjusted @ self._weights + initial * first_value
+            active = np.arange(weeks) >= first[:, None]
+            spread = np.where(active, np.abs(adjusted - level[:, None]), 0)
+            self.level[block] = level
+            self.deviation[block] = spread @ self._weights + initial * np.abs(first_value - level)
+
+    def record(self, product_id: int, order_date: date, quantity: int):
+        """Count a newly received order in; its product is refitted on the next read."""
+        weeks_ago = (self.as_of - order_date).days // 7
+        row = self._rows.get(int(product_id))
+        if row is None and (not len(self.product_ids) or product_id > self.product_ids[-1]):
+            row = self._append_product(int(product_id))
+        if row is None or not 0 <= weeks_ago < self.demand.shape[1]:
+            # an out-of-order productID or an out-of-range date waits for the next reload
+            self.stale = True
+            return
+        self.demand[row, -1 - weeks_ago] += quantity
+        self._dirty.add(row)
+
+    def _append_product(self, product_id: int) -> int:
+        # first order of a new product: product_ids stay sorted because productIDs only grow
+        row = len(self.product_ids)
+        self.product_ids = np.append(self.product_ids, product_id)
+        self.demand = np.vstack([self.demand, np.zeros((1, self.demand.shape[1]), dtype=np.float32)])
+        self.level = np.append(self.level, np.float32(0))
+        self.deviation = np.append(self.deviation, np.float32(0))
+        self._rows[product_id] = row
+        return row
+
+    def refit_dirty(self):
+        """Refit only the products that received orders since the last read."""
+        if self._dirty:
+            rows = np.fromiter(self._dirty, dtype=np.int64)
+            self._dirty.clear()
+            self._fit_rows(rows)
+
+    def weekly_forecast(self, horizon_weeks: int):
+        """Forecast demand of every product over the next horizon_weeks weeks."""
+        future = _season_bins([self.as_of + timedelta(days=7 * (h + 1)) for h in range(horizon_weeks)])
+        return self.level * self.seasonal[future].sum()
+
+    def plan(self, product_ids, available, min_levels, max_levels, lead_time_weeks: int, cover_weeks: int,
+             service_z: float):
+        """
+        Forecast, safety stock and suggested reorder quantity for the given products
+        (parallel arrays; NaN min/max levels mean unset). The target covers lead time
+        plus cover weeks of forecast demand and the safety stock, at least
+        minStockLevel and at most maxStockLevel; the free stock is subtracted.
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        # products without order history forecast zero demand
+        forecast = np.zeros(len(product_ids), dtype=np.float32)
+        deviation = np.zeros(len(product_ids), dtype=np.float32)
+        if len(self.product_ids):
+            rows = np.searchsorted(self.product_ids, product_ids).clip(max=len(self.product_ids) - 1)
+            known = self.product_ids[rows] == product_ids
+            forecast[known] = self.weekly_forecast(lead_time_weeks + cover_weeks)[rows[known]]
+            deviation[known] = self.deviation[rows[known]]
+        # 1.25 x mean absolute deviation approximates one standard deviation
+        safety = service_z * 1.25 * deviation * np.sqrt(max(lead_time_weeks, 1))
+        target = np.fmax(forecast + safety, np.nan_to_num(min_levels, nan=0))
+        target = np.fmin(target, np.where(np.isnan(max_levels), np.inf, max_levels))
+        return forecast, safety, np.ceil(np.maximum(target - available, 0))
+
+
+async def load(as_of: date = None) -> Forecast:
+    """Load HISTORY_WEEKS weeks of order history ending as_of (today) in one streamed query."""
+    as_of = as_of or datetime.utcnow().date()
+    since = as_of - timedelta(days=7 * HISTORY_WEEKS - 1)
+    product_col, weeks_ago, quantity = array('q'), array('q'), array('d')
+    async with database.unit_of_work() as cursor:
+        await cursor.execute(HISTORY_SQL, (as_of, since, as_of, as_of))
+        while True:
+            rows = await cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            for product_id, ago, ordered in rows:
+                product_col.append(product_id)
+                weeks_ago.append(ago)
+                quantity.append(ordered)
+    return Forecast.from_rows(as_of, (
+        np.frombuffer(product_col, dtype=np.int64),
+        np.frombuffer(weeks_ago, dtype=np.int64),
+        np.frombuffer(quantity, dtype=np.float64)))
+
+
+# Forecast shared by every request in this process, built on first use
+_current = None
+_loading = asyncio.Lock()
+
+
+async def current() -> Forecast:
+    """Return the cached forecast, reloading it on a new day, after RELOAD_AFTER_SECONDS or when stale."""
+    global _current
+    async with _loading:
+        today = datetime.utcnow().date()
+        if (_current is None or _current.stale or _current.as_of != today
+                or (datetime.utcnow() - _current.loaded_at).total_seconds() > RELOAD_AFTER_SECONDS):
+            _current = await load(today)
+        _current.refit_dirty()
+        return _current
+
+
+def record_order(lines, order_date):
+    """Count committed order lines, given as (productID, quantity) pairs, into the cached forecast."""
+    if _current is None:
+        return
+    order_date = order_date.date() if isinstance(order_date, datetime) else order_date or datetime.utcnow().date()
+    for product_id, quantity in lines:
+        _current.record(product_id, order_date, quantity)
+
+
+# Function to round the float32 outputs for JSON
+def rounded(value: float, digits: int = 2):
+    return None if math.isnan(value) else round(float(value), digits)
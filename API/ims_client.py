@@ -0,0 +1,45 @@
+import startup
+
+# The HTTP client of the calls to IMS, shared by every request of this worker so
+# their connections to IMS stay open between orders instead of being opened per
+# call. httpx is imported when the warm-up creates the client, not at boot.
+_httpx = startup.lazy_import("httpx")
+
+# Seconds an IMS call may take before it fails
+TIMEOUT_SECONDS = 30
+# Connections to IMS kept by the client
+MAX_CONNECTIONS = 20
+
+_client = None
+
+# Exception types raised by the client, for the callers' except clauses
+EXCEPTION_TYPES = ("HTTPError", "HTTPStatusError")
+
+
+def __getattr__(name: str):
+    # looked up on use, so importing this module does not import httpx
+    if name in EXCEPTION_TYPES:
+        return getattr(_httpx, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def client():
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = _httpx.AsyncClient(
+            timeout=TIMEOUT_SECONDS,
+            limits=_httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def warm_up():
+    client()
+
+
+async def close():
+    global _client
+    if _client is not None:
+        shared, _client = _client, None
+        await shared.aclose()
@@ -0,0 +1,55 @@
+from datetime import date, datetime
+from typing import List, Optional, Union
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+# IMS timestamps come as "YYYY-MM-DD HH:MM:SS[.ffffff]", ISO-8601 "T" timestamps or
+# plain dates. Each is parsed in a single pass; plain dates stay dates.
+IMSDate = Union[datetime, date]
+
+
+# Strict models: no silent coercion of strings to numbers, unknown keys are ignored
+class IMSModel(BaseModel):
+    model_config = ConfigDict(strict=True, extra="ignore")
+
+
+# One line of an order pushed by IMS to /orders/vms/orders
+class IMSOrderLine(IMSModel):
+    productID: int = Field(gt=0)
+    quantity: int = Field(gt=0)
+    expectedDate: Optional[IMSDate] = None
+
+
+class IMSOrder(IMSModel):
+    customerID: int = Field(gt=0)
+    orderDate: Optional[IMSDate] = None
+    products: List[IMSOrderLine] = Field(min_length=1)
+
+
+# Order submitted by IMS to /order-details/orders
+class IMSOrderIntake(IMSModel):
+    orderID: int
+    productName: str
+    productDescription: str
+    size: str
+    color: str
+    category: str
+    quantity: int = Field(gt=0)
+    warehouseID: int
+    vendorID: int
+    userID: int
+    vendorName: Optional[str] = "Not provided"
+    orderDate: Optional[IMSDate] = None
+    expectedDate: Optional[IMSDate] = None
+    userName: Optional[str] = None
+    warehouseName: Optional[str] = None
+    warehouseAddress: Optional[str] = None
+
+
+async def decode_payload(request: Request, model):
+    """Validate the raw request body against model, rejecting malformed payloads with 422."""
+    body = await request.body()
+    try:
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
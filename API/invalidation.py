@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import database
+import serialization
+
+# Invalidation bus between the workers of one deployment on one host. Each
+# worker binds a Unix datagram socket in BUS_DIRECTORY; publish() runs the local
+# subscribers at once and sends (table, keys, version) to every other socket
+# there, whose worker runs its own subscribers. No broker: a worker joins by
+# binding its socket and leaves by removing it. Without Unix datagram sockets
+# (Windows) changes stay local to the process.
+
+# Directory of the worker sockets; workers serving the same port share it
+BUS_DIRECTORY = os.getenv("INVALIDATION_BUS_DIR") or os.path.join(
+    tempfile.gettempdir(), f"invalidation-bus-{os.getenv('PORT', '8001')}")
+# Keys per datagram; larger changes are split over several
+MAX_KEYS_PER_MESSAGE = 500
+# Largest datagram read from the socket
+MAX_MESSAGE_BYTES = 65536
+
+# table -> (callback(keys), own_writes) pairs run when rows of that table change
+_subscribers = {}
+# table -> changes published or received by this process
+_versions = {}
+# The running bus, once start_bus() has bound this worker's socket
+_bus = None
+
+
+# Decorator / function subscribing a cache to the changes of a table
+def subscribe(table: str, callback=None, own_writes: bool = True):
+    """
+    own_writes=False skips the changes this process publishes itself, for caches
+    that the writing code path already updates in place.
+    """
+    def register(func):
+        _subscribers.setdefault(table, []).append((func, own_writes))
+        return func
+    return register(callback) if callback is not None else register
+
+
+def version(table: str) -> int:
+    """
+    Count of changes of table seen by this process. A cache filled from a read
+    that started at another version may hold rows a change already invalidated.
+    """
+    return _versions.get(table, 0)
+
+
+def _deliver(table: str, keys: tuple, own: bool):
+    _versions[table] = _versions.get(table, 0) + 1
+    for callback, own_writes in _subscribers.get(table, ()):
+        if own and not own_writes:
+            continue
+        try:
+            callback(keys)
+        except Exception as e:
+            # a broken cache must not fail the write that already committed
+            print(f"Error invalidating {table}: {e}")
+
+
+def publish(table: str, keys):
+    """Tell the caches of table, in this worker and the others, that the rows with these keys changed."""
+    keys = tuple(keys)
+    _deliver(table, keys, own=True)
+    if _bus is not None:
+        _bus.send(table, keys, _versions[table])
+
+
+def publish_after_commit(table: str, keys):
+    """Publish once the caller's unit of work commits (at once outside of one)."""
+    keys = tuple(keys)
+    database.after_commit(lambda: publish(table, keys))
+
+
+class Bus:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._socket = None
+        # peer socket path -> datagram socket connected to it
+        self._peers = {}
+        self._outbox = asyncio.Queue()
+        self._tasks = []
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._socket.setblocking(False)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._receive()), loop.create_task(self._send())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for peer in self._peers.values():
+            peer.close()
+        self._peers.clear()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def send(self, table: str, keys: tuple, table_version: int):
+        self._outbox.put_nowait((table, keys, table_version))
+
+    def _take_batch(self, first):
+        """Merge the changes queued behind first into one key list per table, as datagrams."""
+        tables = {first[0]: [list(first[1]), first[2]]}
+        taken = 1
+        while not self._outbox.empty():
+            table, keys, table_version = self._outbox.get_nowait()
+            taken += 1
+            entry = tables.setdefault(table, [[], table_version])
+            entry[0].extend(keys)
+            entry[1] = table_version
+        messages = []
+        for table, (keys, table_version) in tables.items():
+            for start in range(0, max(len(keys), 1), MAX_KEYS_PER_MESSAGE):
+                messages.append(serialization.dumps({
+                    "table": table,
+                    "keys": keys[start:start + MAX_KEYS_PER_MESSAGE],
+                    "version": table_version,
+                    "origin": os.getpid(),
+                }))
+        return messages, taken
+
+    async def drain(self):
+        """Wait until the messages published so far have been sent."""
+        await self._outbox.join()
+
+    def _peer_paths(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith(".sock") and os.path.join(self.directory, name) != self.path]
+
+    def _connect(self, path: str):
+        peer = self._peers.get(path)
+        if peer is None:
+            peer = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            peer.setblocking(False)
+            try:
+                peer.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                peer.close()
+                # nothing is bound to it any more: a worker that exited without cleaning up
+                if os.path.exists(path):
+                    os.unlink(path)
+                return None
+            self._peers[path] = peer
+        return peer
+
+    async def _send(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            messages, taken = self._take_batch(await self._outbox.get())
+            try:
+                # peers are listed once per batch, so a worker that just joined gets everything after it
+                for path in self._peer_paths():
+                    peer = self._connect(path)
+                    if peer is None:
+                        continue
+                    try:
+                        for message in messages:
+                            # waits while the peer's queue is full rather than dropping the message
+                            await loop.sock_sendall(peer, message)
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        self._peers.pop(path).close()
+                    except OSError as e:
+                        print(f"Error sending invalidation to {path}: {e}")
+            finally:
+                for _ in range(taken):
+                    self._outbox.task_done()
+
+    async def _receive(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await loop.sock_recv(self._socket, MAX_MESSAGE_BYTES)
+            try:
+                message = json.loads(data)
+                _deliver(message["table"], tuple(message["keys"]), own=False)
+            except Exception as e:
+                print(f"Error reading invalidation message: {e}")
+
+
+async def start_bus(directory: str = BUS_DIRECTORY):
+    """Join the bus of this deployment; without Unix datagram sockets changes stay in this process."""
+    global _bus
+    bus = Bus(directory)
+    try:
+        await bus.start()
+    except (AttributeError, OSError) as e:
+        await bus.stop()
+        print(f"Invalidation bus unavailable, caches are invalidated in this process only: {e}")
+        return
+    _bus = bus
+
+
+async def stop_bus():
+    """Send what is still queued and leave the bus."""
+    global _bus
+    if _bus is None:
+        return
+    bus, _bus = _bus, None
+    try:
+        await asyncio.wait_for(bus.drain(), 5)
+    except asyncio.TimeoutError:
+        pass
+    await bus.stop()
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import database
+
+# Units (e.g. variants) processed and committed per chunk
+CHUNK_SIZE = 1000
+# Jobs running at the same time in this process
+MAX_CONCURRENT_JOBS = 2
+# A running job whose heartbeat is older than this belongs to a dead process and may be resumed
+STALE_AFTER_SECONDS = 120
+# How often the maintenance worker looks for queued and stale jobs
+RESUME_CHECK_SECONDS = 60
+
+# jobType -> async handler(cursor, payload, start, count) processing units [start, start + count)
+_handlers = {}
+_semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+_tasks = set()
+# jobIDs started in this process and not finished yet
+_active = set()
+
+
+# Decorator registering the chunk handler of a job type
+def handler(job_type: str):
+    def register(func):
+        _handlers[job_type] = func
+        return func
+    return register
+
+
+async def enqueue(cursor, job_type: str, payload: dict, total_units: int) -> int:
+    """
+    Record a job in the caller's unit of work and return its jobID.
+    The job starts in the background once that unit of work commits.
+    """
+    await cursor.execute('''
+        INSERT INTO InventoryJobs (jobType, payload, totalUnits)
+        OUTPUT inserted.jobID
+        VALUES (?, ?, ?)''', (job_type, json.dumps(payload), total_units))
+    job_id = (await cursor.fetchone())[0]
+    database.after_commit(lambda: _start(job_id))
+    return job_id
+
+
+def _start(job_id: int):
+    if job_id in _active:
+        return
+    _active.add(job_id)
+    task = asyncio.ensure_future(_run(job_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    task.add_done_callback(lambda _: _active.discard(job_id))
+
+
+async def _claim(job_id: int):
+    # Only one process may run a job: queued jobs, or running ones whose owner stopped heart-beating
+    async def claim(cursor):
+        await cursor.execute('''
+            UPDATE InventoryJobs
+            SET status = 'running', startedAt = ISNULL(startedAt, GETUTCDATE()), heartbeatAt = GETUTCDATE()
+            OUTPUT inserted.jobType, inserted.payload, inserted.totalUnits, inserted.doneUnits
+            WHERE jobID = ? AND cancelRequested = 0
+              AND (status = 'queued'
+                   OR (status = 'running' AND heartbeatAt < DATEADD(SECOND, -?, GETUTCDATE())))''',
+            (job_id, STALE_AFTER_SECONDS))
+        return await cursor.fetchone()
+    return await database.run_in_transaction(claim)
+
+
+async def _finish(job_id: int, status: str, error: str = None):
+    async def finish(cursor):
+        await cursor.execute('''
+            UPDATE InventoryJobs
+            SET status = ?, error = ?, finishedAt = GETUTCDATE(), heartbeatAt = GETUTCDATE()
+            WHERE jobID = ?''', (status, error, job_id))
+    await database.run_in_transaction(finish)
+
+
+async def _run(job_id: int):
+    async with _semaphore:
+        claimed = await _claim(job_id)
+        if not claimed:
+            return
+        job_type, payload, total_units, done_units = claimed
+        process_chunk = _handlers[job_type]
+        payload = json.loads(payload)
+        try:
+            while done_units < total_units:
+                start, count = done_units, min(CHUNK_SIZE, total_units - done_units)
+
+                # the chunk and the progress that records it commit together
+                async def run_chunk(cursor):
+                    await cursor.execute('SELECT cancelRequested FROM InventoryJobs WITH (UPDLOCK) WHERE jobID = ?', (job_id,))
+                    if (await cursor.fetchone())[0]:
+                        return False
+                    await process_chunk(cursor, payload, start, count)
+                    await cursor.execute('''
+                        UPDATE InventoryJobs SET doneUnits = ?, heartbeatAt = GETUTCDATE()
+                        WHERE jobID = ?''', (start + count, job_id))
+                    return True
+
+                if not await database.run_in_transaction(run_chunk):
+                    await _finish(job_id, 'cancelled')
+                    return
+                done_units = start + count
+            await _finish(job_id, 'succeeded')
+        except asyncio.CancelledError:
+            # server shutting down: the job stays 'running' and is resumed once its heartbeat is stale
+            raise
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            await _finish(job_id, 'failed', str(e))
+
+
+async def resume_jobs():
+    """Start the queued jobs and the jobs left running by a process that died."""
+    # a dead owner can't honour a cancel request, so its cancelled jobs are finished here
+    async def finish_cancelled(cursor):
+        await cursor.execute('''
+            UPDATE InventoryJobs
+            SET status = 'cancelled', finishedAt = GETUTCDATE()
+            WHERE cancelRequested = 1
+              AND status = 'running' AND heartbeatAt < DATEADD(SECOND, -?, GETUTCDATE())''',
+            (STALE_AFTER_SECONDS,))
+    await database.run_in_transaction(finish_cancelled)
+
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('''
+            SELECT jobID FROM InventoryJobs
+            WHERE status = 'queued'
+               OR (status = 'running' AND heartbeatAt < DATEADD(SECOND, -?, GETUTCDATE()))''',
+            (STALE_AFTER_SECONDS,))
+        job_ids = [row[0] for row in await cursor.fetchall()]
+    job_ids = [job_id for job_id in job_ids if job_id not in _active]
+    for job_id in job_ids:
+        _start(job_id)
+    return job_ids
+
+
+async def resume_loop():
+    """
+    Resume orphaned jobs for as long as the server runs. A worker restarted within
+    STALE_AFTER_SECONDS of its last heartbeat finds its own jobs not stale yet; a
+    later check picks them up.
+    """
+    while True:
+        try:
+            resumed = await resume_jobs()
+            if resumed:
+                print(f"Resuming background jobs: {resumed}")
+        except Exception as e:
+            print(f"Error resuming background jobs: {e}")
+        await asyncio.sleep(RESUME_CHECK_SECONDS)
+
+
+async def get_job(job_id: int):
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('''
+            SELECT jobID, jobType, status, totalUnits, doneUnits, cancelRequested, error,
+                   createdAt, startedAt, finishedAt
+            FROM InventoryJobs WHERE jobID = ?''', (job_id,))
+        row = await cursor.fetchone()
+    if not row:
+        return None
+    return {
+        "jobID": row[0],
+        "jobType": row[1],
+        "status": row[2],
+        "totalUnits": row[3],
+        "doneUnits": row[4],
+        "progress": round(row[4] / row[3], 4) if row[3] else 1.0,
+        "cancelRequested": bool(row[5]),
+        "error": row[6],
+        "createdAt": row[7],
+        "startedAt": row[8],
+        "finishedAt": row[9],
+    }
+
+
+async def cancel_job(job_id: int) -> bool:
+    """Ask a job to stop after its current chunk; queued jobs and jobs whose owner died are cancelled at once."""
+    async def request_cancel(cursor):
+        await cursor.execute('''
+            UPDATE j
+            SET cancelRequested = 1,
+                status = CASE WHEN s.stopped = 1 THEN 'cancelled' ELSE j.status END,
+                finishedAt = CASE WHEN s.stopped = 1 THEN GETUTCDATE() ELSE j.finishedAt END
+            OUTPUT inserted.jobID
+            FROM InventoryJobs AS j
+            CROSS APPLY (SELECT CASE WHEN j.status = 'queued'
+                                       OR j.heartbeatAt < DATEADD(SECOND, -?, GETUTCDATE())
+                                     THEN 1 ELSE 0 END AS stopped) AS s
+            WHERE j.jobID = ? AND j.status IN ('queued', 'running')''', (STALE_AFTER_SECONDS, job_id))
+        return await cursor.fetchone() is not None
+    return await database.run_in_transaction(request_cancel)
@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import database
+
+# Results already loaded during the current request, keyed by (loader name, key).
+# RequestCacheMiddleware gives every request its own dict.
+_request_cache = contextvars.ContextVar("loader_request_cache", default=None)
+_MISSING = object()
+
+
+# DataLoader-style batching of point lookups: keys requested by all in-flight
+# requests within max_wait seconds (or until max_batch_size keys are queued)
+# are resolved together by one batch_fn(keys) call returning {key: value}.
+class BatchLoader:
+    def __init__(self, name: str, batch_fn, max_batch_size: int = 500, max_wait: float = 0.002):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = {}
+        self._timer = None
+
+    async def load(self, key):
+        """Return the value for key, or None when the batch query found no row for it."""
+        cache = _request_cache.get()
+        if cache is not None:
+            value = cache.get((self.name, key), _MISSING)
+            if value is not _MISSING:
+                return value
+
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = loop.create_future()
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._dispatch)
+
+        value = await asyncio.shield(future)
+        if cache is not None:
+            cache[(self.name, key)] = value
+        return value
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._resolve(batch))
+
+    async def _resolve(self, batch):
+        try:
+            values = await self.batch_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key))
+
+
+# Pure ASGI middleware giving each HTTP request a fresh loader cache
+class RequestCacheMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_cache.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_cache.reset(token)
+
+
+# Function to run one "WHERE column IN (...)" query for a batch of keys
+async def fetch_in(query: str, keys):
+    placeholders = ", ".join("?" for _ in keys)
+    async with database.unit_of_work() as cursor:
+        await cursor.execute(query.format(placeholders=placeholders), list(keys))
+        return await cursor.fetchall()
+
+
+async def _load_products(product_ids):
+    rows = await fetch_in('''select p.productID, p.productName, p.productDescription,
+            p.size, p.color, p.unitPrice,
+            p.minStockLevel, p.maxStockLevel,
+            count(pv.variantID) as 'available quantity'
+            from products as p
+            left join ProductVariants as pv
+            on p.productID = pv.productID
+            where p.isActive = 1 and pv.isAvailable = 1
+            and p.productID in ({placeholders})
+            group by p.productID, p.productName, p.productDescription, p.size, p.color, p.unitPrice, p.minStockLevel, p.maxStockLevel''',
+        product_ids)
+    return {
+        row[0]: {
+            "productName": row[1],
+            "productDescription": row[2],
+            "size": row[3],
+            "color": row[4],
+            "unitPrice": row[5],
+            "minStockLevel": row[6],
+            "maxStockLevel": row[7],
+            "available quantity": row[8],
+        }
+        for row in rows
+    }
+
+
+async def _load_vendors(vendor_ids):
+    rows = await fetch_in('''SELECT VendorID, VendorName, ContactNumber, ContactEmail, Building, Street,
+            Barangay, City, Country, Zipcode, CreatedAt, UpdatedAt, isActive
+            FROM Vendors WHERE VendorID IN ({placeholders})''',
+        vendor_ids)
+    return {
+        row[0]: {
+            "VendorID": row[0],
+            "VendorName": row[1],
+            "ContactNumber": row[2],
+            "ContactEmail": row[3],
+            "Building": row[4],
+            "Street": row[5],
+            "Barangay": row[6],
+            "City": row[7],
+            "Country": row[8],
+            "Zipcode": row[9],
+            "CreatedAt": row[10],
+            "UpdatedAt": row[11],
+            "isActive": bool(row[12]),
+        }
+        for row in rows
+    }
+
+
+async def _load_users(usernames):
+    rows = await fetch_in('''SELECT username, userPassword, userRole, isDisabled, firstName, lastName
+            FROM users WHERE username IN ({placeholders})''',
+        usernames)
+    # SQL Server compares usernames case-insensitively and ignores trailing spaces
+    by_name = {row[0].rstrip().lower(): row for row in rows}
+    return {username: by_name.get(username.rstrip().lower()) for username in usernames}
+
+
+# Loaders shared by every request in this process
+product_loader = BatchLoader("product", _load_products)
+vendor_loader = BatchLoader("vendor", _load_vendors)
+user_loader = BatchLoader("user", _load_users)
@@ -1,14 +1,41 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from routers.auth import router as auth_router
-from routers.vendor import router as vendor_router
-from routers.products import router as products_router
-from routers.orderdetails import router as orderdetails_router
-from routers.orders import router as orders_router
-from fastapi.staticfiles import StaticFiles
-from dotenv import load_dotenv
+# Imported first, so the startup timings below start with the process
+import startup
+
+with startup.timed("import fastapi"):
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse
+    from fastapi.staticfiles import StaticFiles
+    from dotenv import load_dotenv
+    import uvicorn
+
+with startup.timed("import routers"):
+    from routers.auth import router as auth_router
+    from routers.vendor import router as vendor_router
+    from routers.products import router as products_router
+    from routers.orderdetails import router as orderdetails_router
+    from routers.orders import router as orders_router
+    from routers.variants import router as variants_router
+    from routers.jobs import router as jobs_router
+    from routers.inventory import router as inventory_router
+    from routers.analytics import router as analytics_router
+    from routers import auth
+    from routers.products import UPLOAD_DIRECTORY
+
 import os
-import uvicorn
+import asyncio
+import archive
+import barcode_index
+import catalogue_replica
+import database
+import ims_client
+import invalidation
+import jobs
+import singleflight
+import stock_ledger
+from loaders import RequestCacheMiddleware
+
+startup.mark("imported")
 
 # Load environment variables
 load_dotenv()
@@ -20,8 +47,8 @@ PORT = int(os.getenv("PORT", 8001))
 # Initialize the FastAPI application
 app = FastAPI()
 
-# Serve static files for image uploads
-app.mount("/images_upload", StaticFiles(directory="images_upload"), name="images")
+# Serve static files for image uploads (the directory is created by the first upload)
+app.mount("/images_upload", StaticFiles(directory=UPLOAD_DIRECTORY, check_dir=False), name="images")
 
 # Add CORS middleware to allow requests from the React frontend (localhost:3000)
 origins = [
@@ -37,6 +64,9 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Give every request its own cache of rows resolved by the batching loaders
+app.add_middleware(RequestCacheMiddleware)
+
 # Include the authentication router
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 
@@ -52,11 +82,139 @@ app.include_router(orderdetails_router, prefix='/order-details', tags=["Order De
 # Include the orders router
 app.include_router(orders_router, prefix='/orders', tags=["Orders"])
 
+# Include the barcode scanner router
+app.include_router(variants_router, prefix='/variants', tags=["Variants"])
+
+# Include the background jobs router
+app.include_router(jobs_router, prefix='/jobs', tags=["Jobs"])
+
+# Include the inventory (stock levels and alerts) router
+app.include_router(inventory_router, prefix='/inventory', tags=["Inventory"])
+
+# Include the sales analytics router
+app.include_router(analytics_router, prefix='/analytics', tags=["Analytics"])
+
 # Add an API endpoint to serve some data (to match the React fetch URL)
 @app.get("/api/data")
 async def get_data():
     return {"data": "Sample data from FastAPI backend!"}
 
-# Run the FastAPI application
+# Report how many identical concurrent reads each coalesced query absorbed
+@app.get("/metrics/singleflight")
+async def get_singleflight_metrics():
+    return singleflight.group.stats()
+
+# Report the size and freshness of this worker's catalogue replica
+@app.get("/metrics/catalogue-replica")
+async def get_catalogue_replica_metrics():
+    return catalogue_replica.replica.stats()
+
+# Liveness: the worker is up and its event loop answers
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: the pool, the caches and the IMS client are warm (503 until they are)
+@app.get("/readyz")
+async def readyz():
+    return JSONResponse(status_code=200 if startup.ready() else 503,
+                        content={"ready": startup.ready(), "components": startup.components})
+
+# Report the import, startup and warm-up timings of this worker
+@app.get("/metrics/startup")
+async def get_startup_metrics():
+    return startup.stats()
+
+# Join the invalidation bus first, so changes made by the other workers while the caches load are not missed
+@app.on_event("startup")
+async def join_invalidation_bus():
+    await invalidation.start_bus()
+
+# Function to open the pool and create the default user (serve.py creates it once, before it starts the workers)
+async def warm_pool():
+    if os.getenv("STARTUP_DONE") == "1":
+        async with database.unit_of_work() as cursor:
+            await cursor.execute("SELECT 1")
+    else:
+        await auth.create_default_user()
+
+# Function to load the catalogue replica behind the product reads, then keep it following the change feed
+async def warm_catalogue_replica():
+    await catalogue_replica.replica.load()
+    app.state.catalogue_refresh = asyncio.ensure_future(catalogue_replica.replica.refresh_loop())
+
+# Warm up in the background, so the worker accepts connections at once; until a cache
+# is loaded its reads go to the database (scans one read per unseen barcode)
+@app.on_event("startup")
+async def start_warm_up():
+    app.state.catalogue_refresh = None
+    app.state.warm_up = [
+        startup.warm_up("pool", warm_pool),
+        startup.warm_up("barcode_index", barcode_index.index.load),
+        startup.warm_up("catalogue_replica", warm_catalogue_replica),
+        startup.warm_up("ims_client", ims_client.warm_up),
+    ]
+
+# With several workers (serve.py) only the one holding this lock runs the maintenance work below
+MAINTENANCE_LOCK = os.path.join(invalidation.BUS_DIRECTORY, "maintenance.lock")
+
+# Function to take the maintenance lock for the life of this process, if no other worker holds it
+def hold_maintenance_lock() -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        # no fcntl (Windows): a single process runs everything
+        return True
+    os.makedirs(os.path.dirname(MAINTENANCE_LOCK), exist_ok=True)
+    handle = open(MAINTENANCE_LOCK, "w")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    # released by the operating system when the process exits; a restarted worker takes it over
+    app.state.maintenance_lock = handle
+    return True
+
+@app.on_event("startup")
+async def elect_maintenance_worker():
+    app.state.runs_maintenance = hold_maintenance_lock()
+    app.state.maintenance_tasks = []
+
+# Keep picking up the inventory jobs left unfinished by a stopped or crashed worker
+@app.on_event("startup")
+async def start_resuming_jobs():
+    if app.state.runs_maintenance:
+        app.state.maintenance_tasks.append(asyncio.ensure_future(jobs.resume_loop()))
+
+# Fold the stock ledger into periodic snapshots for the as-of queries
+@app.on_event("startup")
+async def start_stock_snapshots():
+    if app.state.runs_maintenance:
+        app.state.maintenance_tasks.append(asyncio.ensure_future(stock_ledger.snapshot_loop()))
+
+# Move closed orders, consumed variants and inactive products to the archive tables
+@app.on_event("startup")
+async def start_archiving():
+    if app.state.runs_maintenance:
+        app.state.maintenance_tasks.append(asyncio.ensure_future(archive.archive_loop()))
+
+# The worker accepts connections from here on; /readyz tells when it is warm
+@app.on_event("startup")
+async def mark_started():
+    startup.mark("started")
+
+# Close the pooled database connections when the server stops
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in app.state.maintenance_tasks + app.state.warm_up:
+        task.cancel()
+    if app.state.catalogue_refresh is not None:
+        app.state.catalogue_refresh.cancel()
+    await ims_client.close()
+    await invalidation.stop_bus()
+    await database.close_pool()
+
+# Run the FastAPI application (development server; serve.py runs it in production)
 if __name__ == "__main__":
     uvicorn.run("main:app", host=HOST, port=PORT, reload=True)
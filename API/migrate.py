@@ -0,0 +1,64 @@
+import asyncio
+import os
+import re
+import database
+import product_groups
+
+# Directory holding the numbered .sql migration scripts
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Scripts are split into batches on "GO" lines, like in SSMS / sqlcmd
+BATCH_SEPARATOR = re.compile(r"^\s*GO\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+# Function to list the migration scripts in the order they must run
+def list_migrations():
+    return sorted(name for name in os.listdir(MIGRATIONS_DIRECTORY) if name.endswith(".sql"))
+
+
+# Function to split a migration script into executable batches
+def split_batches(script: str):
+    return [batch.strip() for batch in BATCH_SEPARATOR.split(script) if batch.strip()]
+
+
+async def apply_migrations():
+    """Apply every migration script that has not been recorded in SchemaMigrations yet."""
+    conn = await database.get_db_connection()
+    cursor = await conn.cursor()
+    try:
+        await cursor.execute('''
+            IF OBJECT_ID('SchemaMigrations') IS NULL
+                CREATE TABLE SchemaMigrations (
+                    migrationName NVARCHAR(255) NOT NULL PRIMARY KEY,
+                    appliedAt DATETIME NOT NULL DEFAULT GETUTCDATE()
+                )''')
+        await cursor.execute('SELECT migrationName FROM SchemaMigrations')
+        applied = {row[0] for row in await cursor.fetchall()}
+
+        for name in list_migrations():
+            if name in applied:
+                continue
+            with open(os.path.join(MIGRATIONS_DIRECTORY, name), encoding="utf-8") as file:
+                script = file.read()
+            print(f"Applying migration {name}")
+            for batch in split_batches(script):
+                await cursor.execute(batch)
+            await cursor.execute('INSERT INTO SchemaMigrations (migrationName) VALUES (?)', (name,))
+
+        # group hashes written by SQL (migration 003) are recomputed the way product_groups.py computes them
+        await cursor.execute('BEGIN TRANSACTION')
+        try:
+            rehashed = await product_groups.rehash_groups(cursor)
+            await cursor.execute('COMMIT TRANSACTION')
+        except Exception:
+            await cursor.execute('IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION')
+            raise
+        if rehashed:
+            print(f"Rehashed or merged {rehashed} product group(s)")
+    finally:
+        await cursor.close()
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(apply_migrations())
@@ -0,0 +1,20 @@
+-- Reserve specific variant rows for an order at confirm time.
+-- A variant is free when isAvailable = 1 AND reservedOrderID IS NULL.
+IF COL_LENGTH('ProductVariants', 'reservedOrderID') IS NULL
+    ALTER TABLE ProductVariants ADD reservedOrderID INT NULL;
+GO
+
+-- Delivery and release only ever touch the rows held by one order
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductVariants_reservedOrderID')
+    CREATE INDEX IX_ProductVariants_reservedOrderID
+        ON ProductVariants (reservedOrderID)
+        INCLUDE (isAvailable, productID, barcode, productCode)
+        WHERE reservedOrderID IS NOT NULL;
+GO
+
+-- Confirmation picks the lowest free variantIDs of each product
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductVariants_free')
+    CREATE INDEX IX_ProductVariants_free
+        ON ProductVariants (productID, variantID)
+        WHERE isAvailable = 1 AND reservedOrderID IS NULL;
+GO
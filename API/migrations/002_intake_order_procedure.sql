@@ -0,0 +1,63 @@
+-- Order intake from IMS in one round-trip: product and vendor lookup,
+-- customer upsert and the order header/detail inserts run server-side.
+CREATE OR ALTER PROCEDURE dbo.usp_IntakeOrder
+    @orderID INT,
+    @vendorID INT,
+    @customerID INT,
+    @customerName NVARCHAR(255),
+    @warehouseName NVARCHAR(255),
+    @warehouseAddress NVARCHAR(255),
+    @productName NVARCHAR(255),
+    @productDescription NVARCHAR(MAX),
+    @size NVARCHAR(50),
+    @color NVARCHAR(50),
+    @category NVARCHAR(50),
+    @quantity INT,
+    @orderDate DATE,
+    @expectedDate DATE,
+    @statusDate DATETIME
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @productID INT = (
+        SELECT TOP 1 productID FROM Products
+        WHERE productName = @productName AND productDescription = @productDescription
+          AND size = @size AND color = @color AND category = @category);
+
+    -- Unknown product: nothing is written, the caller answers 404
+    IF @productID IS NULL
+    BEGIN
+        SELECT CAST(NULL AS INT) AS productID, CAST(NULL AS INT) AS customerID,
+               CAST(NULL AS NVARCHAR(255)) AS vendorName, CAST(0 AS BIT) AS vendorActive;
+        RETURN;
+    END
+
+    -- Customer upsert; HOLDLOCK keeps two concurrent intakes from both inserting
+    DECLARE @created TABLE (customerID INT);
+    MERGE Customers WITH (HOLDLOCK) AS target
+    USING (SELECT @customerID AS customerID) AS source
+        ON target.customerID = source.customerID
+    WHEN NOT MATCHED THEN
+        INSERT (customerName, customerWarehouseName, customerAddress)
+        VALUES (@customerName, @warehouseName, @warehouseAddress)
+    OUTPUT inserted.customerID INTO @created;
+
+    SET @customerID = COALESCE((SELECT customerID FROM @created), @customerID);
+
+    -- IMS owns the order numbers. IDENTITY_INSERT set inside a procedure is
+    -- reverted when the procedure returns, so the session never keeps it on.
+    SET IDENTITY_INSERT dbo.purchaseOrders ON;
+    INSERT INTO purchaseOrders (orderID, vendorID, customerID, orderDate, orderStatus, statusDate)
+    VALUES (@orderID, @vendorID, @customerID, @orderDate, 'Pending', @statusDate);
+    SET IDENTITY_INSERT dbo.purchaseOrders OFF;
+
+    INSERT INTO purchaseOrderDetails (orderID, productID, orderQuantity, expectedDate)
+    VALUES (@orderID, @productID, @quantity, @expectedDate);
+
+    SELECT @productID AS productID, @customerID AS customerID,
+           v.VendorName AS vendorName, CAST(ISNULL(v.isActive, 0) AS BIT) AS vendorActive
+    FROM (SELECT 1 AS one) AS anchor
+    LEFT JOIN Vendors AS v ON v.VendorID = @vendorID;
+END
+GO
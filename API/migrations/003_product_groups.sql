@@ -0,0 +1,132 @@
+-- Product groups: one row per normalized (productName, productDescription, category).
+-- Products of every size of a shoe share a productGroupID, so the endpoints
+-- look them up through a narrow integer index instead of matching long text
+-- columns and float unit prices.
+--
+-- groupHash = SHA2_256 over the UTF-16 text  name + NCHAR(31) + description + NCHAR(31) + category
+-- nameHash  = SHA2_256 over the UTF-16 text  name + NCHAR(31) + category
+-- where every part is LOWER(LTRIM(RTRIM(...))). SQL Server's LOWER folds some characters
+-- differently from Python's str.lower(), so migrate.py recomputes these hashes with
+-- product_groups.rehash_groups() afterwards; product_groups.py is the one definition.
+IF OBJECT_ID('ProductGroups') IS NULL
+    CREATE TABLE ProductGroups (
+        productGroupID INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+        groupHash BINARY(32) NOT NULL,
+        nameHash BINARY(32) NOT NULL,
+        productName NVARCHAR(255) NOT NULL,
+        productDescription NVARCHAR(MAX) NULL,
+        category NVARCHAR(50) NOT NULL,
+        createdAt DATETIME NOT NULL DEFAULT GETUTCDATE()
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_ProductGroups_groupHash')
+    CREATE UNIQUE INDEX UX_ProductGroups_groupHash ON ProductGroups (groupHash);
+GO
+
+-- Lookups that only know the name and category (size pickers, size soft-delete)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductGroups_nameHash')
+    CREATE INDEX IX_ProductGroups_nameHash ON ProductGroups (nameHash);
+GO
+
+IF COL_LENGTH('Products', 'productGroupID') IS NULL
+    ALTER TABLE Products ADD productGroupID INT NULL
+        CONSTRAINT FK_Products_ProductGroups REFERENCES ProductGroups (productGroupID);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Products_productGroupID')
+    CREATE INDEX IX_Products_productGroupID
+        ON Products (productGroupID, size)
+        INCLUDE (isActive, currentStock, unitPrice, color);
+GO
+
+-- Backfill the groups of the existing products
+WITH hashed AS (
+    SELECT p.productName, p.productDescription, p.category,
+        HASHBYTES('SHA2_256',
+            CAST(LOWER(LTRIM(RTRIM(p.productName))) AS NVARCHAR(MAX)) + NCHAR(31)
+            + CAST(LOWER(LTRIM(RTRIM(ISNULL(p.productDescription, N'')))) AS NVARCHAR(MAX)) + NCHAR(31)
+            + CAST(LOWER(LTRIM(RTRIM(p.category))) AS NVARCHAR(MAX))) AS groupHash,
+        HASHBYTES('SHA2_256',
+            CAST(LOWER(LTRIM(RTRIM(p.productName))) AS NVARCHAR(MAX)) + NCHAR(31)
+            + CAST(LOWER(LTRIM(RTRIM(p.category))) AS NVARCHAR(MAX))) AS nameHash
+    FROM Products AS p
+    WHERE p.productGroupID IS NULL
+)
+INSERT INTO ProductGroups (groupHash, nameHash, productName, productDescription, category)
+SELECT h.groupHash, MIN(h.nameHash), MIN(h.productName), MIN(h.productDescription), MIN(h.category)
+FROM hashed AS h
+WHERE NOT EXISTS (SELECT 1 FROM ProductGroups AS g WHERE g.groupHash = h.groupHash)
+GROUP BY h.groupHash;
+GO
+
+UPDATE p
+SET p.productGroupID = g.productGroupID
+FROM Products AS p
+JOIN ProductGroups AS g
+    ON g.groupHash = HASHBYTES('SHA2_256',
+        CAST(LOWER(LTRIM(RTRIM(p.productName))) AS NVARCHAR(MAX)) + NCHAR(31)
+        + CAST(LOWER(LTRIM(RTRIM(ISNULL(p.productDescription, N'')))) AS NVARCHAR(MAX)) + NCHAR(31)
+        + CAST(LOWER(LTRIM(RTRIM(p.category))) AS NVARCHAR(MAX)))
+WHERE p.productGroupID IS NULL;
+GO
+
+-- Order intake finds the product through its group instead of five text columns
+CREATE OR ALTER PROCEDURE dbo.usp_IntakeOrder
+    @orderID INT,
+    @vendorID INT,
+    @customerID INT,
+    @customerName NVARCHAR(255),
+    @warehouseName NVARCHAR(255),
+    @warehouseAddress NVARCHAR(255),
+    @productGroupID INT,
+    @size NVARCHAR(50),
+    @color NVARCHAR(50),
+    @quantity INT,
+    @orderDate DATE,
+    @expectedDate DATE,
+    @statusDate DATETIME
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @productID INT = (
+        SELECT TOP 1 productID FROM Products
+        WHERE productGroupID = @productGroupID AND size = @size AND color = @color);
+
+    -- Unknown product: nothing is written, the caller answers 404
+    IF @productID IS NULL
+    BEGIN
+        SELECT CAST(NULL AS INT) AS productID, CAST(NULL AS INT) AS customerID,
+               CAST(NULL AS NVARCHAR(255)) AS vendorName, CAST(0 AS BIT) AS vendorActive;
+        RETURN;
+    END
+
+    -- Customer upsert; HOLDLOCK keeps two concurrent intakes from both inserting
+    DECLARE @created TABLE (customerID INT);
+    MERGE Customers WITH (HOLDLOCK) AS target
+    USING (SELECT @customerID AS customerID) AS source
+        ON target.customerID = source.customerID
+    WHEN NOT MATCHED THEN
+        INSERT (customerName, customerWarehouseName, customerAddress)
+        VALUES (@customerName, @warehouseName, @warehouseAddress)
+    OUTPUT inserted.customerID INTO @created;
+
+    SET @customerID = COALESCE((SELECT customerID FROM @created), @customerID);
+
+    -- IMS owns the order numbers. IDENTITY_INSERT set inside a procedure is
+    -- reverted when the procedure returns, so the session never keeps it on.
+    SET IDENTITY_INSERT dbo.purchaseOrders ON;
+    INSERT INTO purchaseOrders (orderID, vendorID, customerID, orderDate, orderStatus, statusDate)
+    VALUES (@orderID, @vendorID, @customerID, @orderDate, 'Pending', @statusDate);
+    SET IDENTITY_INSERT dbo.purchaseOrders OFF;
+
+    INSERT INTO purchaseOrderDetails (orderID, productID, orderQuantity, expectedDate)
+    VALUES (@orderID, @productID, @quantity, @expectedDate);
+
+    SELECT @productID AS productID, @customerID AS customerID,
+           v.VendorName AS vendorName, CAST(ISNULL(v.isActive, 0) AS BIT) AS vendorActive
+    FROM (SELECT 1 AS one) AS anchor
+    LEFT JOIN Vendors AS v ON v.VendorID = @vendorID;
+END
+GO
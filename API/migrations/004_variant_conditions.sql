@@ -0,0 +1,18 @@
+-- Condition flags set by POST /variants/condition. A flagged variant is no
+-- longer available and no longer counted in Products.currentStock.
+IF COL_LENGTH('ProductVariants', 'isDamaged') IS NULL
+    ALTER TABLE ProductVariants ADD isDamaged BIT NOT NULL CONSTRAINT DF_ProductVariants_isDamaged DEFAULT 0;
+GO
+
+IF COL_LENGTH('ProductVariants', 'isWrongItem') IS NULL
+    ALTER TABLE ProductVariants ADD isWrongItem BIT NOT NULL CONSTRAINT DF_ProductVariants_isWrongItem DEFAULT 0;
+GO
+
+IF COL_LENGTH('ProductVariants', 'isReturned') IS NULL
+    ALTER TABLE ProductVariants ADD isReturned BIT NOT NULL CONSTRAINT DF_ProductVariants_isReturned DEFAULT 0;
+GO
+
+-- Batches join the scanned codes against barcode
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductVariants_barcode')
+    CREATE INDEX IX_ProductVariants_barcode ON ProductVariants (barcode) INCLUDE (productID, isAvailable);
+GO
@@ -0,0 +1,25 @@
+-- Background inventory jobs (jobs.py). Progress is committed together with
+-- every chunk, so a job picked up again after a restart continues from doneUnits.
+IF OBJECT_ID('InventoryJobs') IS NULL
+    CREATE TABLE InventoryJobs (
+        jobID INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+        jobType NVARCHAR(50) NOT NULL,
+        payload NVARCHAR(MAX) NOT NULL,
+        status NVARCHAR(20) NOT NULL DEFAULT 'queued',
+        totalUnits INT NOT NULL,
+        doneUnits INT NOT NULL DEFAULT 0,
+        cancelRequested BIT NOT NULL DEFAULT 0,
+        error NVARCHAR(MAX) NULL,
+        createdAt DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        startedAt DATETIME NULL,
+        finishedAt DATETIME NULL,
+        heartbeatAt DATETIME NULL
+    );
+GO
+
+-- Startup looks for unfinished jobs
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_InventoryJobs_unfinished')
+    CREATE INDEX IX_InventoryJobs_unfinished
+        ON InventoryJobs (status, heartbeatAt)
+        WHERE status IN ('queued', 'running');
+GO
@@ -0,0 +1,52 @@
+-- Stock levels kept per product by stock_alerts.py. availableCount is the number
+-- of free variants (available and not reserved); every stock-changing write
+-- refreshes the products it touched, so low-stock reads never scan the catalogue.
+IF OBJECT_ID('ProductStockLevels') IS NULL
+    CREATE TABLE ProductStockLevels (
+        productID INT NOT NULL PRIMARY KEY
+            CONSTRAINT FK_ProductStockLevels_Products REFERENCES Products (productID),
+        availableCount INT NOT NULL,
+        stockState VARCHAR(10) NOT NULL,  -- 'low', 'ok' or 'over'
+        updatedAt DATETIME NOT NULL DEFAULT GETUTCDATE()
+    );
+GO
+
+-- /inventory/low-stock reads only the products currently below minStockLevel
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductStockLevels_low')
+    CREATE INDEX IX_ProductStockLevels_low
+        ON ProductStockLevels (productID) INCLUDE (availableCount)
+        WHERE stockState = 'low';
+GO
+
+-- One row per threshold crossing; alertID doubles as the event-stream id
+IF OBJECT_ID('StockAlerts') IS NULL
+    CREATE TABLE StockAlerts (
+        alertID INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+        productID INT NOT NULL,
+        alertType VARCHAR(20) NOT NULL,  -- 'lowStock', 'overStock' or 'backToNormal'
+        availableCount INT NOT NULL,
+        minStockLevel INT NULL,
+        maxStockLevel INT NULL,
+        createdAt DATETIME NOT NULL DEFAULT GETUTCDATE()
+    );
+GO
+
+-- Free variants are counted per product
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductVariants_free')
+    CREATE INDEX IX_ProductVariants_free
+        ON ProductVariants (productID)
+        WHERE isAvailable = 1 AND reservedOrderID IS NULL;
+GO
+
+-- Starting levels of the existing products (no alerts are raised for them)
+INSERT INTO ProductStockLevels (productID, availableCount, stockState)
+SELECT p.productID, ISNULL(f.freeCount, 0),
+    CASE WHEN p.isActive = 1 AND ISNULL(f.freeCount, 0) < p.minStockLevel THEN 'low'
+         WHEN p.isActive = 1 AND ISNULL(f.freeCount, 0) > p.maxStockLevel THEN 'over'
+         ELSE 'ok' END
+FROM Products AS p
+LEFT JOIN (SELECT productID, COUNT(*) AS freeCount FROM ProductVariants
+           WHERE isAvailable = 1 AND reservedOrderID IS NULL
+           GROUP BY productID) AS f ON f.productID = p.productID
+WHERE NOT EXISTS (SELECT 1 FROM ProductStockLevels AS l WHERE l.productID = p.productID);
+GO
@@ -0,0 +1,20 @@
+-- Sales rollup maintained by analytics.py: one row per order day, category,
+-- size and vendor. An order is counted in once, when it first reaches
+-- Delivered or Received (purchaseOrders.rolledUpAt marks it), so analytics
+-- ranges are read from here instead of joining every order line.
+IF OBJECT_ID('SalesRollup') IS NULL
+    CREATE TABLE SalesRollup (
+        salesDate DATE NOT NULL,
+        category NVARCHAR(50) NOT NULL,
+        size NVARCHAR(50) NOT NULL,
+        vendorID INT NOT NULL,  -- 0 for orders without a vendor (orders pushed by IMS)
+        units INT NOT NULL,
+        revenue DECIMAL(18, 2) NOT NULL,
+        orderLines INT NOT NULL,
+        CONSTRAINT PK_SalesRollup PRIMARY KEY CLUSTERED (salesDate, category, size, vendorID)
+    );
+GO
+
+IF COL_LENGTH('purchaseOrders', 'rolledUpAt') IS NULL
+    ALTER TABLE purchaseOrders ADD rolledUpAt DATETIME NULL;
+GO
@@ -0,0 +1,91 @@
+-- Order-time price snapshot. Every order line keeps the unit price it was
+-- ordered at and its line total, so revenue and order totals are read from the
+-- order tables and no longer change when a product is repriced.
+IF COL_LENGTH('purchaseOrderDetails', 'unitPrice') IS NULL
+    ALTER TABLE purchaseOrderDetails ADD unitPrice DECIMAL(18, 2) NULL;
+GO
+
+IF COL_LENGTH('purchaseOrderDetails', 'lineTotal') IS NULL
+    ALTER TABLE purchaseOrderDetails ADD lineTotal AS (CAST(orderQuantity * unitPrice AS DECIMAL(18, 2))) PERSISTED;
+GO
+
+-- Existing lines get the current price, in batches to keep the log small. Lines
+-- of products without a price stay NULL; matching them would update the same
+-- rows on every pass and the loop would never end.
+WHILE 1 = 1
+BEGIN
+    UPDATE TOP (50000) pod
+    SET unitPrice = p.unitPrice
+    FROM purchaseOrderDetails AS pod
+    JOIN Products AS p ON p.productID = pod.productID
+    WHERE pod.unitPrice IS NULL AND p.unitPrice IS NOT NULL;
+    IF @@ROWCOUNT = 0 BREAK;
+END
+GO
+
+-- Revenue totals read the lines of an order without touching the base rows
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_purchaseOrderDetails_orderID')
+    CREATE INDEX IX_purchaseOrderDetails_orderID
+        ON purchaseOrderDetails (orderID) INCLUDE (productID, orderQuantity, lineTotal);
+GO
+
+-- Order intake stores the price of the product with the line
+CREATE OR ALTER PROCEDURE dbo.usp_IntakeOrder
+    @orderID INT,
+    @vendorID INT,
+    @customerID INT,
+    @customerName NVARCHAR(255),
+    @warehouseName NVARCHAR(255),
+    @warehouseAddress NVARCHAR(255),
+    @productGroupID INT,
+    @size NVARCHAR(50),
+    @color NVARCHAR(50),
+    @quantity INT,
+    @orderDate DATE,
+    @expectedDate DATE,
+    @statusDate DATETIME
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @productID INT, @unitPrice DECIMAL(18, 2);
+    SELECT TOP 1 @productID = productID, @unitPrice = unitPrice FROM Products
+    WHERE productGroupID = @productGroupID AND size = @size AND color = @color;
+
+    -- Unknown product: nothing is written, the caller answers 404
+    IF @productID IS NULL
+    BEGIN
+        SELECT CAST(NULL AS INT) AS productID, CAST(NULL AS INT) AS customerID,
+               CAST(NULL AS NVARCHAR(255)) AS vendorName, CAST(0 AS BIT) AS vendorActive;
+        RETURN;
+    END
+
+    -- Customer upsert; HOLDLOCK keeps two concurrent intakes from both inserting
+    DECLARE @created TABLE (customerID INT);
+    MERGE Customers WITH (HOLDLOCK) AS target
+    USING (SELECT @customerID AS customerID) AS source
+        ON target.customerID = source.customerID
+    WHEN NOT MATCHED THEN
+        INSERT (customerName, customerWarehouseName, customerAddress)
+        VALUES (@customerName, @warehouseName, @warehouseAddress)
+    OUTPUT inserted.customerID INTO @created;
+
+    SET @customerID = COALESCE((SELECT customerID FROM @created), @customerID);
+
+    -- IMS owns the order numbers. IDENTITY_INSERT set inside a procedure is
+    -- reverted when the procedure returns, so the session never keeps it on.
+    SET IDENTITY_INSERT dbo.purchaseOrders ON;
+    INSERT INTO purchaseOrders (orderID, vendorID, customerID, orderDate, orderStatus, statusDate)
+    VALUES (@orderID, @vendorID, @customerID, @orderDate, 'Pending', @statusDate);
+    SET IDENTITY_INSERT dbo.purchaseOrders OFF;
+
+    -- the line keeps the price it was ordered at
+    INSERT INTO purchaseOrderDetails (orderID, productID, orderQuantity, expectedDate, unitPrice)
+    VALUES (@orderID, @productID, @quantity, @expectedDate, @unitPrice);
+
+    SELECT @productID AS productID, @customerID AS customerID,
+           v.VendorName AS vendorName, CAST(ISNULL(v.isActive, 0) AS BIT) AS vendorActive
+    FROM (SELECT 1 AS one) AS anchor
+    LEFT JOIN Vendors AS v ON v.VendorID = @vendorID;
+END
+GO
@@ -0,0 +1,56 @@
+-- Append-only stock ledger (stock_ledger.py). Every change to the units on hand
+-- (available variants) of a product is one StockMovements row; rows are never
+-- updated or deleted. StockSnapshots periodically fold the ledger into per-product
+-- totals, so an as-of query reads one snapshot plus the movements after it.
+IF OBJECT_ID('StockMovements') IS NULL
+    CREATE TABLE StockMovements (
+        movementID BIGINT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+        productID INT NOT NULL,
+        movementType VARCHAR(20) NOT NULL,  -- receipt, delivery, damaged, wrongItem, returned, softDelete
+        quantity INT NOT NULL,              -- signed change of the units on hand
+        referenceID INT NULL,               -- orderID of deliveries
+        createdAt DATETIME2(3) NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_StockMovements_createdAt')
+    CREATE INDEX IX_StockMovements_createdAt ON StockMovements (createdAt) INCLUDE (productID, quantity);
+GO
+
+IF OBJECT_ID('StockSnapshots') IS NULL
+    CREATE TABLE StockSnapshots (
+        snapshotID INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+        takenAt DATETIME2(3) NOT NULL,
+        lastMovementID BIGINT NOT NULL  -- the snapshot includes every movement up to this one
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_StockSnapshots_takenAt')
+    CREATE UNIQUE INDEX IX_StockSnapshots_takenAt ON StockSnapshots (takenAt, snapshotID) INCLUDE (lastMovementID);
+GO
+
+-- Only products with units on hand are stored
+IF OBJECT_ID('StockSnapshotLines') IS NULL
+    CREATE TABLE StockSnapshotLines (
+        snapshotID INT NOT NULL CONSTRAINT FK_StockSnapshotLines_StockSnapshots REFERENCES StockSnapshots (snapshotID),
+        productID INT NOT NULL,
+        onHand INT NOT NULL,
+        CONSTRAINT PK_StockSnapshotLines PRIMARY KEY CLUSTERED (snapshotID, productID)
+    );
+GO
+
+-- The first snapshot is the stock on hand when the ledger starts
+IF NOT EXISTS (SELECT 1 FROM StockSnapshots)
+BEGIN
+    DECLARE @genesis TABLE (snapshotID INT);
+    INSERT INTO StockSnapshots (takenAt, lastMovementID)
+    OUTPUT inserted.snapshotID INTO @genesis
+    SELECT SYSUTCDATETIME(), ISNULL(MAX(movementID), 0) FROM StockMovements;
+
+    INSERT INTO StockSnapshotLines (snapshotID, productID, onHand)
+    SELECT (SELECT snapshotID FROM @genesis), productID, COUNT(*)
+    FROM ProductVariants
+    WHERE isAvailable = 1
+    GROUP BY productID;
+END
+GO
@@ -0,0 +1,119 @@
+-- Archive tier (archive.py). Inactive products, consumed variants and closed
+-- orders move out of the hot tables into twins with the same columns plus
+-- archivedAt. Each twin is cloned from its hot table; the UNION ALL drops the
+-- IDENTITY property and computed columns (lineTotal) become plain columns, so
+-- archived rows keep their values as they were. A column added to a hot table
+-- later must be added to its archive table too (archive.py refuses to run otherwise).
+IF OBJECT_ID('ProductsArchive') IS NULL
+    SELECT * INTO ProductsArchive
+    FROM (SELECT * FROM Products WHERE 1 = 0 UNION ALL SELECT * FROM Products WHERE 1 = 0) AS clone;
+GO
+
+IF OBJECT_ID('ProductVariantsArchive') IS NULL
+    SELECT * INTO ProductVariantsArchive
+    FROM (SELECT * FROM ProductVariants WHERE 1 = 0 UNION ALL SELECT * FROM ProductVariants WHERE 1 = 0) AS clone;
+GO
+
+IF OBJECT_ID('purchaseOrdersArchive') IS NULL
+    SELECT * INTO purchaseOrdersArchive
+    FROM (SELECT * FROM purchaseOrders WHERE 1 = 0 UNION ALL SELECT * FROM purchaseOrders WHERE 1 = 0) AS clone;
+GO
+
+IF OBJECT_ID('purchaseOrderDetailsArchive') IS NULL
+    SELECT * INTO purchaseOrderDetailsArchive
+    FROM (SELECT * FROM purchaseOrderDetails WHERE 1 = 0 UNION ALL SELECT * FROM purchaseOrderDetails WHERE 1 = 0) AS clone;
+GO
+
+IF COL_LENGTH('ProductsArchive', 'archivedAt') IS NULL
+    ALTER TABLE ProductsArchive ADD archivedAt DATETIME2(3) NOT NULL
+        CONSTRAINT DF_ProductsArchive_archivedAt DEFAULT SYSUTCDATETIME();
+GO
+
+IF COL_LENGTH('ProductVariantsArchive', 'archivedAt') IS NULL
+    ALTER TABLE ProductVariantsArchive ADD archivedAt DATETIME2(3) NOT NULL
+        CONSTRAINT DF_ProductVariantsArchive_archivedAt DEFAULT SYSUTCDATETIME();
+GO
+
+IF COL_LENGTH('purchaseOrdersArchive', 'archivedAt') IS NULL
+    ALTER TABLE purchaseOrdersArchive ADD archivedAt DATETIME2(3) NOT NULL
+        CONSTRAINT DF_purchaseOrdersArchive_archivedAt DEFAULT SYSUTCDATETIME();
+GO
+
+IF COL_LENGTH('purchaseOrderDetailsArchive', 'archivedAt') IS NULL
+    ALTER TABLE purchaseOrderDetailsArchive ADD archivedAt DATETIME2(3) NOT NULL
+        CONSTRAINT DF_purchaseOrderDetailsArchive_archivedAt DEFAULT SYSUTCDATETIME();
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.key_constraints WHERE name = 'PK_ProductsArchive')
+    ALTER TABLE ProductsArchive ADD CONSTRAINT PK_ProductsArchive PRIMARY KEY CLUSTERED (productID);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.key_constraints WHERE name = 'PK_ProductVariantsArchive')
+    ALTER TABLE ProductVariantsArchive ADD CONSTRAINT PK_ProductVariantsArchive PRIMARY KEY CLUSTERED (variantID);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.key_constraints WHERE name = 'PK_purchaseOrdersArchive')
+    ALTER TABLE purchaseOrdersArchive ADD CONSTRAINT PK_purchaseOrdersArchive PRIMARY KEY CLUSTERED (orderID);
+GO
+
+-- Archived lines are only ever read together with their order
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'CX_purchaseOrderDetailsArchive_orderID')
+    CREATE CLUSTERED INDEX CX_purchaseOrderDetailsArchive_orderID ON purchaseOrderDetailsArchive (orderID);
+GO
+
+-- Barcode lookups with include_archived
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductVariantsArchive_barcode')
+    CREATE INDEX IX_ProductVariantsArchive_barcode ON ProductVariantsArchive (barcode) INCLUDE (productID);
+GO
+
+-- Order lists by status and the demand history by order date
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_purchaseOrdersArchive_orderStatus')
+    CREATE INDEX IX_purchaseOrdersArchive_orderStatus ON purchaseOrdersArchive (orderStatus) INCLUDE (customerID);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_purchaseOrdersArchive_orderDate')
+    CREATE INDEX IX_purchaseOrdersArchive_orderDate ON purchaseOrdersArchive (orderDate) INCLUDE (orderStatus);
+GO
+
+-- The archiver looks for closed orders by status date
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_purchaseOrders_orderStatus_statusDate')
+    CREATE INDEX IX_purchaseOrders_orderStatus_statusDate ON purchaseOrders (orderStatus, statusDate) INCLUDE (rolledUpAt);
+GO
+
+-- Hot and archived rows together, for reads that ask for archived rows. A row is
+-- in exactly one of the two tables; isArchived tells which.
+CREATE OR ALTER VIEW AllProducts AS
+SELECT productID, productName, productDescription, size, color, category, unitPrice, image_path,
+       currentStock, minStockLevel, maxStockLevel, isActive, productGroupID, CAST(0 AS BIT) AS isArchived
+FROM Products
+UNION ALL
+SELECT productID, productName, productDescription, size, color, category, unitPrice, image_path,
+       currentStock, minStockLevel, maxStockLevel, isActive, productGroupID, CAST(1 AS BIT)
+FROM ProductsArchive;
+GO
+
+CREATE OR ALTER VIEW AllProductVariants AS
+SELECT variantID, barcode, productCode, productID, isAvailable, reservedOrderID,
+       isDamaged, isWrongItem, isReturned, CAST(0 AS BIT) AS isArchived
+FROM ProductVariants
+UNION ALL
+SELECT variantID, barcode, productCode, productID, isAvailable, reservedOrderID,
+       isDamaged, isWrongItem, isReturned, CAST(1 AS BIT)
+FROM ProductVariantsArchive;
+GO
+
+CREATE OR ALTER VIEW AllPurchaseOrders AS
+SELECT orderID, vendorID, customerID, orderDate, orderStatus, statusDate, rolledUpAt, CAST(0 AS BIT) AS isArchived
+FROM purchaseOrders
+UNION ALL
+SELECT orderID, vendorID, customerID, orderDate, orderStatus, statusDate, rolledUpAt, CAST(1 AS BIT)
+FROM purchaseOrdersArchive;
+GO
+
+CREATE OR ALTER VIEW AllPurchaseOrderDetails AS
+SELECT orderID, productID, orderQuantity, expectedDate, unitPrice, lineTotal, CAST(0 AS BIT) AS isArchived
+FROM purchaseOrderDetails
+UNION ALL
+SELECT orderID, productID, orderQuantity, expectedDate, unitPrice, lineTotal, CAST(1 AS BIT)
+FROM purchaseOrderDetailsArchive;
+GO
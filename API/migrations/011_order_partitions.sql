@@ -0,0 +1,232 @@
+-- Monthly partitions of purchaseOrders and purchaseOrderDetails (order_partitions.py).
+-- Both tables are partitioned on orderMonth, the first day of the month of
+-- orderDate (1900-01-01 for orders without one): a computed column on the order,
+-- stamped on every line when it is inserted. Range queries that filter orderMonth
+-- as well as orderDate only read the partitions of the months they cover, and
+-- old months are emptied with a partition TRUNCATE and merged away.
+--
+-- Every index of the two tables is rebuilt on the partition scheme (unique ones
+-- get orderMonth appended), so indexes must keep being created ON PS_OrderMonth (orderMonth).
+-- Partition truncation is not possible on a table referenced by a foreign key,
+-- so the foreign keys to purchaseOrders are dropped.
+
+-- One partition per month, from the first order (at most ten years back) to three months ahead
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'PF_OrderMonth')
+BEGIN
+    DECLARE @current DATE = DATEFROMPARTS(YEAR(GETDATE()), MONTH(GETDATE()), 1);
+    DECLARE @month DATE = (SELECT DATEFROMPARTS(YEAR(MIN(orderDate)), MONTH(MIN(orderDate)), 1) FROM purchaseOrders);
+    IF @month IS NULL OR @month > @current SET @month = @current;
+    IF @month < DATEADD(YEAR, -10, @current) SET @month = DATEADD(YEAR, -10, @current);
+
+    DECLARE @boundaries NVARCHAR(MAX) = N'';
+    WHILE @month <= DATEADD(MONTH, 3, @current)
+    BEGIN
+        SET @boundaries += CASE WHEN @boundaries = N'' THEN N'' ELSE N', ' END
+            + N'''' + CONVERT(NCHAR(8), @month, 112) + N'''';
+        SET @month = DATEADD(MONTH, 1, @month);
+    END
+    EXEC (N'CREATE PARTITION FUNCTION PF_OrderMonth (DATE) AS RANGE RIGHT FOR VALUES (' + @boundaries + N')');
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = 'PS_OrderMonth')
+    CREATE PARTITION SCHEME PS_OrderMonth AS PARTITION PF_OrderMonth ALL TO ([PRIMARY]);
+GO
+
+IF COL_LENGTH('purchaseOrders', 'orderMonth') IS NULL
+    ALTER TABLE purchaseOrders ADD orderMonth AS
+        (ISNULL(DATEFROMPARTS(YEAR(orderDate), MONTH(orderDate), 1), DATEFROMPARTS(1900, 1, 1))) PERSISTED NOT NULL;
+GO
+
+IF COL_LENGTH('purchaseOrderDetails', 'orderMonth') IS NULL
+    ALTER TABLE purchaseOrderDetails ADD orderMonth DATE NULL;
+GO
+
+-- Stamp the existing lines, in batches to keep the log small
+WHILE 1 = 1
+BEGIN
+    UPDATE TOP (50000) pod
+    SET orderMonth = po.orderMonth
+    FROM purchaseOrderDetails AS pod
+    JOIN purchaseOrders AS po ON po.orderID = pod.orderID
+    WHERE pod.orderMonth IS NULL;
+    IF @@ROWCOUNT = 0 BREAK;
+END
+GO
+
+-- Lines whose order is gone cannot be placed in a month
+UPDATE purchaseOrderDetails SET orderMonth = DATEFROMPARTS(1900, 1, 1) WHERE orderMonth IS NULL;
+GO
+
+ALTER TABLE purchaseOrderDetails ALTER COLUMN orderMonth DATE NOT NULL;
+GO
+
+-- The archive tables keep the month too
+IF COL_LENGTH('purchaseOrdersArchive', 'orderMonth') IS NULL
+    ALTER TABLE purchaseOrdersArchive ADD orderMonth DATE NULL;
+GO
+
+IF COL_LENGTH('purchaseOrderDetailsArchive', 'orderMonth') IS NULL
+    ALTER TABLE purchaseOrderDetailsArchive ADD orderMonth DATE NULL;
+GO
+
+DECLARE @sql NVARCHAR(MAX) = N'';
+SELECT @sql += N'ALTER TABLE ' + QUOTENAME(OBJECT_SCHEMA_NAME(parent_object_id)) + N'.'
+    + QUOTENAME(OBJECT_NAME(parent_object_id)) + N' DROP CONSTRAINT ' + QUOTENAME(name) + N';'
+FROM sys.foreign_keys
+WHERE referenced_object_id = OBJECT_ID('purchaseOrders');
+EXEC (@sql);
+GO
+
+-- Clustered on (orderMonth, orderID): the primary key of purchaseOrders, a new
+-- clustered index on purchaseOrderDetails (its primary key becomes nonclustered)
+DECLARE @scheme INT = (SELECT data_space_id FROM sys.partition_schemes WHERE name = 'PS_OrderMonth');
+DECLARE @table SYSNAME, @pk SYSNAME, @keys NVARCHAR(MAX), @sql NVARCHAR(MAX);
+DECLARE tables CURSOR LOCAL FAST_FORWARD FOR
+    SELECT name FROM (VALUES (N'purchaseOrders'), (N'purchaseOrderDetails')) AS t (name);
+OPEN tables;
+FETCH NEXT FROM tables INTO @table;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    SELECT @pk = NULL, @keys = NULL;
+    SELECT @pk = i.name,
+           @keys = (SELECT STRING_AGG(QUOTENAME(c.name), N', ') WITHIN GROUP (ORDER BY ic.key_ordinal)
+                    FROM sys.index_columns AS ic
+                    JOIN sys.columns AS c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+                    WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id AND c.name <> N'orderMonth')
+    FROM sys.indexes AS i
+    WHERE i.object_id = OBJECT_ID(@table) AND i.is_primary_key = 1 AND i.data_space_id <> @scheme;
+
+    IF @pk IS NOT NULL
+    BEGIN
+        SET @sql = N'ALTER TABLE ' + QUOTENAME(@table) + N' DROP CONSTRAINT ' + QUOTENAME(@pk) + N';';
+        EXEC (@sql);
+    END
+
+    IF @table = N'purchaseOrders'
+       AND NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('purchaseOrders') AND is_primary_key = 1)
+        ALTER TABLE purchaseOrders ADD CONSTRAINT PK_purchaseOrders
+            PRIMARY KEY CLUSTERED (orderMonth, orderID) ON PS_OrderMonth (orderMonth);
+
+    IF @table = N'purchaseOrderDetails'
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'CX_purchaseOrderDetails_orderMonth')
+            CREATE CLUSTERED INDEX CX_purchaseOrderDetails_orderMonth
+                ON purchaseOrderDetails (orderMonth, orderID) ON PS_OrderMonth (orderMonth);
+        IF @pk IS NOT NULL
+        BEGIN
+            SET @sql = N'ALTER TABLE purchaseOrderDetails ADD CONSTRAINT ' + QUOTENAME(@pk)
+                + N' PRIMARY KEY NONCLUSTERED (' + @keys + N', orderMonth) ON PS_OrderMonth (orderMonth);';
+            EXEC (@sql);
+        END
+    END
+    FETCH NEXT FROM tables INTO @table;
+END
+CLOSE tables;
+DEALLOCATE tables;
+GO
+
+-- Rebuild the remaining nonclustered indexes on the partition scheme
+DECLARE @scheme INT = (SELECT data_space_id FROM sys.partition_schemes WHERE name = 'PS_OrderMonth');
+DECLARE @sql NVARCHAR(MAX) = N'';
+SELECT @sql += N'CREATE ' + CASE WHEN i.is_unique = 1 THEN N'UNIQUE ' ELSE N'' END
+    + N'INDEX ' + QUOTENAME(i.name) + N' ON ' + QUOTENAME(OBJECT_NAME(i.object_id)) + N' ('
+    + (SELECT STRING_AGG(QUOTENAME(c.name) + CASE WHEN ic.is_descending_key = 1 THEN N' DESC' ELSE N'' END, N', ')
+              WITHIN GROUP (ORDER BY ic.key_ordinal)
+       FROM sys.index_columns AS ic
+       JOIN sys.columns AS c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+       WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id AND ic.is_included_column = 0)
+    + CASE WHEN i.is_unique = 1 AND NOT EXISTS (
+               SELECT 1 FROM sys.index_columns AS ic
+               JOIN sys.columns AS c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+               WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id
+                 AND ic.is_included_column = 0 AND c.name = N'orderMonth')
+           THEN N', [orderMonth]' ELSE N'' END
+    + N')'
+    + ISNULL(N' INCLUDE (' + (SELECT STRING_AGG(QUOTENAME(c.name), N', ')
+              FROM sys.index_columns AS ic
+              JOIN sys.columns AS c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+              WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id AND ic.is_included_column = 1) + N')', N'')
+    + ISNULL(N' WHERE ' + i.filter_definition, N'')
+    + N' WITH (DROP_EXISTING = ON) ON PS_OrderMonth (orderMonth);'
+FROM sys.indexes AS i
+WHERE i.object_id IN (OBJECT_ID('purchaseOrders'), OBJECT_ID('purchaseOrderDetails'))
+  AND i.type = 2 AND i.is_primary_key = 0 AND i.is_unique_constraint = 0
+  AND i.data_space_id <> @scheme;
+EXEC (@sql);
+GO
+
+-- Point lookups by order number (status changes, reservations) seek every partition's slice
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_purchaseOrders_orderID')
+    CREATE INDEX IX_purchaseOrders_orderID ON purchaseOrders (orderID)
+        INCLUDE (orderStatus, statusDate) ON PS_OrderMonth (orderMonth);
+GO
+
+-- The 30-day dashboards read one or two partitions of this index
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_purchaseOrders_orderDate')
+    CREATE INDEX IX_purchaseOrders_orderDate ON purchaseOrders (orderMonth, orderDate)
+        INCLUDE (orderStatus) ON PS_OrderMonth (orderMonth);
+GO
+
+-- Order intake stamps the month of the order on its line
+CREATE OR ALTER PROCEDURE dbo.usp_IntakeOrder
+    @orderID INT,
+    @vendorID INT,
+    @customerID INT,
+    @customerName NVARCHAR(255),
+    @warehouseName NVARCHAR(255),
+    @warehouseAddress NVARCHAR(255),
+    @productGroupID INT,
+    @size NVARCHAR(50),
+    @color NVARCHAR(50),
+    @quantity INT,
+    @orderDate DATE,
+    @expectedDate DATE,
+    @statusDate DATETIME
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @productID INT, @unitPrice DECIMAL(18, 2);
+    SELECT TOP 1 @productID = productID, @unitPrice = unitPrice FROM Products
+    WHERE productGroupID = @productGroupID AND size = @size AND color = @color;
+
+    -- Unknown product: nothing is written, the caller answers 404
+    IF @productID IS NULL
+    BEGIN
+        SELECT CAST(NULL AS INT) AS productID, CAST(NULL AS INT) AS customerID,
+               CAST(NULL AS NVARCHAR(255)) AS vendorName, CAST(0 AS BIT) AS vendorActive;
+        RETURN;
+    END
+
+    -- Customer upsert; HOLDLOCK keeps two concurrent intakes from both inserting
+    DECLARE @created TABLE (customerID INT);
+    MERGE Customers WITH (HOLDLOCK) AS target
+    USING (SELECT @customerID AS customerID) AS source
+        ON target.customerID = source.customerID
+    WHEN NOT MATCHED THEN
+        INSERT (customerName, customerWarehouseName, customerAddress)
+        VALUES (@customerName, @warehouseName, @warehouseAddress)
+    OUTPUT inserted.customerID INTO @created;
+
+    SET @customerID = COALESCE((SELECT customerID FROM @created), @customerID);
+
+    -- IMS owns the order numbers. IDENTITY_INSERT set inside a procedure is
+    -- reverted when the procedure returns, so the session never keeps it on.
+    DECLARE @order TABLE (orderMonth DATE);
+    SET IDENTITY_INSERT dbo.purchaseOrders ON;
+    INSERT INTO purchaseOrders (orderID, vendorID, customerID, orderDate, orderStatus, statusDate)
+    OUTPUT inserted.orderMonth INTO @order
+    VALUES (@orderID, @vendorID, @customerID, @orderDate, 'Pending', @statusDate);
+    SET IDENTITY_INSERT dbo.purchaseOrders OFF;
+
+    -- the line keeps the price it was ordered at
+    INSERT INTO purchaseOrderDetails (orderID, productID, orderQuantity, expectedDate, unitPrice, orderMonth)
+    SELECT @orderID, @productID, @quantity, @expectedDate, @unitPrice, orderMonth FROM @order;
+
+    SELECT @productID AS productID, @customerID AS customerID,
+           v.VendorName AS vendorName, CAST(ISNULL(v.isActive, 0) AS BIT) AS vendorActive
+    FROM (SELECT 1 AS one) AS anchor
+    LEFT JOIN Vendors AS v ON v.VendorID = @vendorID;
+END
+GO
@@ -0,0 +1,37 @@
+-- Change feed (change_feed.py). A rowversion column on Products and
+-- ProductVariants is bumped by every insert and update, from one counter for
+-- the whole database, so "rows with rowVersion above the client's token" is
+-- everything that changed since its last sync. The archive tables keep the
+-- last version a row had (as BINARY(8)), so a client that synced before a row
+-- was archived still learns about its last change.
+IF COL_LENGTH('Products', 'rowVersion') IS NULL
+    ALTER TABLE Products ADD rowVersion ROWVERSION NOT NULL;
+GO
+
+IF COL_LENGTH('ProductVariants', 'rowVersion') IS NULL
+    ALTER TABLE ProductVariants ADD rowVersion ROWVERSION NOT NULL;
+GO
+
+IF COL_LENGTH('ProductsArchive', 'rowVersion') IS NULL
+    ALTER TABLE ProductsArchive ADD rowVersion BINARY(8) NULL;
+GO
+
+IF COL_LENGTH('ProductVariantsArchive', 'rowVersion') IS NULL
+    ALTER TABLE ProductVariantsArchive ADD rowVersion BINARY(8) NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Products_rowVersion')
+    CREATE INDEX IX_Products_rowVersion ON Products (rowVersion);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductVariants_rowVersion')
+    CREATE INDEX IX_ProductVariants_rowVersion ON ProductVariants (rowVersion);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductsArchive_rowVersion')
+    CREATE INDEX IX_ProductsArchive_rowVersion ON ProductsArchive (rowVersion);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductVariantsArchive_rowVersion')
+    CREATE INDEX IX_ProductVariantsArchive_rowVersion ON ProductVariantsArchive (rowVersion);
+GO
@@ -0,0 +1,76 @@
+-- Order numbers stay unique after partitioning (011). The clustered key of
+-- purchaseOrders is (orderMonth, orderID) and IX_purchaseOrders_orderID is not
+-- unique, since a unique index not aligned on orderMonth would stop the sliding
+-- window from switching partitions out. IMS supplies orderID itself, so a
+-- replayed order with another orderDate would be inserted a second time (before
+-- 011 the primary key on orderID refused it): the intake now refuses an orderID that exists, hot or archived, with error 50001
+-- (the caller answers 409). UPDLOCK, HOLDLOCK keep two concurrent replays of the
+-- same order from both passing the check.
+CREATE OR ALTER PROCEDURE dbo.usp_IntakeOrder
+    @orderID INT,
+    @vendorID INT,
+    @customerID INT,
+    @customerName NVARCHAR(255),
+    @warehouseName NVARCHAR(255),
+    @warehouseAddress NVARCHAR(255),
+    @productGroupID INT,
+    @size NVARCHAR(50),
+    @color NVARCHAR(50),
+    @quantity INT,
+    @orderDate DATE,
+    @expectedDate DATE,
+    @statusDate DATETIME
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    IF EXISTS (SELECT 1 FROM purchaseOrders WITH (UPDLOCK, HOLDLOCK) WHERE orderID = @orderID)
+       OR EXISTS (SELECT 1 FROM purchaseOrdersArchive WHERE orderID = @orderID)
+    BEGIN
+        DECLARE @message NVARCHAR(200) = CONCAT(N'Order ', @orderID, N' already exists.');
+        THROW 50001, @message, 1;
+    END
+
+    DECLARE @productID INT, @unitPrice DECIMAL(18, 2);
+    SELECT TOP 1 @productID = productID, @unitPrice = unitPrice FROM Products
+    WHERE productGroupID = @productGroupID AND size = @size AND color = @color;
+
+    -- Unknown product: nothing is written, the caller answers 404
+    IF @productID IS NULL
+    BEGIN
+        SELECT CAST(NULL AS INT) AS productID, CAST(NULL AS INT) AS customerID,
+               CAST(NULL AS NVARCHAR(255)) AS vendorName, CAST(0 AS BIT) AS vendorActive;
+        RETURN;
+    END
+
+    -- Customer upsert; HOLDLOCK keeps two concurrent intakes from both inserting
+    DECLARE @created TABLE (customerID INT);
+    MERGE Customers WITH (HOLDLOCK) AS target
+    USING (SELECT @customerID AS customerID) AS source
+        ON target.customerID = source.customerID
+    WHEN NOT MATCHED THEN
+        INSERT (customerName, customerWarehouseName, customerAddress)
+        VALUES (@customerName, @warehouseName, @warehouseAddress)
+    OUTPUT inserted.customerID INTO @created;
+
+    SET @customerID = COALESCE((SELECT customerID FROM @created), @customerID);
+
+    -- IMS owns the order numbers. IDENTITY_INSERT set inside a procedure is
+    -- reverted when the procedure returns, so the session never keeps it on.
+    DECLARE @order TABLE (orderMonth DATE);
+    SET IDENTITY_INSERT dbo.purchaseOrders ON;
+    INSERT INTO purchaseOrders (orderID, vendorID, customerID, orderDate, orderStatus, statusDate)
+    OUTPUT inserted.orderMonth INTO @order
+    VALUES (@orderID, @vendorID, @customerID, @orderDate, 'Pending', @statusDate);
+    SET IDENTITY_INSERT dbo.purchaseOrders OFF;
+
+    -- the line keeps the price it was ordered at (NULL while the product has none)
+    INSERT INTO purchaseOrderDetails (orderID, productID, orderQuantity, expectedDate, unitPrice, orderMonth)
+    SELECT @orderID, @productID, @quantity, @expectedDate, @unitPrice, orderMonth FROM @order;
+
+    SELECT @productID AS productID, @customerID AS customerID,
+           v.VendorName AS vendorName, CAST(ISNULL(v.isActive, 0) AS BIT) AS vendorActive
+    FROM (SELECT 1 AS one) AS anchor
+    LEFT JOIN Vendors AS v ON v.VendorID = @vendorID;
+END
+GO
@@ -0,0 +1,132 @@
+# Sliding window over the monthly partitions of purchaseOrders and
+# purchaseOrderDetails (migration 011). Run this module once a month or more
+# often (e.g. nightly); it is safe to repeat:
+#
+#   cd API && python order_partitions.py [months to keep]
+#
+# It adds empty partitions for the coming months, so new orders never land in
+# a partition that has to be split later, and retires the months older than the
+# window: a month whose orders are all archivable (see archive.py) is copied to
+# the archive tables, its two partitions are truncated and its boundary merged
+# away. A month that still holds an open order stops the retirement there.
+import asyncio
+import sys
+from datetime import date
+import analytics
+import archive
+import database
+
+# Partitions kept ahead of the current month
+MONTHS_AHEAD = 3
+# Months kept in the hot tables, the current one included
+KEEP_MONTHS = 24
+
+PARTITION_FUNCTION = "PF_OrderMonth"
+PARTITION_SCHEME = "PS_OrderMonth"
+
+BOUNDARIES_SQL = '''
+SELECT CAST(rv.value AS DATE)
+FROM sys.partition_range_values AS rv
+JOIN sys.partition_functions AS pf ON pf.function_id = rv.function_id
+WHERE pf.name = ?
+ORDER BY rv.boundary_id
+'''
+
+# Lock the month and count what keeps it hot: open orders, sales not rolled up
+# yet and orders closed too recently
+RETIRE_CHECK_SQL = f'''
+SELECT $PARTITION.{PARTITION_FUNCTION}(?),
+       COUNT(*),
+       SUM(CASE WHEN orderStatus IN ({", ".join(f"'{status}'" for status in archive.CLOSED_STATUSES)})
+                 AND (rolledUpAt IS NOT NULL OR orderStatus NOT IN ({", ".join(f"'{status}'" for status in analytics.SALE_STATUSES)}))
+                 AND statusDate < ?
+                THEN 0 ELSE 1 END)
+FROM purchaseOrders WITH (UPDLOCK, HOLDLOCK)
+WHERE orderMonth = ?
+'''
+
+
+# Function to give the first day of the month n months after the given day's
+def add_months(day: date, months: int) -> date:
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+async def boundaries(cursor):
+    await cursor.execute(BOUNDARIES_SQL, (PARTITION_FUNCTION,))
+    return [row[0] for row in await cursor.fetchall()]
+
+
+async def add_future_partitions(months_ahead: int = MONTHS_AHEAD):
+    """Split off an empty partition for every month up to months_ahead from now; returns the new boundaries."""
+    target = add_months(date.today(), months_ahead)
+    added = []
+    async with database.unit_of_work() as cursor:
+        existing = await boundaries(cursor)
+    month = add_months(existing[-1], 1) if existing else add_months(date.today(), 0)
+    while month <= target:
+        # one split per transaction; the partition being split is empty, so no rows move
+        async with database.unit_of_work() as cursor:
+            await cursor.execute(f'ALTER PARTITION SCHEME {PARTITION_SCHEME} NEXT USED [PRIMARY]')
+            await cursor.execute(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() SPLIT RANGE ('{month:%Y%m%d}')")
+        added.append(month)
+        month = add_months(month, 1)
+    return added
+
+
+async def retire_month(month: date, closed_before):
+    """Move one month to the archive and drop its partitions; returns the orders moved, or None when it is still hot."""
+    async def retire(cursor):
+        await cursor.execute(RETIRE_CHECK_SQL, (month, closed_before, month))
+        partition, orders, blocking = await cursor.fetchone()
+        if blocking:
+            return None
+        if orders:
+            for table in ("purchaseOrderDetails", "purchaseOrders"):
+                columns = ", ".join(f"[{name}]" for name in await archive.shared_columns(cursor, table))
+                await cursor.execute(f'''
+                    INSERT INTO {archive.ARCHIVE_TABLES[table]} ({columns})
+                    SELECT {columns} FROM {table} WHERE orderMonth = ?''', (month,))
+            await cursor.execute(f'TRUNCATE TABLE purchaseOrderDetails WITH (PARTITIONS ({int(partition)}))')
+            await cursor.execute(f'TRUNCATE TABLE purchaseOrders WITH (PARTITIONS ({int(partition)}))')
+        # the emptied partition folds into the one before it
+        await cursor.execute(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() MERGE RANGE ('{month:%Y%m%d}')")
+        return orders
+
+    return await database.run_in_transaction(retire)
+
+
+async def retire_old_partitions(keep_months: int = KEEP_MONTHS):
+    """Retire the months before the window, oldest first; returns {month: orders moved} and the month that stopped it."""
+    if keep_months < 2:
+        raise ValueError("Keep at least the current and the previous month")
+    keep_from = add_months(date.today(), 1 - keep_months)
+    async with database.unit_of_work() as cursor:
+        old = [month for month in await boundaries(cursor) if month < keep_from]
+        await cursor.execute('SELECT DATEADD(DAY, ?, GETDATE())', (-archive.ARCHIVE_AFTER_DAYS,))
+        closed_before = (await cursor.fetchone())[0]
+
+    retired = {}
+    for month in old:
+        orders = await retire_month(month, closed_before)
+        if orders is None:
+            return retired, month
+        retired[month] = orders
+    return retired, None
+
+
+async def main(keep_months: int):
+    try:
+        added = await add_future_partitions()
+        print(f"Added partitions: {', '.join(f'{month:%Y-%m}' for month in added) or 'none'}")
+        retired, blocked = await retire_old_partitions(keep_months)
+        for month, orders in retired.items():
+            print(f"Retired {month:%Y-%m}: {orders} orders archived")
+        if blocked:
+            print(f"{blocked:%Y-%m} still has open or recently closed orders; retirement stops there")
+    finally:
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else KEEP_MONTHS))
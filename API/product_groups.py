@@ -0,0 +1,165 @@
+import hashlib
+import json
+import database
+import invalidation
+
+# Parts of a group key are joined with the unit separator. The hashes are only ever
+# computed here: migration 003's HASHBYTES backfill lowercases with SQL Server's
+# LOWER, which folds some characters ('İ', 'ẞ') unlike str.lower(), so migrate.py
+# recomputes its hashes with rehash_groups() after applying the migrations.
+_SEPARATOR = "\x1f"
+
+# productGroupIDs already resolved by this process. A group's hash never changes
+# (renaming a product moves it to another group), so hits never go stale.
+_ids_by_group_hash = {}
+# nameHash -> tuple of productGroupIDs; dropped whenever any worker creates a group
+_ids_by_name_hash = {}
+
+
+# Function to normalize one part of a group key: spaces trimmed, lowercased
+def normalize(value) -> str:
+    return (value or "").strip(" ").lower()
+
+
+def _digest(*parts) -> bytes:
+    return hashlib.sha256(_SEPARATOR.join(normalize(part) for part in parts).encode("utf-16-le")).digest()
+
+
+# Function to compute the groupHash of a (productName, productDescription, category)
+def group_hash(product_name: str, product_description, category: str) -> bytes:
+    return _digest(product_name, product_description, category)
+
+
+# Function to compute the nameHash of a (productName, category)
+def name_hash(product_name: str, category: str) -> bytes:
+    return _digest(product_name, category)
+
+
+async def resolve_group_ids(product_group_id=None, product_name=None, category=None, product_description=None):
+    """
+    Return the productGroupIDs matching the request: the given productGroupID, the
+    single group of (name, description, category), or every group of (name, category)
+    when no description is given. Returns an empty list when nothing matches.
+    """
+    if product_group_id is not None:
+        return [product_group_id]
+    if product_name is None or category is None:
+        return []
+
+    if product_description is not None:
+        key = group_hash(product_name, product_description, category)
+        group_id = _ids_by_group_hash.get(key)
+        if group_id is None:
+            async with database.unit_of_work() as cursor:
+                await cursor.execute('SELECT productGroupID FROM ProductGroups WHERE groupHash = ?', (key,))
+                row = await cursor.fetchone()
+            if not row:
+                return []
+            group_id = _ids_by_group_hash[key] = row[0]
+        return [group_id]
+
+    key = name_hash(product_name, category)
+    group_ids = _ids_by_name_hash.get(key)
+    if group_ids is None:
+        seen = invalidation.version("ProductGroups")
+        async with database.unit_of_work() as cursor:
+            await cursor.execute('SELECT productGroupID FROM ProductGroups WHERE nameHash = ?', (key,))
+            group_ids = tuple(row[0] for row in await cursor.fetchall())
+        if not group_ids:
+            return []
+        # a group created while the query ran may be missing from it
+        if invalidation.version("ProductGroups") == seen:
+            _ids_by_name_hash[key] = group_ids
+    return list(group_ids)
+
+
+async def ensure_group(cursor, product_name: str, product_description, category: str) -> int:
+    """Return the productGroupID of the group, creating it in the caller's transaction if needed."""
+    key = group_hash(product_name, product_description, category)
+    await cursor.execute('''
+        SET NOCOUNT ON;
+        DECLARE @groupHash BINARY(32) = ?;
+        INSERT INTO ProductGroups (groupHash, nameHash, productName, productDescription, category)
+        SELECT @groupHash, ?, ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM ProductGroups WITH (UPDLOCK, HOLDLOCK) WHERE groupHash = @groupHash);
+        SELECT productGroupID FROM ProductGroups WHERE groupHash = @groupHash;''',
+        (key, name_hash(product_name, category), product_name, product_description, category))
+    group_id = (await cursor.fetchone())[0]
+    # A new group can join an already cached (name, category) lookup, in any worker
+    invalidation.publish_after_commit("ProductGroups", [name_hash(product_name, category).hex()])
+    return group_id
+
+
+# Point the products of the groups merged away at the group they merged into, drop
+# those groups and store the recomputed hashes, in one statement per table so the
+# unique groupHash index only sees the final hashes
+REHASH_GROUPS_SQL = '''
+SET NOCOUNT ON;
+DECLARE @groups TABLE (productGroupID INT PRIMARY KEY, groupHash BINARY(32), nameHash BINARY(32), mergedInto INT);
+
+INSERT INTO @groups (productGroupID, groupHash, nameHash, mergedInto)
+SELECT productGroupID, CONVERT(BINARY(32), groupHash, 2), CONVERT(BINARY(32), nameHash, 2), mergedInto
+FROM OPENJSON(?) WITH (productGroupID INT, groupHash CHAR(64), nameHash CHAR(64), mergedInto INT);
+
+UPDATE p
+SET productGroupID = g.mergedInto
+FROM Products AS p
+JOIN @groups AS g ON g.productGroupID = p.productGroupID
+WHERE g.mergedInto IS NOT NULL;
+
+UPDATE p
+SET productGroupID = g.mergedInto
+FROM ProductsArchive AS p
+JOIN @groups AS g ON g.productGroupID = p.productGroupID
+WHERE g.mergedInto IS NOT NULL;
+
+DELETE pg
+FROM ProductGroups AS pg
+JOIN @groups AS g ON g.productGroupID = pg.productGroupID
+WHERE g.mergedInto IS NOT NULL;
+
+UPDATE pg
+SET groupHash = g.groupHash, nameHash = g.nameHash
+FROM ProductGroups AS pg
+JOIN @groups AS g ON g.productGroupID = pg.productGroupID
+WHERE g.mergedInto IS NULL;
+'''
+
+
+async def rehash_groups(cursor) -> int:
+    """
+    Recompute every group's hashes with normalize(), merging the groups that turn out to
+    be the same one into the oldest of them. Runs in the caller's transaction; returns the
+    number of groups rehashed or merged.
+    """
+    await cursor.execute('''
+        SELECT productGroupID, groupHash, nameHash, productName, productDescription, category
+        FROM ProductGroups WITH (TABLOCKX, HOLDLOCK)
+        ORDER BY productGroupID''')
+    oldest = {}
+    changes = []
+    for group_id, stored_group_hash, stored_name_hash, name, description, category in await cursor.fetchall():
+        key, name_key = group_hash(name, description, category), name_hash(name, category)
+        merged_into = oldest.setdefault(key, group_id)
+        if merged_into != group_id or bytes(stored_group_hash) != key or bytes(stored_name_hash) != name_key:
+            changes.append({
+                "productGroupID": group_id,
+                "groupHash": key.hex(),
+                "nameHash": name_key.hex(),
+                "mergedInto": merged_into if merged_into != group_id else None,
+            })
+    if changes:
+        await cursor.execute(REHASH_GROUPS_SQL, (json.dumps(changes),))
+    return len(changes)
+
+
+# Function to forget the (name, category) lookups a new group joined; keys are nameHashes in hex
+@invalidation.subscribe("ProductGroups")
+def _drop_name_hashes(keys):
+    for key in keys:
+        _ids_by_name_hash.pop(bytes.fromhex(key), None)
+
+
+# Function to build "?, ?, ?" for an IN (...) list of group IDs
+def placeholders(group_ids) -> str:
+    return ", ".join("?" for _ in group_ids)
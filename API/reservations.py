@@ -0,0 +1,161 @@
+# Stock reservations for purchase orders.
+# Confirming an order reserves concrete ProductVariants rows for it
+# (ProductVariants.reservedOrderID), so two confirmed orders can never be
+# promised the same units. Delivery only flips the reserved rows, and
+# cancelling or rejecting the order releases them again.
+import json
+import analytics
+import barcode_index
+import database
+import invalidation
+import stock_alerts
+
+# Reserve the lowest free variants of every product on the order in one batch.
+# READPAST skips rows another confirmation is reserving right now, so concurrent
+# confirmations never block on or double-book the same variant. The batch runs
+# inside the caller's unit of work and rolls back to its savepoint if any product
+# comes up short.
+RESERVE_ORDER_SQL = '''
+SET NOCOUNT ON;
+DECLARE @orderID INT = ?;
+DECLARE @required TABLE (productID INT PRIMARY KEY, quantity INT, alreadyReserved INT);
+DECLARE @shortfall TABLE (productID INT, quantity INT, reserved INT);
+
+SAVE TRANSACTION reserve_order;
+
+INSERT INTO @required (productID, quantity, alreadyReserved)
+SELECT pod.productID, SUM(pod.orderQuantity),
+       (SELECT COUNT(*) FROM ProductVariants AS held
+        WHERE held.productID = pod.productID AND held.reservedOrderID = @orderID AND held.isAvailable = 1)
+FROM purchaseOrderDetails AS pod
+WHERE pod.orderID = @orderID
+GROUP BY pod.productID;
+
+WITH candidates AS (
+    SELECT pv.variantID,
+           r.quantity - r.alreadyReserved AS needed,
+           ROW_NUMBER() OVER (PARTITION BY pv.productID ORDER BY pv.variantID) AS rn
+    FROM ProductVariants AS pv WITH (UPDLOCK, ROWLOCK, READPAST)
+    JOIN @required AS r ON r.productID = pv.productID
+    WHERE pv.isAvailable = 1 AND pv.reservedOrderID IS NULL
+)
+UPDATE pv
+SET reservedOrderID = @orderID
+FROM ProductVariants AS pv
+JOIN candidates AS c ON c.variantID = pv.variantID
+WHERE c.rn <= c.needed;
+
+INSERT INTO @shortfall (productID, quantity, reserved)
+SELECT r.productID, r.quantity, COUNT(pv.variantID)
+FROM @required AS r
+LEFT JOIN ProductVariants AS pv
+    ON pv.productID = r.productID AND pv.reservedOrderID = @orderID AND pv.isAvailable = 1
+GROUP BY r.productID, r.quantity
+HAVING COUNT(pv.variantID) < r.quantity;
+
+IF EXISTS (SELECT 1 FROM @shortfall)
+    ROLLBACK TRANSACTION reserve_order;
+
+SELECT productID, quantity, reserved FROM @shortfall;
+'''
+
+# Variants currently held for an order, in the shape IMS expects
+RESERVED_VARIANTS_SQL = '''
+SELECT pv.barcode, pv.productCode, p.productName, p.category, p.size
+FROM ProductVariants AS pv
+JOIN Products AS p ON p.productID = pv.productID
+WHERE pv.reservedOrderID = ? AND pv.isAvailable = 1
+ORDER BY pv.variantID
+'''
+
+# Hand the reserved variants over: mark the order delivered, flip the variants,
+# deduct stock and append the delivery to the stock ledger in one batch. Only an
+# order still in 'To Ship' is claimed, and only the reserved variants among the
+# barcodes given (the ones sent to IMS). Returns the barcodes of the variants claimed.
+CLAIM_ORDER_SQL = '''
+SET NOCOUNT ON;
+DECLARE @orderID INT = ?;
+DECLARE @barcodes NVARCHAR(MAX) = ?;
+DECLARE @claimed TABLE (variantID INT PRIMARY KEY, productID INT, barcode NVARCHAR(50));
+
+UPDATE purchaseOrders
+SET orderStatus = 'Delivered', statusDate = GETUTCDATE()
+WHERE orderID = @orderID AND orderStatus = 'To Ship';
+
+IF @@ROWCOUNT = 1
+BEGIN
+    UPDATE pv
+    SET isAvailable = 0
+    OUTPUT inserted.variantID, inserted.productID, inserted.barcode INTO @claimed
+    FROM ProductVariants AS pv
+    JOIN (SELECT DISTINCT barcode FROM OPENJSON(@barcodes) WITH (barcode NVARCHAR(50) '$')) AS sent
+        ON sent.barcode = pv.barcode
+    WHERE pv.reservedOrderID = @orderID AND pv.isAvailable = 1;
+
+    UPDATE p
+    SET currentStock = p.currentStock - c.claimedCount
+    FROM Products AS p
+    JOIN (SELECT productID, COUNT(*) AS claimedCount FROM @claimed GROUP BY productID) AS c
+        ON c.productID = p.productID;
+
+    INSERT INTO StockMovements (productID, movementType, quantity, referenceID)
+    SELECT productID, 'delivery', -COUNT(*), @orderID FROM @claimed GROUP BY productID;
+END
+
+SELECT barcode FROM @claimed;
+'''
+
+RELEASE_ORDER_SQL = '''
+UPDATE ProductVariants
+SET reservedOrderID = NULL
+OUTPUT inserted.variantID
+WHERE reservedOrderID = ? AND isAvailable = 1
+'''
+
+# Order statuses that give the reserved variants back to the free pool
+RELEASE_STATUSES = ("Rejected", "Cancelled")
+
+
+async def reserve_order(cursor, order_id: int):
+    """Reserve variants for every line of an order; return the products that could not be covered."""
+    await cursor.execute(RESERVE_ORDER_SQL, (order_id,))
+    rows = await cursor.fetchall()
+    if not rows:
+        await stock_alerts.refresh_order(cursor, order_id)
+    return [{"productID": row[0], "required": row[1], "available": row[2]} for row in rows]
+
+
+async def get_reserved_variants(cursor, order_id: int):
+    """Return the variants currently reserved for an order."""
+    await cursor.execute(RESERVED_VARIANTS_SQL, (order_id,))
+    rows = await cursor.fetchall()
+    return [
+        {
+            "barcode": row[0],
+            "productCode": row[1],
+            "productName": row[2],
+            "category": row[3],
+            "size": row[4],
+        }
+        for row in rows
+    ]
+
+
+async def claim_order(cursor, order_id: int, barcodes: list) -> int:
+    """Mark the given reserved variants unavailable, deduct stock, set the 'To Ship' order to Delivered and count the sale."""
+    await cursor.execute(CLAIM_ORDER_SQL, (order_id, json.dumps(barcodes)))
+    barcodes = [row[0] for row in await cursor.fetchall()]
+    database.after_commit(lambda: barcode_index.index.set_available(barcodes, False))
+    invalidation.publish_after_commit("ProductVariants", barcodes)
+    await stock_alerts.refresh_order(cursor, order_id)
+    await analytics.rollup_orders(cursor, [order_id])
+    return len(barcodes)
+
+
+async def release_order(cursor, order_id: int) -> int:
+    """Return the variants reserved for an order to the free pool."""
+    await cursor.execute(RELEASE_ORDER_SQL, (order_id,))
+    released = len(await cursor.fetchall())
+    if released:
+        await stock_alerts.refresh_order(cursor, order_id)
+    return released
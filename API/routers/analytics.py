@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException, Query
+from datetime import date, timedelta
+from typing import Optional
+import analytics
+
+router = APIRouter()
+
+
+# units, revenue and order lines over a date range, from the sales rollup
+@router.get('/sales')
+async def get_sales(
+    date_from: Optional[date] = Query(default=None, alias="from"),
+    date_to: Optional[date] = Query(default=None, alias="to"),
+    group_by: str = "",
+    category: Optional[str] = None,
+    size: Optional[str] = None,
+    vendorID: Optional[int] = None,
+):
+    """
+    from/to default to the last 30 days; group_by is a comma-separated list of
+    day, month, year, category, size and vendor (empty for one total).
+    """
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=422, detail="'from' must not be after 'to'.")
+    dimensions = list(dict.fromkeys(name.strip() for name in group_by.split(",") if name.strip()))
+    unknown = [name for name in dimensions if name not in analytics.GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown group_by {', '.join(unknown)}; use {', '.join(analytics.GROUP_COLUMNS)}.")
+
+    try:
+        rows = await analytics.sales(date_from, date_to, dimensions, category, size, vendorID)
+    except Exception as e:
+        print(f"Error fetching sales analytics: {e}")
+        raise HTTPException(status_code=500, detail=f"Error fetching sales analytics: {e}")
+    return {"from": date_from, "to": date_to, "groupBy": dimensions, "rows": rows}
@@ -6,6 +6,7 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 import aioodbc
 import database as database
+import loaders
 
 # JWT Configuration
 SECRET_KEY = "15882913506880857248f72d1dbc38dd7d2f8f352786563ef5f23dc60987c632"
@@ -47,13 +48,8 @@ class UserInDB(User):
 async def get_user_from_db(username: str):
     """Fetch user from DB."""
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute(
-            "SELECT username, userPassword, userRole, isDisabled, firstName, lastName FROM users WHERE username = ?", 
-            (username,)
-        )
-        user_row = await cursor.fetchone()
+        # Lookups from concurrent requests are batched into one query by the user loader
+        user_row = await loaders.user_loader.load(username)
         if user_row:
             return UserInDB(
                 username=user_row[0],
@@ -67,9 +63,6 @@ async def get_user_from_db(username: str):
     except Exception as e:
         print(f"Error accessing database: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
-    finally:
-        await cursor.close()
-        await conn.close()
 
 
 # JWT Helper Functions
@@ -147,40 +140,30 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 async def create_default_user():
     """Creates the first default user if no users exist in the database."""
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-        
-        # Check if any user exists
-        await cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = await cursor.fetchone()
-        
-        if user_count[0] == 0:  # No users exist
-            # Define default user details
-            default_username = "admin"
-            default_password = "admin123"
-            hashed_password = get_password_hash(default_password)
-            
-            # Insert the default user
-            await cursor.execute(
-                """
-                INSERT INTO users (username, userPassword, userRole, isDisabled, firstName, lastName)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (default_username, hashed_password, "admin", False, "Default", "Admin")
-            )
-            await conn.commit()
-            print("Default admin user created: username=admin, password=admin123")
-        else:
-            print("Users already exist in the database. Default user not created.")
+        async def create_if_empty(cursor):
+            # Check if any user exists
+            await cursor.execute("SELECT COUNT(*) FROM users")
+            user_count = await cursor.fetchone()
+
+            if user_count[0] == 0:  # No users exist
+                # Define default user details
+                default_username = "admin"
+                default_password = "admin123"
+                hashed_password = get_password_hash(default_password)
+
+                # Insert the default user
+                await cursor.execute(
+                    """
+                    INSERT INTO users (username, userPassword, userRole, isDisabled, firstName, lastName)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (default_username, hashed_password, "admin", False, "Default", "Admin")
+                )
+                print("Default admin user created: username=admin, password=admin123")
+            else:
+                print("Users already exist in the database. Default user not created.")
+        await database.run_in_transaction(create_if_empty)
     except Exception as e:
         print(f"Error creating default user: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
-    finally:
-        await cursor.close()
-        await conn.close()
-
 
-# Ensure the default user is created at startup
-@router.on_event("startup")
-async def on_startup():
-    await create_default_user()
@@ -0,0 +1,176 @@
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from datetime import datetime, time, timedelta, timezone
+from statistics import NormalDist
+from typing import Optional
+import asyncio
+import database
+import forecasting
+from forecasting import np
+import serialization
+import stock_alerts
+import stock_ledger
+
+router = APIRouter()
+
+# Seconds between keep-alive comments on an idle event stream
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Most rows one replenishment request returns
+MAX_REPLENISHMENT_ROWS = 5000
+
+AS_OF_MAPPER = serialization.RowMapper((
+    "productID", "productName", "category", "size", "productGroupID", "onHand"))
+
+LOW_STOCK_MAPPER = serialization.RowMapper((
+    "productID", "productName", "productDescription", "category", "size", "productGroupID",
+    "availableCount", "minStockLevel", "maxStockLevel", "updatedAt"))
+
+
+# products currently below their minimum stock level
+@router.get('/low-stock')
+async def get_low_stock(category: Optional[str] = None):
+    try:
+        async with database.unit_of_work() as cursor:
+            # the filtered index holds only the low rows, so this is O(alerts), not O(catalogue)
+            await cursor.execute('''
+                SELECT p.productID, p.productName, p.productDescription, p.category, p.size, p.productGroupID,
+                       l.availableCount, p.minStockLevel, p.maxStockLevel, l.updatedAt
+                FROM ProductStockLevels AS l
+                JOIN Products AS p ON p.productID = l.productID
+                WHERE l.stockState = 'low' AND (? IS NULL OR p.category = ?)
+                ORDER BY l.availableCount - p.minStockLevel, p.productID''', (category, category))
+            rows = await cursor.fetchall()
+        return serialization.rows_response(rows, LOW_STOCK_MAPPER)
+    except Exception as e:
+        print(f"Error fetching low-stock products: {e}")
+        raise HTTPException(status_code=500, detail=f"Error fetching low-stock products: {e}")
+
+
+# threshold-crossing alerts recorded after a given alertID
+@router.get('/alerts')
+async def get_alerts(after: int = 0, limit: int = Query(default=100, ge=1, le=stock_alerts.MAX_ALERTS_PER_PAGE)):
+    try:
+        return await stock_alerts.alerts_after(after, limit)
+    except Exception as e:
+        print(f"Error fetching stock alerts: {e}")
+        raise HTTPException(status_code=500, detail=f"Error fetching stock alerts: {e}")
+
+
+def _event(alert) -> bytes:
+    return (f"id: {alert['alertID']}\nevent: {alert['alertType']}\ndata: ".encode()
+            + serialization.dumps(alert) + b"\n\n")
+
+
+# live stream (Server-Sent Events) of stock alerts
+@router.get('/alerts/stream')
+async def stream_alerts(request: Request, last_event_id: Optional[int] = Header(default=None)):
+    queue = stock_alerts.subscribe()
+
+    async def events():
+        try:
+            # a reconnecting client first gets what it missed
+            last_sent = last_event_id or 0
+            if last_event_id is not None:
+                for alert in await stock_alerts.alerts_after(last_event_id):
+                    last_sent = alert["alertID"]
+                    yield _event(alert)
+            while not await request.is_disconnected():
+                try:
+                    alert = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if alert is None:
+                    # fell too far behind; the client reconnects with Last-Event-ID
+                    break
+                if alert["alertID"] > last_sent:
+                    last_sent = alert["alertID"]
+                    yield _event(alert)
+        finally:
+            stock_alerts.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# suggested reorder quantities per product and size, from the demand forecast
+@router.get('/replenishment')
+async def get_replenishment(
+    category: Optional[str] = None,
+    leadTimeWeeks: int = Query(default=2, ge=0, le=52),
+    coverWeeks: int = Query(default=4, ge=1, le=52),
+    serviceLevel: float = Query(default=0.95, gt=0.5, lt=1),
+    includeZero: bool = False,
+    limit: int = Query(default=500, ge=1, le=MAX_REPLENISHMENT_ROWS),
+):
+    try:
+        forecast = await forecasting.current()
+        async with database.unit_of_work() as cursor:
+            await cursor.execute('''
+                SELECT p.productID, p.productName, p.category, p.size, p.productGroupID,
+                       ISNULL(l.availableCount, 0), p.minStockLevel, p.maxStockLevel
+                FROM Products AS p
+                LEFT JOIN ProductStockLevels AS l ON l.productID = p.productID
+                WHERE p.isActive = 1 AND (? IS NULL OR p.category = ?)''', (category, category))
+            products = await cursor.fetchall()
+    except Exception as e:
+        print(f"Error computing replenishment: {e}")
+        raise HTTPException(status_code=500, detail=f"Error computing replenishment: {e}")
+
+    if not products:
+        return []
+    # the whole catalogue is planned in one vectorized pass
+    columns = list(zip(*products))
+    available = np.array(columns[5], dtype=np.float32)
+    min_levels = np.array([np.nan if level is None else level for level in columns[6]], dtype=np.float32)
+    max_levels = np.array([np.nan if level is None else level for level in columns[7]], dtype=np.float32)
+    demand, safety, suggested = forecast.plan(
+        columns[0], available, min_levels, max_levels,
+        leadTimeWeeks, coverWeeks, NormalDist().inv_cdf(serviceLevel))
+
+    order = np.argsort(-suggested, kind="stable")
+    if not includeZero:
+        order = order[suggested[order] > 0]
+    return [
+        {
+            "productID": products[i][0],
+            "productName": products[i][1],
+            "category": products[i][2],
+            "size": products[i][3],
+            "productGroupID": products[i][4],
+            "availableCount": products[i][5],
+            "minStockLevel": products[i][6],
+            "maxStockLevel": products[i][7],
+            "forecastDemand": forecasting.rounded(demand[i]),
+            "safetyStock": forecasting.rounded(safety[i]),
+            "suggestedQuantity": int(suggested[i]),
+        }
+        for i in order[:limit]
+    ]
+
+
+# units on hand per product at a past moment, from the stock ledger
+@router.get('/as-of')
+async def get_stock_as_of(
+    as_of: datetime = Query(alias="date"),
+    category: Optional[str] = None,
+    productID: Optional[int] = None,
+):
+    """A plain date means the end of that day (UTC); the response lists products with units on hand."""
+    if as_of.tzinfo is not None:
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    elif as_of.time() == time.min:
+        as_of = as_of + timedelta(days=1) - timedelta(milliseconds=1)
+    try:
+        snapshot, rows = await stock_ledger.on_hand_as_of(as_of, category, productID)
+    except Exception as e:
+        print(f"Error fetching stock as of {as_of}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error fetching stock as of {as_of}: {e}")
+    if snapshot["snapshotID"] is None:
+        raise HTTPException(
+            status_code=404, detail=f"No stock history before {snapshot['historyStartsAt'] or 'the ledger starts'}.")
+    return {
+        "asOf": as_of,
+        **snapshot,
+        "products": [AS_OF_MAPPER(row) for row in rows],
+    }
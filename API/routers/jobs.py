@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException
+import jobs
+
+router = APIRouter()
+
+
+# status and progress of a background job
+@router.get('/{job_id}')
+async def get_job(job_id: int):
+    job = await jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail='job not found')
+    return job
+
+
+# stop a job after its current chunk
+@router.post('/{job_id}/cancel')
+async def cancel_job(job_id: int):
+    if not await jobs.cancel_job(job_id):
+        raise HTTPException(status_code=409, detail='job is not queued or running')
+    return await jobs.get_job(job_id)
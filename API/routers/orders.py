@@ -1,12 +1,18 @@
-from fastapi import FastAPI, HTTPException, Query, APIRouter
+from fastapi import FastAPI, HTTPException, Query, APIRouter, Request
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import logging
-import httpx
 import asyncio
-from aiohttp import ClientSession
 import json
+import analytics
+import archive
 import database
+import forecasting
+import ims_client
+import ims_schemas
+import reservations
+import singleflight
+import serialization
 from typing import List
 
 
@@ -30,264 +36,251 @@ class OrderSummary(BaseModel):
     warehouseAddress: str
     image_path: str
 
+# Query shared by the order list endpoints; only the status filter differs. With
+# include_archived the tables are read through the views over hot and archived rows.
+ORDER_SUMMARY_QUERY = """
+SELECT 
+    po.orderID,  -- Include orderID
+    p.productName, 
+    p.size, 
+    p.category, 
+    pod.orderQuantity AS quantity,
+    pod.lineTotal AS totalPrice,  -- priced when the order was taken
+    c.customerName,
+    c.customerAddress AS warehouseAddress,
+    p.image_path  -- Include imagePath from the Products table
+FROM 
+    {purchaseOrderDetails} pod
+JOIN 
+    {Products} p ON pod.productID = p.productID
+JOIN 
+    {purchaseOrders} po ON pod.orderID = po.orderID
+JOIN 
+    Customers c ON po.customerID = c.customerID
+WHERE
+    po.orderStatus = ?
+"""
+ORDER_SUMMARY_QUERIES = {
+    include_archived: ORDER_SUMMARY_QUERY.format(**{
+        table: archive.source(table, include_archived)
+        for table in ("purchaseOrderDetails", "Products", "purchaseOrders")
+    })
+    for include_archived in (False, True)
+}
+
+# Rows map positionally onto OrderSummary's fields
+ORDER_SUMMARY_MAPPER = serialization.RowMapper(OrderSummary.model_fields)
+
+
+# helper function to fetch the order summaries for one status as a JSON response
+async def fetch_order_summaries(order_status: str, include_archived: bool = False):
+    try:
+        async with database.unit_of_work() as cursor:
+            await cursor.execute(ORDER_SUMMARY_QUERIES[include_archived], (order_status,))
+            results = await cursor.fetchall()
+
+            # Encode the rows directly instead of validating an OrderSummary per row
+            return serialization.rows_response(results, ORDER_SUMMARY_MAPPER)
+
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
+
 # helper function to send order to ims
 async def send_to_ims_api(ims_api_url: str, payload: dict):
     try:
         logging.info(f'Sending data to IMS API: {ims_api_url}')
         logging.debug(f'Payload: {payload}')
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(ims_api_url, json=payload)
-            response.raise_for_status()
-            logging.info(f'Response received from IMS API: {response.json()}')
-            return response.json()
+        response = await ims_client.client().post(ims_api_url, json=payload)
+        response.raise_for_status()
+        logging.info(f'Response received from IMS API: {response.json()}')
+        return response.json()
     
-    except httpx.HTTPStatusError as http_err:
+    except ims_client.HTTPStatusError as http_err:
         logging.error(f"HTTP error occured: {http_err.response.status_code} - {http_err.response.text}")
         raise HTTPException(status_code=500, detail=f"IMS API error:{http_err.response.text}")
     except Exception as e:
         logging.error(f"Error sending data to IMS API: {e}")
         raise HTTPException(status_code=500, detail=f'Error sending data to IMS API:{e}')
 
-def parse_datetime(date_str):
-    """Convert string timestamp to datetime format for SQL Server."""
-    if isinstance(date_str, str):
-        try:
-            return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')  # Standard format
-        except ValueError:
-            try:
-                return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S.%f')  # Handles milliseconds
-            except ValueError:
-                return datetime.strptime(date_str, '%Y-%m-%d')  # Handles date only
-    return date_str  # If already datetime, return as-is
-
-
 # receive order from ims
 @router.post('/vms/orders')
-async def receive_order(order: dict):
-    conn = None
-    try:
-        # extract order details
-        customer_id = order.get('customerID')
-        order_date = parse_datetime(order.get('orderDate', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')))
-        order_status = 'Pending'
-        products = order.get('products', [])
-
-        # validate the incoming data
-        if not customer_id or not products:
-            raise HTTPException(status_code=400, detail="Invalid order data.")
-
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
+async def receive_order(request: Request):
+    # decode and validate the payload before touching the database
+    order = await ims_schemas.decode_payload(request, ims_schemas.IMSOrder)
+
+    # extract order details
+    received_at = datetime.utcnow()
+    customer_id = order.customerID
+    order_date = order.orderDate or received_at
+    order_status = 'Pending'
+    default_expected_date = received_at + timedelta(days=7)
+
+    # header and lines are saved in one transaction
+    async def save_order(cursor):
         # save order in VMS
         await cursor.execute('''insert into purchaseOrders (orderDate, orderStatus,
                              statusDate, customerID)
-                             output inserted.orderID
+                             output inserted.orderID, inserted.orderMonth
                              values (?,?,?,?)''',
-                             (order_date, order_status, datetime.utcnow(), customer_id))
+                             (order_date, order_status, received_at, customer_id))
         
         order_id = await cursor.fetchone()
         if not order_id:
             raise HTTPException(status_code=500, detail='Failed to create purchase order.')
 
-        # insert purchase order details
-        for product in products:
-            product_id = product.get('productID')
-            quantity = product.get('quantity')
-            expected_date = parse_datetime(product.get('expectedDate', (datetime.utcnow() + timedelta(days=7))))
-
-            if not product_id or not quantity:
-                raise HTTPException(status_code=400, detail="invalid product details")
-            
-            await cursor.execute(
-                ''' insert into purchaseOrderDetails 
-                (orderQuantity, expectedDate, productID, orderID)
-                values (?, ?, ?, ?)''',
-                (quantity, expected_date, product_id, order_id[0])
+        # insert purchase order details in one statement, each line priced at the current unitPrice
+        # and placed in the partition of its order's month
+        await cursor.execute(
+            ''' insert into purchaseOrderDetails 
+            (orderQuantity, expectedDate, productID, orderID, unitPrice, orderMonth)
+            select l.quantity, cast(l.expectedDate as datetime2), l.productID, ?, p.unitPrice, ?
+            from openjson(?) with (quantity int, expectedDate datetimeoffset, productID int) as l
+            left join Products as p on p.productID = l.productID''',
+            (
+                order_id[0],
+                order_id[1],
+                serialization.dumps([
+                    {
+                        "quantity": product.quantity,
+                        "expectedDate": product.expectedDate or default_expected_date,
+                        "productID": product.productID,
+                    }
+                    for product in order.products
+                ]).decode(),
             )
-        await conn.commit()
-        return {"message": "Order received successfully.", "orderID": order_id[0]}
+        )
+        return order_id[0]
+
+    try:
+        order_id = await database.run_in_transaction(save_order)
+        forecasting.record_order([(product.productID, product.quantity) for product in order.products], order_date)
+        return {"message": "Order received successfully.", "orderID": order_id}
     except Exception as e:
         logging.error(f"Error receiving order: {e}")
         raise HTTPException(status_code=500, detail=f"Error receiving order: {e}")
-    finally:
-        if conn:
-            await conn.close()
 
 
+# Status an order holds while its confirmation or rejection is sent to IMS. An order left in
+# one by a worker that died mid-call is moved on by hand with /vms/orders/update-status.
+CONFIRM_INTERIM_STATUSES = {"Confirmed": "Confirming", "Rejected": "Rejecting"}
+
 # confirm or reject order
 @router.put('/vms/orders/{orderID}/confirm')
 async def confirm_order(orderID: int, order_status_update: OrderStatusUpdate):
-    conn = None
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # validate order and its current status
-        await cursor.execute(
-            '''select orderStatus 
-            from purchaseOrders 
-            where orderID =?''',
-            (orderID,)
-        )
-        order = await cursor.fetchone()
-        if not order:
-            raise HTTPException(status_code=404, detail="order not found.")
-        # only allow "Pending" orders to be confirmed or rejected
-        if order[0] != 'Pending':
-            raise HTTPException(status_code=400, detail="Order is not in 'Pending' status")
-        
         # validate the status provided
         status = order_status_update.orderStatus
         if status not in ["Confirmed", "Rejected"]:
             raise HTTPException(status_code=400, detail="Invalid order status. Must be 'Confirmed' or 'Rejected' only.")
-        
-        # fetch order details for the products
-        await cursor.execute(
-            '''select productID, orderQuantity
-            from purchaseOrderDetails 
-            where orderID = ?''',
-            (orderID,)
-        )
-        products = await cursor.fetchall()
-
-        # check the availability of product variants
-        for product in products: 
-            product_id = product[0]
-            order_quantity = product[1]
-
-            # fetch available variant for the product
-            variant_query = f'''select top ({order_quantity}) pv.barcode, pv.productCode, p.productName, 
-                                       p.category, p.size
-                                       from productVariants pv
-                                       join Products p 
-                                       on pv.productID = p.productID
-                                       where pv.productID = ? AND pv.isAvailable = 1
-                                       order by pv.variantID asc'''
-            await cursor.execute(variant_query, (product_id,))
-            variants = await cursor.fetchall()
-
-            # check if there are enough available variants
-            if len(variants) < order_quantity:
-                raise HTTPException(status_code=400, detail=f"not enough available variants for productID {product_id}. Required: {order_quantity}, Available: {len(variants)}")
-        
+
+        interim = CONFIRM_INTERIM_STATUSES[status]
+
+        async def reserve(cursor):
+            # claim the pending order with an interim status, so a concurrent confirm or reject of
+            # the same order gets a 409 instead of racing this one through IMS
+            await cursor.execute(
+                '''update purchaseOrders
+                set orderStatus = ?, statusDate = ?
+                output inserted.orderID
+                where orderID = ? and orderStatus = 'Pending'
+                ''',
+                (interim, datetime.utcnow(), orderID)
+            )
+            if await cursor.fetchone() is None:
+                await cursor.execute('select orderStatus from purchaseOrders where orderID = ?', (orderID,))
+                if await cursor.fetchone() is None:
+                    raise HTTPException(status_code=404, detail="order not found.")
+                raise HTTPException(status_code=409, detail="Order is not in 'Pending' status")
+
+            # reserve the variants for a confirmed order so delivery can't be raced by another order.
+            # The reservation is committed before IMS is called so no locks are held over the network.
+            reserved = False
+            if status == "Confirmed":
+                shortfalls = await reservations.reserve_order(cursor, orderID)
+                if shortfalls:
+                    shortfall = shortfalls[0]
+                    raise HTTPException(status_code=400, detail=f"not enough available variants for productID {shortfall['productID']}. Required: {shortfall['required']}, Available: {shortfall['available']}")
+                reserved = True
+            return reserved
+        reserved = await database.run_in_transaction(reserve)
+
+        # give the units back and return the order to 'Pending' (only while this call still holds it)
+        async def undo(cursor):
+            await cursor.execute(
+                '''update purchaseOrders
+                set orderStatus = 'Pending', statusDate = ?
+                output inserted.orderID
+                where orderID = ? and orderStatus = ?''',
+                (datetime.utcnow(), orderID, interim)
+            )
+            if await cursor.fetchone() is not None and reserved:
+                await reservations.release_order(cursor, orderID)
+
         # prepare the payload for IMS if the status is "Confirmed"
         ims_api_url = "http://127.0.0.1:8000/receive-orders/ims/orders/confirm"
         ims_payload = {"orderID": orderID, "orderStatus": status}
 
         # send the confirmation or rejection to IMS and wait for a response
-        ims_response = await send_to_ims_api(ims_api_url, ims_payload)
+        try:
+            ims_response = await send_to_ims_api(ims_api_url, ims_payload)
+        except Exception:
+            # IMS never heard about the confirmation, so give the units back
+            await database.run_in_transaction(undo)
+            raise
 
         # update the status in VMS immediately after receiving the response from IMS
-        await cursor.execute(
-            '''update purchaseOrders 
-            set orderStatus = ?, statusDate = ?
-            where orderID = ? ''',
-            (status, datetime.utcnow(), orderID)
-        )
-        await conn.commit()
+        async def record_status(cursor):
+            await cursor.execute(
+                '''update purchaseOrders 
+                set orderStatus = ?, statusDate = ?
+                output inserted.orderID
+                where orderID = ? and orderStatus = ?''',
+                (status, datetime.utcnow(), orderID, interim)
+            )
+            return await cursor.fetchone() is not None
+        if not await database.run_in_transaction(record_status):
+            # the status was changed by hand (update-status) while IMS was called
+            raise HTTPException(status_code=409, detail=f"Order {orderID} changed status while it was being {status.lower()}.")
 
         return {'message': f"order {orderID} has been {status} in VMS", 'imsResponse': ims_response}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"error confirming order: {e}")
         raise HTTPException(status_code=500, detail=f"error processing order: {e}")
-    finally:
-        if conn:
-            await conn.close()
 
 @router.get("/confirmed/orders", response_model=List[OrderSummary])
+@singleflight.coalesce
 async def get_order_details():
-    conn = None
-    try:
-        # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  -- Include imagePath from the Products table
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'Confirmed'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        return order_summaries
-
-    except Exception as e:
-        print(f"Error occurred: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
-
+    return await fetch_order_summaries('Confirmed')
 
 @router.put('/vms/orders/{orderID}/toship')
 async def mark_to_ship(orderID: int):
-    conn = None
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # validate order sttaus in VMS
-        await cursor.execute(
-            '''select orderStatus
-            from purchaseOrders
-            where orderID = ?''',
-            (orderID,)
-        )
-        order = await cursor.fetchone()
-        if not order or order[0] != 'Confirmed':
-            raise HTTPException(status_code=400, detail="order is not in 'Confirmed' status")
-        
-        # update to "To Ship" in VMS
-        await cursor.execute(
-            '''update purchaseOrders
-            set orderStatus = 'To Ship', 
-            statusDate = ?
-            where orderID = ?''',
-            (datetime.utcnow(), orderID)
-        )
-        await conn.commit()
+        async def record_to_ship(cursor):
+            # validate order sttaus in VMS
+            await cursor.execute(
+                '''select orderStatus
+                from purchaseOrders
+                where orderID = ?''',
+                (orderID,)
+            )
+            order = await cursor.fetchone()
+            if not order or order[0] != 'Confirmed':
+                raise HTTPException(status_code=400, detail="order is not in 'Confirmed' status")
+            
+            # update to "To Ship" in VMS
+            await cursor.execute(
+                '''update purchaseOrders
+                set orderStatus = 'To Ship', 
+                statusDate = ?
+                where orderID = ?''',
+                (datetime.utcnow(), orderID)
+            )
+        await database.run_in_transaction(record_to_ship)
 
         # after updatimg VMS, also update IMS with the 'To Ship' status
         ims_url = 'http://127.0.0.1:8000/receive-orders/ims/orders/ToShip'  
@@ -298,205 +291,69 @@ async def mark_to_ship(orderID: int):
         }
 
         # make the API call to IMS to update the order status
-        async with httpx.AsyncClient() as client:
-            ims_response = await client.post(ims_url, json = ims_payload)
-            ims_response.raise_for_status()
+        ims_response = await ims_client.client().post(ims_url, json = ims_payload)
+        ims_response.raise_for_status()
         
         # log the ims response for debuggin
         logging.info(f"IMS response: {ims_response.status_code} - {ims_response.text}")
 
         return {'message': f"order {orderID} marked as 'To Ship' in VMS and updated in IMS."}
     
-    except httpx.HTTPStatusError as http_err:
+    except ims_client.HTTPStatusError as http_err:
         logging.error(f"HTTP Error while communication with IMS: {http_err}")
         raise HTTPException(status_code=500, detail=f'Error processing the update: {http_err.response.status_code} - {http_err.response.text}')
     except Exception as e: 
         logging.error(f"UNexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing the update: {e}")
-    finally:
-        if conn:
-            await conn.close()
-
-# Define the send_to_ims_api_with_retries function
-async def send_to_ims_api_with_retries(url, payload, retries=3, delay=2):
-    for attempt in range(retries):
-        try:
-            async with ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status == 200:
-                        return await response.json()
-        except Exception as e:
-            logging.error(f"Attempt {attempt + 1} failed: {e}")
-        await asyncio.sleep(delay)
-    raise HTTPException(status_code=500, detail="Failed to send data to IMS after multiple attempts.")
 
 @router.get("/toship/orders", response_model=List[OrderSummary])
+@singleflight.coalesce
 async def get_order_details():
-    conn = None
-    try:
-        # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  -- Include imagePath from the Products table
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'To Ship'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        return order_summaries
-
-    except Exception as e:
-        print(f"Error occurred: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
+    return await fetch_order_summaries('To Ship')
 
 @router.put('/vms/orders/{orderID}/Delivered')
 async def delivered_order(orderID: int):
-    conn = None
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Validate order status
-        await cursor.execute(
-            '''SELECT orderStatus
-               FROM purchaseOrders
-               WHERE orderID = ?''',
-            (orderID,)
-        )
-        order = await cursor.fetchone()
-        if not order or order[0] != 'To Ship':
-            raise HTTPException(status_code=400, detail="Order is not in 'To Ship' status.")
-
-        # Fetch products and order quantities
-        await cursor.execute(
-            '''SELECT pod.productID, pod.orderQuantity
-               FROM purchaseOrderDetails pod
-               WHERE pod.orderID = ?''',
-            (orderID,)
-        )
-        products = await cursor.fetchall()
-        if not products:
-            raise HTTPException(status_code=404, detail="No products found for this order.")
-
-        # Prepare the list of product variants to send to IMS
-        variant_data = []
-        for product in products:
-            product_id, order_quantity = product
-            order_quantity = int(order_quantity)
-
-            # Fetch only the required number of product variants (orderQuantity)
+        async def prepare_delivery(cursor):
+            # Validate order status
             await cursor.execute(
-                '''SELECT TOP (?) pv.barcode, pv.productCode, p.productName, p.category, p.size
-                   FROM productVariants pv
-                   JOIN products p ON pv.productID = p.productID
-                   WHERE pv.productID = ? AND pv.isAvailable = 1
-                   ORDER BY pv.variantID ASC''',
-                (order_quantity, product_id)
+                '''SELECT orderStatus
+                   FROM purchaseOrders
+                   WHERE orderID = ?''',
+                (orderID,)
             )
-            variants = await cursor.fetchall()
-            logging.info(f"Available variants for productID {product_id}: {len(variants)}")
-
-            if len(variants) < order_quantity:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Not enough available variants for productID {product_id}. "
-                           f"Required: {order_quantity}, Available: {len(variants)}"
-                )
-
-            # Add the fetched variants to the variant_data list
-            variant_data.extend([{
-                "barcode": v[0],
-                "productCode": v[1],
-                "productName": v[2],
-                "category": v[3],
-                "size": v[4]
-            } for v in variants[:order_quantity]])
-
-        # Deduct the currentStock for each product based on order quantity
-        for product in products:
-            product_id, order_quantity = product
-
-            # Fetch the current stock
-            await cursor.execute(
-                '''SELECT currentStock
-                   FROM products
-                   WHERE productID = ?''',
-                (product_id,)
-            )
-            current_stock_row = await cursor.fetchone()
-            if not current_stock_row:
-                raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found.")
-
-            current_stock = int(current_stock_row[0])
-
-            # Check if stock is sufficient
-            if current_stock < order_quantity:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Not enough stock for productID {product_id}. "
-                           f"Required: {order_quantity}, Available: {current_stock}"
-                )
+            order = await cursor.fetchone()
+            if not order or order[0] != 'To Ship':
+                raise HTTPException(status_code=400, detail="Order is not in 'To Ship' status.")
 
-            # Deduct stock
-            new_stock = current_stock - order_quantity
+            # Fetch products and order quantities
             await cursor.execute(
-                '''UPDATE products
-                   SET currentStock = ?
-                   WHERE productID = ?''',
-                (new_stock, product_id)
+                '''SELECT SUM(pod.orderQuantity)
+                   FROM purchaseOrderDetails pod
+                   WHERE pod.orderID = ?''',
+                (orderID,)
             )
-
-        # Mark selected variants as unavailable
-        await cursor.executemany(
-            '''UPDATE productVariants
-               SET isAvailable = 0
-               WHERE barcode = ?''',
-            [(variant['barcode'],) for variant in variant_data]
-        )
+            ordered = await cursor.fetchone()
+            if not ordered or ordered[0] is None:
+                raise HTTPException(status_code=404, detail="No products found for this order.")
+            order_quantity = int(ordered[0])
+
+            # The variants were reserved when the order was confirmed. Orders confirmed
+            # before reservations existed get theirs reserved now.
+            variant_data = await reservations.get_reserved_variants(cursor, orderID)
+            if len(variant_data) < order_quantity:
+                shortfalls = await reservations.reserve_order(cursor, orderID)
+                if shortfalls:
+                    shortfall = shortfalls[0]
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Not enough available variants for productID {shortfall['productID']}. "
+                               f"Required: {shortfall['required']}, Available: {shortfall['available']}"
+                    )
+                variant_data = await reservations.get_reserved_variants(cursor, orderID)
+            logging.info(f"Reserved variants for order {orderID}: {len(variant_data)}")
+            return variant_data
+        variant_data = await database.run_in_transaction(prepare_delivery)
 
         # Send the prepared variants to IMS
         ims_api_url = 'http://127.0.0.1:8000/receive-orders/ims/variants/receive'
@@ -511,16 +368,16 @@ async def delivered_order(orderID: int):
         if ims_response.get('status') != 'success':
             raise HTTPException(status_code=500, detail="Failed to send order data to IMS.")
 
-        # Update order status to 'Delivered'
-        await cursor.execute(
-            '''UPDATE purchaseOrders
-               SET orderStatus = 'Delivered', statusDate = ?
-               WHERE orderID = ?''',
-            (datetime.utcnow(), orderID)
-        )
-
-        # Commit the changes
-        await conn.commit()
+        # Mark the variants sent to IMS unavailable, deduct stock and set the order to 'Delivered'.
+        # Nothing is claimed unless every one of them still belongs to the order and it is still 'To Ship'.
+        async def claim(cursor):
+            claimed = await reservations.claim_order(cursor, orderID, [variant['barcode'] for variant in variant_data])
+            if claimed != len(variant_data):
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Order {orderID} changed while it was sent to IMS: sent {len(variant_data)} variants but could claim {claimed}."
+                )
+        await database.run_in_transaction(claim)
 
         logging.info(f"Sending payload to IMS: {json.dumps(payload, indent=4)}")
         return {
@@ -528,211 +385,83 @@ async def delivered_order(orderID: int):
             'imsResponse': ims_response
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error delivering order: {e}")
         raise HTTPException(status_code=500, detail=f"Error delivering order: {e}")
-    finally:
-        if conn:
-            await conn.close()
-
 
+# Function to send a payload to IMS, retrying failed attempts
 async def send_to_ims_api_with_retries(url, payload, retries=3, delay=2):
     for attempt in range(retries):
         try:
             logging.info(f"Attempt {attempt + 1} to send payload to IMS: {json.dumps(payload)}")
-            async with ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    response_body = await response.text()
-                    logging.info(f"IMS response (status: {response.status}): {response_body}")
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        logging.error(f"IMS API returned non-200 status: {response.status}")
+            response = await ims_client.client().post(url, json=payload)
+            logging.info(f"IMS response (status: {response.status_code}): {response.text}")
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logging.error(f"IMS API returned non-200 status: {response.status_code}")
         except Exception as e:
             logging.error(f"Attempt {attempt + 1} failed: {e}")
         await asyncio.sleep(delay)
     raise HTTPException(status_code=500, detail="Failed to send data to IMS after multiple attempts.")
 
 @router.get('/vms/orders/delivered')
-async def get_order_details():
-    conn = None
-    try:
-        # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'Delivered'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        return order_summaries
-
-    except Exception as e:
-        print(f"Error occurred: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
+@singleflight.coalesce
+async def get_order_details(include_archived: bool = False):
+    return await fetch_order_summaries('Delivered', include_archived)
 
 #Completed
 @router.get('/vms/orders/Completed')
-async def get_order_details():
-    conn = None
-    try:
-        # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  -- Include imagePath from the Products table
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'Received'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
+@singleflight.coalesce
+async def get_order_details(include_archived: bool = False):
+    return await fetch_order_summaries('Received', include_archived)
 
-        return order_summaries
-
-    except Exception as e:
-        print(f"Error occurred: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
-            
 #TOTAL REVENUE FOR COMPLETED ORDERS 1 MONTH
 @router.get('/vms/orders/Completed/total-price/last30days')
+@singleflight.coalesce
 async def get_total_price_last_30_days():
-    conn = None
     try:
-        # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to sum the totalPrice of all completed orders from the last 30 days
-        query = """
-        SELECT 
-            SUM(p.unitPrice * pod.orderQuantity) AS totalPrice
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        WHERE
-            po.orderStatus = 'Received'
-            AND po.orderDate >= DATEADD(DAY, -30, GETDATE())  -- Filter for the last 30 days
-        """
-        await cursor.execute(query)
-        result = await cursor.fetchone()
-
-        # Extract total price from the result
-        total_price_last_30_days = result[0] if result[0] is not None else 0
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        # Return the total price
-        return {"totalPriceLast30Days": total_price_last_30_days}
+        async with database.unit_of_work() as cursor:
+            # Query to sum the totalPrice of all completed orders from the last 30 days.
+            # Filtering orderMonth too limits both tables to the partitions of those months.
+            query = """
+            DECLARE @since DATETIME = DATEADD(DAY, -30, GETDATE());
+            DECLARE @sinceMonth DATE = DATEFROMPARTS(YEAR(@since), MONTH(@since), 1);
+            SELECT 
+                SUM(pod.lineTotal) AS totalPrice
+            FROM 
+                purchaseOrderDetails pod
+            JOIN 
+                purchaseOrders po ON pod.orderMonth = po.orderMonth AND pod.orderID = po.orderID
+            WHERE
+                po.orderStatus = 'Received'
+                AND po.orderMonth >= @sinceMonth
+                AND pod.orderMonth >= @sinceMonth
+                AND po.orderDate >= @since  -- Filter for the last 30 days
+            """
+            await cursor.execute(query)
+            result = await cursor.fetchone()
+
+            # Extract total price from the result
+            total_price_last_30_days = result[0] if result[0] is not None else 0
+
+
+            # Return the total price
+            return {"totalPriceLast30Days": total_price_last_30_days}
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching total price for last 30 days: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
 
 @router.post('/vms/orders/update-status')
 async def update_order_status(order_update: OrderUpdate):
     order_id = order_update.orderID
     order_status = order_update.orderStatus
-    conn = None
-
-    try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
 
+    # the status change and the release of reserved variants commit together
+    async def apply_update(cursor):
         # validate order existence in VMS
         await cursor.execute(
             '''select orderStatus 
@@ -743,6 +472,9 @@ async def update_order_status(order_update: OrderUpdate):
         existing_order = await cursor.fetchone()
 
         if not existing_order:
+            # closed orders move to the archive and can no longer change
+            if await archive.is_archived_order(cursor, order_id):
+                raise HTTPException(status_code=409, detail="Order is archived.")
             raise HTTPException(status_code=404, detail="Order not found.")
         
         # log the current status for debugging
@@ -750,7 +482,7 @@ async def update_order_status(order_update: OrderUpdate):
 
         # check if the status update is valid
         if existing_order[0] == order_status:
-            return {"message": "Order status is already up-to-date."}
+            return False
         
         # update the order status
         await cursor.execute(
@@ -760,14 +492,24 @@ async def update_order_status(order_update: OrderUpdate):
             where orderID = ?''',
             (order_status, order_id)
         )
-        await conn.commit()
+
+        # cancelled or rejected orders give their reserved variants back
+        if order_status in reservations.RELEASE_STATUSES:
+            await reservations.release_order(cursor, order_id)
+        # delivered or received orders are counted into the sales rollup (once)
+        if order_status in analytics.SALE_STATUSES:
+            await analytics.rollup_orders(cursor, [order_id])
+        return True
+
+    try:
+        if not await database.run_in_transaction(apply_update):
+            return {"message": "Order status is already up-to-date."}
 
         logging.info(f"Order {order_id} status updated to {order_status}")
         return {"message": f"Order {order_id} status updated to {order_status}"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error updating order status: {e}")
         raise HTTPException(status_code=500, detail="Failed to update order status.")
-    finally:
-        if conn:
-            await conn.close()
\ No newline at end of file
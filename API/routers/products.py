@@ -1,16 +1,29 @@
-from fastapi import File, UploadFile, HTTPException, APIRouter, Depends
-from pydantic import BaseModel
+from fastapi import File, UploadFile, HTTPException, APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+import barcode_index
+import catalogue_import
+import catalogue_replica
+import change_feed
 import database
+import invalidation
+import jobs
+import loaders
+import product_groups
+import singleflight
+import stock_alerts
+import stock_ledger
+import serialization
 import random
 import string
 import os
 import base64
-from typing import Optional
+from typing import List, Optional
 from routers.auth import get_current_user
 
 # Directory for saving uploaded images
 UPLOAD_DIRECTORY = "images_upload"
-os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
 # Function to generate a unique filename for images
 def generate_image_filename():
@@ -31,12 +44,31 @@ def save_base64_image(base64_image: str) -> str:
         image_data = base64.b64decode(base64_image)
         filename = generate_image_filename()
         filepath = os.path.join(UPLOAD_DIRECTORY, filename)
+        os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
         with open(filepath, "wb") as file:
             file.write(image_data)
         return filepath
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid Base64 image: {str(e)}")
 
+# Function to normalize a stored image path for the frontend
+def normalize_image_path(image_path):
+    return image_path.replace("\\", "/") if image_path else "placeholder.png"
+
+# The category listings return the image path (column 5) normalized under "image_path"
+CATEGORY_IMAGE_PATH = {"image_path": (5, normalize_image_path)}
+
+# Mappers for the rows the catalogue replica returns, named like the columns of the queries they replace
+PRODUCTS_MAPPER = serialization.RowMapper(
+    ("productName", "productDescription", "size", "color", "unitPrice", "available quantity"))
+CATEGORY_MAPPER = serialization.RowMapper(
+    ("productName", "productDescription", "category", "size", "unitPrice", "image_path",
+     "available quantity", "currentStock", "productGroupID"), CATEGORY_IMAGE_PATH)
+
+# Function to tell whether a read is answered from the catalogue replica (bypass_replica=true reads the database)
+def use_replica(bypass_replica: bool) -> bool:
+    return not bypass_replica and catalogue_replica.replica.loaded
+
 # function to generate barcode
 def generate_barcode():
     characters = string.ascii_uppercase + string.digits
@@ -49,6 +81,70 @@ def generate_sku():
     sku = ''.join(random.choices(characters, k=8))
     return sku
 
+# Rows per multi-row variant INSERT (3 parameters each, SQL Server allows 2100 per statement)
+VARIANT_INSERT_CHUNK = 500
+
+# Function to insert quantity new variants of a product
+async def insert_variants(cursor, product_id: int, quantity: int):
+    """
+    Insert the variants with multi-row INSERTs and return their (variantID, barcode) pairs.
+    The barcode index picks them up once the surrounding unit of work commits.
+    """
+    return (await insert_product_variants(cursor, {product_id: quantity})).get(product_id, [])
+
+# Function to insert new variants for several products at once
+async def insert_product_variants(cursor, quantities: dict):
+    """
+    Insert quantities[productID] variants per product, packing rows of different
+    products into the same multi-row INSERTs. Returns {productID: [(variantID, barcode)]}.
+    """
+    rows = [product_id for product_id, quantity in quantities.items() for _ in range(quantity)]
+    inserted = {}
+    for start in range(0, len(rows), VARIANT_INSERT_CHUNK):
+        chunk = rows[start:start + VARIANT_INSERT_CHUNK]
+        params = []
+        for product_id in chunk:
+            params.extend((generate_barcode(), generate_sku(), product_id))
+        await cursor.execute(
+            '''INSERT INTO ProductVariants (barcode, productCode, productID)
+            OUTPUT inserted.variantID, inserted.barcode, inserted.productID
+            VALUES ''' + ", ".join(["(?, ?, ?)"] * len(chunk)),
+            params)
+        for variant_id, barcode, product_id in await cursor.fetchall():
+            inserted.setdefault(product_id, []).append((variant_id, barcode))
+
+    def index_variants():
+        for product_id, variants in inserted.items():
+            barcode_index.index.add_variants(product_id, variants)
+
+    database.after_commit(index_variants)
+    invalidation.publish_after_commit(
+        "ProductVariants", [barcode for variants in inserted.values() for _, barcode in variants])
+    await stock_ledger.record(cursor, 'receipt', {product_id: len(variants) for product_id, variants in inserted.items()})
+    await stock_alerts.refresh(cursor, inserted)
+    return inserted
+
+# Most changes (or rule product groups) one bulk update may carry
+MAX_BULK_CHANGES = 2000
+
+# Quantities above this are added by a background job instead of inside the request
+LARGE_QUANTITY = 2000
+
+# Job chunk: add variants of payload["productID"] and, for adjustStock, count them into currentStock
+@jobs.handler("add_variants")
+async def add_variants_chunk(cursor, payload: dict, start: int, count: int):
+    await insert_variants(cursor, payload["productID"], count)
+    if payload.get("adjustStock"):
+        await cursor.execute('''UPDATE Products SET currentStock = currentStock + ?
+                                WHERE productID = ?''', (count, payload["productID"]))
+
+# Function to answer 202 Accepted for work handed to a background job
+def job_accepted(job_id: int, **details):
+    return JSONResponse(
+        status_code=202,
+        content={"jobID": job_id, "status": "queued", "statusUrl": f"/jobs/{job_id}", **details},
+    )
+
 router = APIRouter()
 
 # Pydantic model for products
@@ -102,6 +198,7 @@ class ADDSIZE(BaseModel):
     unitPrice: float
     quantity: int  
     image_path: str 
+    productGroupID: Optional[int] = None
 
 class ProductUpdates(BaseModel):
     productName: str  # Current product name
@@ -113,6 +210,7 @@ class ProductUpdates(BaseModel):
     newCategory: str  # New category
     newUnitPrice: float  # New unit price
     newImage: str  # New image URL or path
+    productGroupID: Optional[int] = None  # Current product group, when the client knows it
     
 # class Product(BaseModel):
 #     productName: str
@@ -120,6 +218,29 @@ class ProductUpdates(BaseModel):
 #     category: str
 #     unitPrice: float
 
+# One change of a bulk update: the product group (by ID or by name, category and
+# description), optionally one size of it, and the new values
+class ProductChange(BaseModel):
+    productGroupID: Optional[int] = None
+    productName: Optional[str] = None
+    productDescription: Optional[str] = None
+    category: Optional[str] = None
+    size: Optional[str] = None
+    newUnitPrice: Optional[float] = Field(default=None, gt=0)
+    newImage: Optional[str] = None
+
+# Repricing rule, e.g. {"category": "Women", "percent": 5}: new price = price * (1 + percent / 100) + amount
+class PriceRule(BaseModel):
+    category: Optional[str] = None
+    productGroupIDs: Optional[List[int]] = Field(default=None, max_length=MAX_BULK_CHANGES)
+    size: Optional[str] = None
+    percent: float = Field(default=0, gt=-100)
+    amount: float = 0
+
+class BulkProductUpdate(BaseModel):
+    changes: List[ProductChange] = Field(default=[], max_length=MAX_BULK_CHANGES)
+    rule: Optional[PriceRule] = None
+
 class ProductSizeUpdate(BaseModel):
     productName: str
     productDescription: str
@@ -127,202 +248,309 @@ class ProductSizeUpdate(BaseModel):
     category: str
     unitPrice: float
     newSize: str
+    productGroupID: Optional[int] = None
     
 
 @router.post('/products')
 async def add_product(product: Product):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
     try:
-        # Save the Base64 image to file and get the path
+        # Save the Base64 image to file and get the path (once, not per deadlock retry)
         image_path = save_base64_image(product.image)
 
-        # Check if the product already exists with the same productName and category
-        await cursor.execute(''' 
-            SELECT productID, productName, productDescription, size, category, unitPrice
-            FROM Products
-            WHERE productName = ? AND category = ? AND isActive = 1
-        ''', (product.productName, product.category))
-        existing_product = await cursor.fetchone()
-
-        if existing_product:
-            # If an existing product with the same productName and category is found
-            return {'message': f'Product "{product.productName}" with category "{product.category}" already exists. Add more size if needed.'}
-
-        # Insert new product into Products table
-        await cursor.execute(''' 
-            INSERT INTO Products (
-                productName, productDescription, size, category, 
-                unitPrice, image_path, currentStock, isActive
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, 1)
-        ''', (product.productName, product.productDescription, product.size, 
-              product.category, product.unitPrice, image_path, product.quantity))
-        await conn.commit()
-
-        # Retrieve the last inserted productID using @@IDENTITY
-        await cursor.execute('SELECT @@IDENTITY')
-        product_id_row = await cursor.fetchone()
-
-        # Debugging: Log the result of @@IDENTITY
-        print(f"@@IDENTITY result: {product_id_row}")
-
-        product_id = product_id_row[0] if product_id_row else None
-
-        if not product_id:
-            raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion.')
-
-        # Insert product variants
-        variants_data = [
-            (generate_barcode(), generate_sku(), product_id) for _ in range(product.quantity)
-        ]
-        await cursor.executemany('''
-            INSERT INTO ProductVariants (barcode, productCode, productID)
-            VALUES (?, ?, ?)
-        ''', variants_data)
-        await conn.commit()
-
-        return {'message': f'Product "{product.productName}" added with {product.quantity} variants.'}
+        async def insert_product(cursor):
+            # Check if the product already exists with the same productName and category
+            await cursor.execute(''' 
+                SELECT productID, productName, productDescription, size, category, unitPrice
+                FROM Products
+                WHERE productName = ? AND category = ? AND isActive = 1
+            ''', (product.productName, product.category))
+            existing_product = await cursor.fetchone()
+
+            if existing_product:
+                # If an existing product with the same productName and category is found
+                return {'message': f'Product "{product.productName}" with category "{product.category}" already exists. Add more size if needed.'}
+
+            # Insert new product into Products table
+            product_group_id = await product_groups.ensure_group(
+                cursor, product.productName, product.productDescription, product.category)
+            await cursor.execute(''' 
+                INSERT INTO Products (
+                    productName, productDescription, size, category, 
+                    unitPrice, image_path, currentStock, isActive, productGroupID
+                )
+                OUTPUT inserted.productID
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            ''', (product.productName, product.productDescription, product.size, 
+                  product.category, product.unitPrice, image_path, product.quantity, product_group_id))
+            product_id_row = await cursor.fetchone()
+            product_id = product_id_row[0] if product_id_row else None
+
+            if not product_id:
+                raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion.')
+
+            # Insert product variants
+            await insert_variants(cursor, product_id, product.quantity)
+            invalidation.publish_after_commit("Products", [int(product_id)])
+
+            return {'message': f'Product "{product.productName}" added with {product.quantity} variants.'}
+        return await database.run_in_transaction(insert_product)
     
     except Exception as e:
-        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        await conn.close()
 
 
 @router.post('/products/updateSize')
 async def update_product(productData: ProductSizeUpdate):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-
     try:
-        # Step 1: Select the productID based on given fields
-        await cursor.execute(''' 
-            SELECT productID FROM Products 
-            WHERE productName = ? AND productDescription = ? AND size = ? 
-                  AND category = ? AND unitPrice = ? AND isActive = 1
-            ''',
-            productData.productName, 
-            productData.productDescription, 
-            productData.size, 
-            productData.category, 
-            float(productData.unitPrice)
-        )
-
-        product_row = await cursor.fetchone()
-        if not product_row:
+        # Resolve the product group (name, description, category) through the group-ID cache
+        group_ids = await product_groups.resolve_group_ids(
+            productData.productGroupID, productData.productName,
+            productData.category, productData.productDescription)
+        if not group_ids:
             raise HTTPException(
                 status_code=404,
                 detail=f"Product '{productData.productName}' not found with the given details."
             )
+        in_groups = product_groups.placeholders(group_ids)
 
-        # Extract the productID
-        product_id = product_row[0]
+        async def rename_size(cursor):
+            # Step 1: Select the productID based on given fields
+            await cursor.execute(f''' 
+                SELECT productID FROM Products 
+                WHERE productGroupID IN ({in_groups}) AND size = ? AND isActive = 1
+                ''',
+                *group_ids,
+                productData.size
+            )
 
-        # Step 2: Check if the new size already exists for the same productName
-        await cursor.execute('''
-            SELECT 1 FROM Products 
-            WHERE productName = ? AND size = ? AND isActive = 1
-            ''', productData.productName, productData.newSize)
+            product_row = await cursor.fetchone()
+            if not product_row:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Product '{productData.productName}' not found with the given details."
+                )
 
-        existing_size = await cursor.fetchone()
-        if existing_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Size '{productData.newSize}' already exists for the product '{productData.productName}'."
-            )
+            # Extract the productID
+            product_id = product_row[0]
 
-        # Step 3: Check if the current size is different from the new size before updating
-        if productData.size == productData.newSize:
-            raise HTTPException(
-                status_code=400,
-                detail="The size is already set to the new size. No changes are needed."
-            )
+            # Step 2: Check if the new size already exists for the same product
+            await cursor.execute(f'''
+                SELECT 1 FROM Products 
+                WHERE productGroupID IN ({in_groups}) AND size = ? AND isActive = 1
+                ''', *group_ids, productData.newSize)
 
-        # Step 4: Update the size
-        await cursor.execute(''' 
-            UPDATE Products
-            SET size = ?
-            WHERE productID = ? AND isActive = 1
-            ''', 
-            productData.newSize,
-            product_id
-        )
-        await conn.commit()
+            existing_size = await cursor.fetchone()
+            if existing_size:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Size '{productData.newSize}' already exists for the product '{productData.productName}'."
+                )
 
-        # Step 5: Return success message with updated data
-        return {
-            "message": f"Product with ID {product_id} updated successfully.",
-            "updated_product": {
-                "productID": product_id,
-                "newSize": productData.newSize
+            # Step 3: Check if the current size is different from the new size before updating
+            if productData.size == productData.newSize:
+                raise HTTPException(
+                    status_code=400,
+                    detail="The size is already set to the new size. No changes are needed."
+                )
+
+            # Step 4: Update the size
+            await cursor.execute(''' 
+                UPDATE Products
+                SET size = ?
+                WHERE productID = ? AND isActive = 1
+                ''', 
+                productData.newSize,
+                product_id
+            )
+            invalidation.publish_after_commit("Products", [product_id])
+
+            # Step 5: Return success message with updated data
+            return {
+                "message": f"Product with ID {product_id} updated successfully.",
+                "updated_product": {
+                    "productID": product_id,
+                    "newSize": productData.newSize
+                }
             }
-        }
+        return await database.run_in_transaction(rename_size)
 
     except Exception as e:
-        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
-
 
 @router.put('/products/update-details')
 async def update_product_details(productData: ProductUpdates):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-
     try:
-        # Step 1: Update all matching products based on the current values
-        await cursor.execute(
-            '''UPDATE Products
-               SET productName = ?, productDescription = ?, category = ?, unitPrice = ?, image_path = ?
-               WHERE productName = ? AND productDescription = ? AND category = ? AND unitPrice = ? AND isActive = 1''',
-            productData.newProductName, productData.newProductDescription, productData.newCategory, 
-            float(productData.newUnitPrice), productData.newImage, 
-            productData.productName, productData.productDescription, productData.category, float(productData.unitPrice)
-        )
-        await conn.commit()
-
-        # Step 2: Fetch the updated products to confirm the changes
-        await cursor.execute(
-            '''SELECT productName, productDescription, category, unitPrice, image_path
-               FROM Products
-               WHERE productName = ? AND productDescription = ? AND category = ? AND unitPrice = ? AND isActive = 1''',
-            productData.newProductName, productData.newProductDescription, productData.newCategory, 
-            float(productData.newUnitPrice)
-        )
-        updated_products = await cursor.fetchall()
-
-        if not updated_products:
+        # The products being edited are found by their current group, not by text and float matching
+        group_ids = await product_groups.resolve_group_ids(
+            productData.productGroupID, productData.productName,
+            productData.category, productData.productDescription)
+        if not group_ids:
             raise HTTPException(
                 status_code=404,
                 detail=f"No products found with the specified criteria."
             )
+        in_groups = product_groups.placeholders(group_ids)
 
-        return {
-            "message": f"Products updated successfully.",
-            "updated_products": [
-                {
-                    "productName": product[0],
-                    "productDescription": product[1],
-                    "category": product[2],
-                    "unitPrice": product[3],
-                    "image_path": product[4]
-                } for product in updated_products
-            ]
-        }
+        async def update_details(cursor):
+            # Renamed products move to the group of their new name, description and category
+            new_group_id = await product_groups.ensure_group(
+                cursor, productData.newProductName, productData.newProductDescription, productData.newCategory)
+
+            # Step 1: Update all matching products based on the current values
+            await cursor.execute(
+                f'''UPDATE Products
+                   SET productName = ?, productDescription = ?, category = ?, unitPrice = ?, image_path = ?,
+                       productGroupID = ?
+                   OUTPUT inserted.productID
+                   WHERE productGroupID IN ({in_groups}) AND isActive = 1''',
+                productData.newProductName, productData.newProductDescription, productData.newCategory, 
+                float(productData.newUnitPrice), productData.newImage, new_group_id,
+                *group_ids
+            )
+            invalidation.publish_after_commit("Products", [row[0] for row in await cursor.fetchall()])
+
+            # Step 2: Fetch the updated products to confirm the changes
+            await cursor.execute(
+                '''SELECT productName, productDescription, category, unitPrice, image_path
+                   FROM Products
+                   WHERE productGroupID = ? AND isActive = 1''',
+                new_group_id
+            )
+            updated_products = await cursor.fetchall()
+
+            if not updated_products:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No products found with the specified criteria."
+                )
+
+            return {
+                "message": f"Products updated successfully.",
+                "updated_products": [
+                    {
+                        "productName": product[0],
+                        "productDescription": product[1],
+                        "category": product[2],
+                        "unitPrice": product[3],
+                        "image_path": product[4]
+                    } for product in updated_products
+                ]
+            }
+        return await database.run_in_transaction(update_details)
     except Exception as e:
-        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
         
+# Apply every change of a batch with one set-based UPDATE. When a product matches
+# a group-wide change and a change for its size, the size's change wins.
+BULK_CHANGES_SQL = '''
+SET NOCOUNT ON;
+DECLARE @changes TABLE (productGroupID INT, size NVARCHAR(50), unitPrice FLOAT, image_path NVARCHAR(255));
+
+INSERT INTO @changes (productGroupID, size, unitPrice, image_path)
+SELECT productGroupID, size, unitPrice, image_path
+FROM OPENJSON(?) WITH (productGroupID INT, size NVARCHAR(50), unitPrice FLOAT, image_path NVARCHAR(255));
+
+UPDATE p
+SET unitPrice = ISNULL(c.unitPrice, p.unitPrice),
+    image_path = COALESCE(c.image_path, CAST(p.image_path AS NVARCHAR(MAX)))
+OUTPUT inserted.productID, inserted.productGroupID, inserted.productName, inserted.category,
+       inserted.size, deleted.unitPrice, inserted.unitPrice
+FROM Products AS p
+CROSS APPLY (SELECT TOP 1 c.unitPrice, c.image_path FROM @changes AS c
+             WHERE c.productGroupID = p.productGroupID AND (c.size IS NULL OR c.size = p.size)
+             ORDER BY CASE WHEN c.size IS NULL THEN 1 ELSE 0 END) AS c
+WHERE p.isActive = 1;
+'''
+
+# bulk price and attribute update across product groups
+@router.post('/products/bulk-update')
+async def bulk_update_products(update: BulkProductUpdate):
+    """
+    Apply a pricing rule and/or a list of changes in one transaction and return
+    the updated rows with their old and new prices. Caches are invalidated once
+    for the whole batch after it commits.
+    """
+    if not update.changes and update.rule is None:
+        raise HTTPException(status_code=422, detail="Nothing to update: give changes or a rule.")
+    rule = update.rule
+    if rule is not None and rule.category is None and not rule.productGroupIDs:
+        raise HTTPException(status_code=422, detail="A rule needs a category or productGroupIDs.")
+
+    # Resolve every change to its product groups through the group-ID cache
+    changes = []
+    not_found = []
+    for position, change in enumerate(update.changes):
+        if change.newUnitPrice is None and change.newImage is None:
+            raise HTTPException(status_code=422, detail=f"Change {position} sets nothing.")
+        group_ids = await product_groups.resolve_group_ids(
+            change.productGroupID, change.productName, change.category, change.productDescription)
+        if not group_ids:
+            not_found.append(position)
+        changes.extend({
+            "productGroupID": group_id,
+            "size": change.size,
+            "unitPrice": change.newUnitPrice,
+            "image_path": change.newImage,
+        } for group_id in group_ids)
+
+    async def apply(cursor):
+        updated = []
+        if rule is not None:
+            filters, params = ["isActive = 1"], [1 + rule.percent / 100, rule.amount]
+            if rule.category is not None:
+                filters.append("category = ?")
+                params.append(rule.category)
+            if rule.productGroupIDs:
+                filters.append(f"productGroupID IN ({product_groups.placeholders(rule.productGroupIDs)})")
+                params.extend(rule.productGroupIDs)
+            if rule.size is not None:
+                filters.append("size = ?")
+                params.append(rule.size)
+            await cursor.execute(
+                f'''UPDATE Products
+                   SET unitPrice = ROUND(unitPrice * ? + ?, 2)
+                   OUTPUT inserted.productID, inserted.productGroupID, inserted.productName, inserted.category,
+                          inserted.size, deleted.unitPrice, inserted.unitPrice
+                   WHERE {" AND ".join(filters)}''',
+                params)
+            updated.extend(await cursor.fetchall())
+            # a rule that takes any price to zero or below is rejected as a whole
+            if any(row[6] <= 0 for row in updated):
+                raise HTTPException(status_code=422, detail="The rule would make some prices zero or negative.")
+        if changes:
+            await cursor.execute(BULK_CHANGES_SQL, (serialization.dumps(changes).decode(),))
+            updated.extend(await cursor.fetchall())
+        invalidation.publish_after_commit("Products", {row[0] for row in updated})
+        return updated
+
+    try:
+        updated = await database.run_in_transaction(apply)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in bulk product update: {e}")
+        raise HTTPException(status_code=500, detail=f"Error in bulk product update: {e}")
+
+    return {
+        "updatedCount": len(updated),
+        "notFound": not_found,
+        "updated": [
+            {
+                "productID": row[0],
+                "productGroupID": row[1],
+                "productName": row[2],
+                "category": row[3],
+                "size": row[4],
+                "oldUnitPrice": row[5],
+                "unitPrice": row[6],
+            } for row in updated
+        ],
+    }
+
 @router.patch('/products/soft-delete')
 async def soft_delete_products(productName: str, category: str):
-    conn = await database.get_db_connection()
     try:
-        async with conn.cursor() as cursor:
+        async def deactivate_products(cursor):
             # Check if products exist and are currently active
             await cursor.execute(''' 
                 SELECT COUNT(*) 
@@ -341,202 +569,208 @@ async def soft_delete_products(productName: str, category: str):
             await cursor.execute(''' 
                 UPDATE Products 
                 SET isActive = 0 
+                OUTPUT inserted.productID
                 WHERE productName = ? 
                 AND category = ? 
             ''', (productName, category))
+            # inactive products leave the low-stock list
+            deleted_ids = [row[0] for row in await cursor.fetchall()]
+            await stock_alerts.refresh(cursor, deleted_ids)
+            invalidation.publish_after_commit("Products", deleted_ids)
 
-            await conn.commit()
             return {"detail": "Products soft deleted successfully"}
+        return await database.run_in_transaction(deactivate_products)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # Get all Women's products
 @router.get("/products/Womens-Leather-Shoes")
-async def get_womens_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
+@singleflight.coalesce
+async def get_womens_products(bypass_replica: bool = False):
+    if use_replica(bypass_replica):
+        return serialization.rows_response(catalogue_replica.replica.category_listing('Women'), CATEGORY_MAPPER)
+    async with database.unit_of_work() as cursor:
         await cursor.execute(
             '''SELECT p.productName, p.productDescription, p.category,
                 p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
+                COUNT(pv.variantID) AS 'available quantity', p.currentStock, p.productGroupID
             FROM products AS p
             LEFT JOIN ProductVariants AS pv
             ON p.productID = pv.productID
             WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'Women'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
+            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max)), p.productGroupID
             '''
         )
         
         products = await cursor.fetchall()
-        # Map column names to row values
+        # Map column names to row values (compiled once per query)
         # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+        mapper = serialization.mapper_for("womens_products", cursor.description, CATEGORY_IMAGE_PATH)
+        return serialization.rows_response(products, mapper)
 
 
 # get all Mens products
 @router.get("/products/mens-Leather-Shoes")
-async def get_mens_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
+@singleflight.coalesce
+async def get_mens_products(bypass_replica: bool = False):
+    if use_replica(bypass_replica):
+        return serialization.rows_response(catalogue_replica.replica.category_listing('men'), CATEGORY_MAPPER)
+    async with database.unit_of_work() as cursor:
         await cursor.execute(
             '''SELECT p.productName, p.productDescription, p.category,
                 p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
+                COUNT(pv.variantID) AS 'available quantity', p.currentStock, p.productGroupID
             FROM products AS p
             LEFT JOIN ProductVariants AS pv
             ON p.productID = pv.productID
             WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'men'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
+            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max)), p.productGroupID
             '''
         )
         
         products = await cursor.fetchall()
-        # Map column names to row values
+        # Map column names to row values (compiled once per query)
         # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+        mapper = serialization.mapper_for("mens_products", cursor.description, CATEGORY_IMAGE_PATH)
+        return serialization.rows_response(products, mapper)
 
 # get all girls products
 @router.get("/products/girls-Leather-Shoes")
-async def get_girls_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
+@singleflight.coalesce
+async def get_girls_products(bypass_replica: bool = False):
+    if use_replica(bypass_replica):
+        return serialization.rows_response(catalogue_replica.replica.category_listing('girls'), CATEGORY_MAPPER)
+    async with database.unit_of_work() as cursor:
         await cursor.execute(
             '''SELECT p.productName, p.productDescription, p.category,
                 p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
+                COUNT(pv.variantID) AS 'available quantity', p.currentStock, p.productGroupID
             FROM products AS p
             LEFT JOIN ProductVariants AS pv
             ON p.productID = pv.productID
             WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'girls'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
+            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max)), p.productGroupID
             '''
         )
         
         products = await cursor.fetchall()
-        # Map column names to row values
+        # Map column names to row values (compiled once per query)
         # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+        mapper = serialization.mapper_for("girls_products", cursor.description, CATEGORY_IMAGE_PATH)
+        return serialization.rows_response(products, mapper)
 
 # get all boys products
 @router.get("/products/boys-Leather-Shoes")
-async def get_boys_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
+@singleflight.coalesce
+async def get_boys_products(bypass_replica: bool = False):
+    if use_replica(bypass_replica):
+        return serialization.rows_response(catalogue_replica.replica.category_listing('boys'), CATEGORY_MAPPER)
+    async with database.unit_of_work() as cursor:
         await cursor.execute(
             '''SELECT p.productName, p.productDescription, p.category,
                 p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
+                COUNT(pv.variantID) AS 'available quantity', p.currentStock, p.productGroupID
             FROM products AS p
             LEFT JOIN ProductVariants AS pv
             ON p.productID = pv.productID
             WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'boys'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
+            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max)), p.productGroupID
             '''
         )
         
         products = await cursor.fetchall()
-        # Map column names to row values
+        # Map column names to row values (compiled once per query)
         # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+        mapper = serialization.mapper_for("boys_products", cursor.description, CATEGORY_IMAGE_PATH)
+        return serialization.rows_response(products, mapper)
 
 @router.get('/products/sizes')
+@singleflight.coalesce
 async def get_size(
-    productName: str, 
-    unitPrice: float, 
-    category: str, 
-    productDescription: Optional[str] = None
+    productName: Optional[str] = None, 
+    unitPrice: Optional[float] = None, 
+    category: Optional[str] = None, 
+    productDescription: Optional[str] = None,
+    productGroupID: Optional[int] = None,
+    bypass_replica: bool = False
 ):
-    conn = await database.get_db_connection()
+    # unitPrice is still accepted from older clients; the product group identifies the product
     try:
-        async with conn.cursor() as cursor:
-            # SQL query to fetch sizes
-            await cursor.execute(''' 
-                SELECT size, currentStock 
-                FROM Products 
-                WHERE productName = ? 
-                AND unitPrice = ? 
-                AND category = ?
-                AND (productDescription = ? OR ? IS NULL)
-                AND currentStock >= 1  
-                AND isActive = 1
-
-            ''', (productName, unitPrice, category, productDescription, productDescription))
-            
-            products = await cursor.fetchall()
-
-            if not products:
-                raise HTTPException(status_code=404, detail="Product sizes not found")
-
-            # Map the query results to the expected format
-            size_list = [{"size": product[0], "currentStock": product[1]} for product in products]
-            return {"size": size_list}  
+        group_ids = await product_groups.resolve_group_ids(productGroupID, productName, category, productDescription)
+        if not group_ids:
+            raise HTTPException(status_code=404, detail="Product sizes not found")
+
+        if use_replica(bypass_replica):
+            products = [(record.size, record.currentStock)
+                        for record in catalogue_replica.replica.group_products(group_ids)
+                        if record.currentStock >= 1]
+        else:
+            async with database.unit_of_work() as cursor:
+                # SQL query to fetch sizes
+                await cursor.execute(f''' 
+                    SELECT size, currentStock 
+                    FROM Products 
+                    WHERE productGroupID IN ({product_groups.placeholders(group_ids)})
+                    AND currentStock >= 1  
+                    AND isActive = 1
+                ''', group_ids)
+                products = await cursor.fetchall()
+
+        if not products:
+            raise HTTPException(status_code=404, detail="Product sizes not found")
+
+        # Map the query results to the expected format
+        size_list = [{"size": product[0], "currentStock": product[1]} for product in products]
+        return {"size": size_list}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
 
 @router.get('/products/size_variants', response_model=list[ProductVariantResponse])
-async def get_size_variants(productName: str, unitPrice: float, category: str, productDescription: Optional[str] = None):
-    conn = await database.get_db_connection()
-    #cursor = await conn.cursor()
-
+@singleflight.coalesce
+async def get_size_variants(
+    productName: Optional[str] = None,
+    unitPrice: Optional[float] = None,
+    category: Optional[str] = None,
+    productDescription: Optional[str] = None,
+    productGroupID: Optional[int] = None,
+    bypass_replica: bool = False
+):
+    # unitPrice is still accepted from older clients; the product group identifies the product
     try:
-     async with conn.cursor() as cursor:
+        group_ids = await product_groups.resolve_group_ids(productGroupID, productName, category, productDescription)
+        if not group_ids:
+            raise HTTPException(status_code=404, detail="Product not found.")
 
-        await cursor.execute(
-            '''SELECT p.size, pv.productCode, pv.barcode
-                FROM
-                    Products AS p
-                INNER JOIN
-                    ProductVariants AS pv
-                ON
-                    p.productID = pv.productID
-                WHERE
-                    p.isActive = 1
-                    AND pv.isAvailable = 1
-                    AND p.productName = ?
-                    AND (p.productDescription = ? OR ? IS NULL)
-                    AND p.unitPrice = ?
-                    AND p.category = ?;  
-            ''', (productName, productDescription, productDescription, unitPrice, category))
-        variants = await cursor.fetchall()
+        if use_replica(bypass_replica):
+            # the replica resolves the active sizes; only their variants are read from the database
+            sizes = {record.productID: record.size
+                     for record in catalogue_replica.replica.group_products(group_ids)}
+            variants = []
+            if sizes:
+                async with database.unit_of_work() as cursor:
+                    await cursor.execute(
+                        f'''SELECT productID, productCode, barcode
+                            FROM ProductVariants
+                            WHERE isAvailable = 1 AND productID IN ({product_groups.placeholders(sizes)})''',
+                        list(sizes))
+                    variants = [(sizes[row[0]], row[1], row[2]) for row in await cursor.fetchall()]
+        else:
+            async with database.unit_of_work() as cursor:
+                await cursor.execute(
+                    f'''SELECT p.size, pv.productCode, pv.barcode
+                        FROM
+                            Products AS p
+                        INNER JOIN
+                            ProductVariants AS pv
+                        ON
+                            p.productID = pv.productID
+                        WHERE
+                            p.isActive = 1
+                            AND pv.isAvailable = 1
+                            AND p.productGroupID IN ({product_groups.placeholders(group_ids)});  
+                    ''', group_ids)
+                variants = await cursor.fetchall()
 
         if variants:
             variant_list = [
@@ -552,152 +786,151 @@ async def get_size_variants(productName: str, unitPrice: float, category: str, p
             raise HTTPException(status_code=404, detail="Product not found.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:    
-        await conn.close()
 
 @router.post('/products_AddSize')
 async def add_product(product: ADDSIZE):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
     try:
-        # Step 1: Retrieve the existing image_path based on product name and description
-        await cursor.execute('''SELECT image_path 
-                                FROM Products 
-                                WHERE productName = ? 
-                                      AND productDescription = ? 
-                                      AND isActive = 1''',
-                             (product.productName, product.productDescription))
-
-        existing_product = await cursor.fetchone()
-        
-        if existing_product:
-            image_path = existing_product[0]  # Use the existing image path
-        else:
+        # The new size joins the product group of (name, description, category)
+        group_ids = await product_groups.resolve_group_ids(
+            product.productGroupID, product.productName, product.category, product.productDescription)
+        if not group_ids:
             raise HTTPException(status_code=404, detail="Original product not found. Cannot add new size.")
+        product_group_id = group_ids[0]
 
-        # Step 2: Check if the same product (name, description, and size) already exists
-        await cursor.execute('''SELECT productID, currentStock
-                                FROM Products
-                                WHERE productName = ? 
-                                      AND productDescription = ? 
-                                      AND size = ? 
-                                      AND isActive = 1''',
-                             (product.productName, product.productDescription, product.size))
-
-        existing_size = await cursor.fetchone()
-
-        if existing_size:
-            # If size exists, just update the quantity (currentStock)
-            product_id, current_stock = existing_size
-            new_quantity = current_stock + product.quantity  # Add the new quantity to existing stock
-
-            # Update the product quantity in the Products table
-            await cursor.execute('''UPDATE Products 
-                                    SET currentStock = ? 
-                                    WHERE productID = ?''', 
-                                 (new_quantity, product_id))
-            await conn.commit()
-
-            # Insert new variants into ProductVariants based on the new quantity
-            variants_data = [
-                (generate_barcode(), generate_sku(), product_id)
-                for _ in range(product.quantity)  # Creating variants based on quantity
-            ]
-            
-            await cursor.executemany('''INSERT INTO ProductVariants (barcode, productCode, productID)
-                                        VALUES (?, ?, ?);''', variants_data)
-            await conn.commit()
+        async def add_size(cursor):
+            # Step 1: Retrieve the existing image_path of the product group
+            await cursor.execute('''SELECT TOP 1 image_path 
+                                    FROM Products 
+                                    WHERE productGroupID = ? 
+                                          AND isActive = 1''',
+                                 (product_group_id,))
 
+            existing_product = await cursor.fetchone()
+        
+            if existing_product:
+                image_path = existing_product[0]  # Use the existing image path
+            else:
+                raise HTTPException(status_code=404, detail="Original product not found. Cannot add new size.")
+
+            # Step 2: Check if the same product (group and size) already exists
+            await cursor.execute('''SELECT productID, currentStock
+                                    FROM Products
+                                    WHERE productGroupID = ? 
+                                          AND size = ? 
+                                          AND isActive = 1''',
+                                 (product_group_id, product.size))
+
+            existing_size = await cursor.fetchone()
+
+            if existing_size:
+                # If size exists, just update the quantity (currentStock)
+                product_id, current_stock = existing_size
+
+                # Large quantities are added (and counted into currentStock) chunk by chunk in the background
+                if product.quantity > LARGE_QUANTITY:
+                    job_id = await jobs.enqueue(
+                        cursor, "add_variants", {"productID": product_id, "adjustStock": True}, product.quantity)
+                    return job_accepted(job_id, productID=product_id, quantity=product.quantity)
+
+                new_quantity = current_stock + product.quantity  # Add the new quantity to existing stock
+
+                # Update the product quantity in the Products table
+                await cursor.execute('''UPDATE Products 
+                                        SET currentStock = ? 
+                                        WHERE productID = ?''', 
+                                     (new_quantity, product_id))
+                invalidation.publish_after_commit("Products", [product_id])
+
+                # Insert new variants into ProductVariants based on the new quantity
+                await insert_variants(cursor, product_id, product.quantity)
+
+                return {
+                    "message": f"Quantity updated for product '{product.productName}' with size '{product.size}'. New quantity: {new_quantity}",
+                    "productID": product_id,
+                    "productName": product.productName,
+                    "productDescription": product.productDescription,
+                    "size": product.size,
+                    "quantity": new_quantity,
+                    "category": product.category,
+                    "unitPrice": product.unitPrice,
+                    "image_path": image_path
+                }
+
+            # Step 3: Insert the new product size if it does not exist
+            # Step 4: The new productID comes back from the insert itself
+            # (a large quantity starts at 0 and is counted in by the background job)
+            in_background = product.quantity > LARGE_QUANTITY
+            await cursor.execute('''INSERT INTO Products (
+                                        productName, productDescription, size, category,  
+                                        unitPrice, currentStock, image_path, productGroupID)
+                                    OUTPUT inserted.productID
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?);''',
+                                 (product.productName,
+                                  product.productDescription,
+                                  product.size,
+                                  product.category,
+                                  float(product.unitPrice),  
+                                  0 if in_background else product.quantity,  # Using 'quantity' for 'currentStock'
+                                  image_path,  # Reusing the existing image path
+                                  product_group_id))
+            product_id_row = await cursor.fetchone()
+            product_id = product_id_row[0] if product_id_row else None
+
+            if not product_id:
+                raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion')
+            invalidation.publish_after_commit("Products", [product_id])
+
+            # Step 5: Insert multiple variants into the productVariants table based on 'quantity'
+            if in_background:
+                job_id = await jobs.enqueue(
+                    cursor, "add_variants", {"productID": product_id, "adjustStock": True}, product.quantity)
+                return job_accepted(job_id, productID=product_id, quantity=product.quantity, image_path=image_path)
+            await insert_variants(cursor, product_id, product.quantity)
+
+            # Step 6: Return product size, quantity, and image_path in response
             return {
-                "message": f"Quantity updated for product '{product.productName}' with size '{product.size}'. New quantity: {new_quantity}",
                 "productID": product_id,
                 "productName": product.productName,
                 "productDescription": product.productDescription,
                 "size": product.size,
-                "quantity": new_quantity,
+                "quantity": product.quantity,
                 "category": product.category,
                 "unitPrice": product.unitPrice,
-                "image_path": image_path
+                "image_path": image_path  # Include the existing image path in the response
             }
-
-        # Step 3: Insert the new product size if it does not exist
-        await cursor.execute('''INSERT INTO Products (
-                                    productName, productDescription, size, category,  
-                                    unitPrice, currentStock, image_path)
-                                VALUES (?, ?, ?, ?, ?, ?, ?);''',
-                             (product.productName,
-                              product.productDescription,
-                              product.size,
-                              product.category,
-                              float(product.unitPrice),  
-                              product.quantity,  # Using 'quantity' for 'currentStock'
-                              image_path))  # Reusing the existing image path
-
-        await conn.commit()
-
-        # Step 4: Retrieve the last inserted productID using SQL Server's TOP 1 with ORDER BY
-        await cursor.execute('''SELECT TOP 1 productID 
-                                FROM Products 
-                                ORDER BY productID DESC''')
-        product_id_row = await cursor.fetchone()
-        product_id = product_id_row[0] if product_id_row else None
-
-        if not product_id:
-            raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion')
-
-        # Step 5: Insert multiple variants into the productVariants table based on 'quantity'
-        variants_data = [
-            (generate_barcode(), generate_sku(), product_id)
-            for _ in range(product.quantity)  # Creating variants based on quantity
-        ]
-        
-        await cursor.executemany('''INSERT INTO ProductVariants (barcode, productCode, productID)
-                                    VALUES (?, ?, ?);''', variants_data)
-        await conn.commit()
-
-        # Step 6: Return product size, quantity, and image_path in response
-        return {
-            "productID": product_id,
-            "productName": product.productName,
-            "productDescription": product.productDescription,
-            "size": product.size,
-            "quantity": product.quantity,
-            "category": product.category,
-            "unitPrice": product.unitPrice,
-            "image_path": image_path  # Include the existing image path in the response
-        }
+        return await database.run_in_transaction(add_size)
 
     except Exception as e:
-        await conn.rollback()
         # Log the exception for debugging purposes
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        await conn.close()
 
 
 #delete a size
 @router.patch('/products/sizes/soft-delete')
 async def soft_delete_size(
-    productName: str, 
-    unitPrice: float, 
-    category: str, 
-    size: str
+    size: str,
+    productName: Optional[str] = None, 
+    unitPrice: Optional[float] = None, 
+    category: Optional[str] = None, 
+    productGroupID: Optional[int] = None
 ):
-    conn = await database.get_db_connection()
+    # unitPrice is still accepted from older clients; the product group identifies the product
     try:
-        async with conn.cursor() as cursor:
+        group_ids = await product_groups.resolve_group_ids(productGroupID, productName, category)
+        if not group_ids:
+            raise HTTPException(status_code=404, detail="Product size not found or already inactive")
+        in_groups = product_groups.placeholders(group_ids)
+
+        async def deactivate_size(cursor):
             # Check if the size exists and is currently active
-            await cursor.execute('''
+            await cursor.execute(f'''
                 SELECT size 
                 FROM Products 
-                WHERE productName = ? 
-                AND unitPrice = ? 
-                AND category = ? 
+                WHERE productGroupID IN ({in_groups}) 
                 AND size = ? 
                 AND isActive = 1
-            ''', (productName, unitPrice, category, size))
+            ''', (*group_ids, size))
             
             product = await cursor.fetchone()
             
@@ -705,134 +938,274 @@ async def soft_delete_size(
                 raise HTTPException(status_code=404, detail="Product size not found or already inactive")
             
             # Perform the soft delete by setting isActive to 0
-            await cursor.execute('''
+            await cursor.execute(f'''
                 UPDATE Products 
                 SET isActive = 0 
-                WHERE productName = ? 
-                AND unitPrice = ? 
-                AND category = ? 
+                OUTPUT inserted.productID
+                WHERE productGroupID IN ({in_groups}) 
                 AND size = ?
-            ''', (productName, unitPrice, category, size))
+            ''', (*group_ids, size))
+            deleted_ids = [row[0] for row in await cursor.fetchall()]
+            await stock_alerts.refresh(cursor, deleted_ids)
+            invalidation.publish_after_commit("Products", deleted_ids)
             
-            await conn.commit()
             return {"detail": "Product size soft deleted successfully"}
+        return await database.run_in_transaction(deactivate_size)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
         
 #dashboard Total Products 
 @router.get("/products/count")
+@singleflight.coalesce
 async def count_unique_products():
-    conn = None
     try:
-        # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to count unique products by productName and category (grouped by productName and category)
-        query = """
-            SELECT COUNT(*)
-            FROM (
-                SELECT productName, category
-                FROM Products
-                WHERE isActive = 1
-                GROUP BY productName, category
-            ) AS unique_products;
-        """
-        await cursor.execute(query)
-        result = await cursor.fetchone()
-
-        # Return the count
-        return {"Total Products": result[0]}
+        async with database.unit_of_work() as cursor:
+            # Query to count unique products by productName and category (grouped by productName and category)
+            query = """
+                SELECT COUNT(*)
+                FROM (
+                    SELECT productName, category
+                    FROM Products
+                    WHERE isActive = 1
+                    GROUP BY productName, category
+                ) AS unique_products;
+            """
+            await cursor.execute(query)
+            result = await cursor.fetchone()
+
+            # Return the count
+            return {"Total Products": result[0]}
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error counting unique products: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
 
 #Product.js count all the products
 @router.get("/products/active/count")
+@singleflight.coalesce
 async def count_unique_active_products():
-    conn = None
     try:
-        # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to count unique active products based on productName and category
-        query = """
-            SELECT COUNT(*)
-            FROM (
-                SELECT productName, category
-                FROM Products
-                WHERE isActive = 1
-                GROUP BY productName, category
-            ) AS unique_active_products
-        """
-        await cursor.execute(query)
-        result = await cursor.fetchone()
-
-        # Return the count
-        return {"Total Unique Active Products": result[0]}
+        async with database.unit_of_work() as cursor:
+            # Query to count unique active products based on productName and category
+            query = """
+                SELECT COUNT(*)
+                FROM (
+                    SELECT productName, category
+                    FROM Products
+                    WHERE isActive = 1
+                    GROUP BY productName, category
+                ) AS unique_active_products
+            """
+            await cursor.execute(query)
+            result = await cursor.fetchone()
+
+            # Return the count
+            return {"Total Unique Active Products": result[0]}
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error counting unique active products: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
 
 # add quantities to an existing products
 @router.post('/products/add-quantity')
 async def add_product_quantity(product: AddQuantity):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-
     try:
-        await cursor.execute(
-            ''' select productID
-            from Products
-            where productName = ? and size = ? and category = ? and 
-            isActive = 1''',
-            product.productName, product.size, product.category
-        )
-        product_row = await cursor.fetchone()
-
-        if not product_row:
-            raise HTTPException(status_code=404, detail='Product not found.')
-
-        product_id = product_row[0]
-
-        variants_data= [(
-                    generate_barcode(),
-                    generate_sku(),
-                    product_id )
-                 for _ in range(product.quantity)
-                 ]
-        await cursor.executemany(
-                    '''insert into ProductVariants (barcode, productCode, productID)
-                    values (?, ?, ?)''',
-                    variants_data
-                )
-        await conn.commit()
-        return{'message': f'{product.quantity} quantities of {product.productName} added successfully.'}
+        async def add_quantity(cursor):
+            await cursor.execute(
+                ''' select productID
+                from Products
+                where productName = ? and size = ? and category = ? and 
+                isActive = 1''',
+                product.productName, product.size, product.category
+            )
+            product_row = await cursor.fetchone()
+
+            if not product_row:
+                raise HTTPException(status_code=404, detail='Product not found.')
+
+            product_id = product_row[0]
+
+            # Large quantities are added chunk by chunk in the background
+            if product.quantity > LARGE_QUANTITY:
+                job_id = await jobs.enqueue(cursor, "add_variants", {"productID": product_id}, product.quantity)
+                return job_accepted(job_id, productID=product_id, quantity=product.quantity)
+
+            await insert_variants(cursor, product_id, product.quantity)
+            return{'message': f'{product.quantity} quantities of {product.productName} added successfully.'}
+        return await database.run_in_transaction(add_quantity)
     except Exception as e:
-        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
     
+# Write one chunk of an import in a single round-trip: create the missing product
+# groups, count the units of sizes that already exist into currentStock, insert the
+# new sizes, and return the productID of every (group, size) of the chunk.
+IMPORT_CHUNK_SQL = '''
+SET NOCOUNT ON;
+DECLARE @groupsJson NVARCHAR(MAX) = ?, @sizesJson NVARCHAR(MAX) = ?;
+DECLARE @groups TABLE (groupHash BINARY(32) PRIMARY KEY, productGroupID INT);
+DECLARE @sizes TABLE (
+    groupHash BINARY(32), productGroupID INT, size NVARCHAR(50), color NVARCHAR(50),
+    unitPrice FLOAT, stock INT, image_path NVARCHAR(255),
+    PRIMARY KEY (productGroupID, size));
+DECLARE @products TABLE (productID INT, productGroupID INT, size NVARCHAR(50), isNew BIT);
+
+INSERT INTO ProductGroups (groupHash, nameHash, productName, productDescription, category)
+SELECT CONVERT(BINARY(32), g.groupHash, 2), CONVERT(BINARY(32), g.nameHash, 2),
+       g.productName, g.productDescription, g.category
+FROM OPENJSON(@groupsJson) WITH (
+    groupHash CHAR(64), nameHash CHAR(64), productName NVARCHAR(255),
+    productDescription NVARCHAR(MAX), category NVARCHAR(50)) AS g
+WHERE NOT EXISTS (SELECT 1 FROM ProductGroups AS pg WITH (UPDLOCK, HOLDLOCK)
+                  WHERE pg.groupHash = CONVERT(BINARY(32), g.groupHash, 2));
+
+INSERT INTO @groups (groupHash, productGroupID)
+SELECT pg.groupHash, pg.productGroupID
+FROM OPENJSON(@groupsJson) WITH (groupHash CHAR(64)) AS g
+JOIN ProductGroups AS pg ON pg.groupHash = CONVERT(BINARY(32), g.groupHash, 2);
+
+INSERT INTO @sizes (groupHash, productGroupID, size, color, unitPrice, stock, image_path)
+SELECT g.groupHash, g.productGroupID, s.size, s.color, s.unitPrice, s.stock, s.image_path
+FROM OPENJSON(@sizesJson) WITH (
+    groupHash CHAR(64), size NVARCHAR(50), color NVARCHAR(50), unitPrice FLOAT,
+    stock INT, image_path NVARCHAR(255)) AS s
+JOIN @groups AS g ON g.groupHash = CONVERT(BINARY(32), s.groupHash, 2);
+
+UPDATE p
+SET currentStock = p.currentStock + s.stock
+OUTPUT inserted.productID, inserted.productGroupID, inserted.size, 0 INTO @products
+FROM Products AS p
+JOIN @sizes AS s ON s.productGroupID = p.productGroupID AND s.size = p.size
+WHERE p.isActive = 1;
+
+INSERT INTO Products (
+    productName, productDescription, size, color, category,
+    unitPrice, currentStock, image_path, isActive, productGroupID)
+OUTPUT inserted.productID, inserted.productGroupID, inserted.size, 1 INTO @products
+SELECT pg.productName, pg.productDescription, s.size, s.color, pg.category,
+       s.unitPrice, s.stock,
+       ISNULL(s.image_path, (SELECT TOP 1 image_path FROM Products AS e
+                             WHERE e.productGroupID = s.productGroupID AND e.isActive = 1)),
+       1, s.productGroupID
+FROM @sizes AS s
+JOIN ProductGroups AS pg ON pg.productGroupID = s.productGroupID
+WHERE NOT EXISTS (SELECT 1 FROM @products AS p
+                  WHERE p.productGroupID = s.productGroupID AND p.size = s.size);
+
+SELECT CONVERT(CHAR(64), s.groupHash, 2), s.size, p.productID, p.isNew
+FROM @products AS p
+JOIN @sizes AS s ON s.productGroupID = p.productGroupID AND s.size = p.size;
+'''
+
+# Function to write one validated chunk of an import
+async def import_chunk(cursor, sizes):
+    groups = {}
+    for size in sizes:
+        row = size["row"]
+        groups.setdefault(size["groupHash"], {
+            "groupHash": size["groupHash"].hex(),
+            "nameHash": product_groups.name_hash(row.productName, row.category).hex(),
+            "productName": row.productName,
+            "productDescription": row.productDescription,
+            "category": row.category,
+        })
+    # sizes above LARGE_QUANTITY start at 0 stock and are counted in by a background job
+    payload = [{
+        "groupHash": size["groupHash"].hex(),
+        "size": size["row"].size,
+        "color": size["row"].color,
+        "unitPrice": size["row"].unitPrice,
+        "stock": size["quantity"] if size["quantity"] <= LARGE_QUANTITY else 0,
+        "image_path": size["row"].image_path,
+    } for size in sizes]
+    await cursor.execute(IMPORT_CHUNK_SQL, (
+        serialization.dumps(list(groups.values())).decode(), serialization.dumps(payload).decode()))
+    products = {(group_hash.lower(), product_groups.normalize(size)): (product_id, is_new)
+                for group_hash, size, product_id, is_new in await cursor.fetchall()}
+
+    quantities = {}
+    counts = {"products_created": 0, "sizes_restocked": 0, "variants_created": 0, "jobs": []}
+    for size in sizes:
+        product_id, is_new = products[(size["groupHash"].hex(), product_groups.normalize(size["row"].size))]
+        counts["products_created" if is_new else "sizes_restocked"] += 1
+        if size["quantity"] > LARGE_QUANTITY:
+            job_id = await jobs.enqueue(
+                cursor, "add_variants", {"productID": product_id, "adjustStock": True}, size["quantity"])
+            counts["jobs"].append({"jobID": job_id, "productID": product_id, "statusUrl": f"/jobs/{job_id}"})
+        elif size["quantity"]:
+            quantities[product_id] = quantities.get(product_id, 0) + size["quantity"]
+            counts["variants_created"] += size["quantity"]
+    await insert_product_variants(cursor, quantities)
+    return counts
+
+# import a vendor catalogue from a CSV or XLSX file
+@router.post('/products/import')
+async def import_products(file: UploadFile = File(...)):
+    """
+    Stream the upload chunk by chunk: each chunk of rows is validated, grouped by
+    product group and size, and written in its own transaction, so memory use does
+    not grow with the file. Returns the counts and a per-line error report.
+    """
+    report = catalogue_import.ImportReport()
+    rows = catalogue_import.iter_rows(file.file, file.filename)
+    try:
+        while True:
+            # parsing and validation run off the event loop
+            sizes = await run_in_threadpool(catalogue_import.next_chunk, rows, report)
+            if sizes is None:
+                break
+            if not sizes:
+                continue
+            try:
+                counts = await database.run_in_transaction(lambda cursor: import_chunk(cursor, sizes))
+            except Exception as e:
+                print(f"Error importing products: {e}")
+                for size in sizes:
+                    for line_number in size["lines"]:
+                        report.add_error(line_number, f"Not saved: {e}")
+                continue
+            report.imported_rows += sum(len(size["lines"]) for size in sizes)
+            report.products_created += counts["products_created"]
+            report.sizes_restocked += counts["sizes_restocked"]
+            report.variants_created += counts["variants_created"]
+            report.jobs.extend(counts["jobs"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error reading import file: {e}")
+        raise HTTPException(status_code=400, detail=f"Could not read the file: {e}")
+    finally:
+        await file.close()
+    return report.as_dict()
+
+# products and variants changed since a sync token, for clients that keep a copy of the catalogue
+# (declared before /products/{product_id} so "changes" is not read as an id)
+@router.get('/products/changes')
+async def get_product_changes(
+    since: str = "0",
+    limit: int = Query(default=change_feed.MAX_CHANGES_PAGE, ge=1, le=change_feed.MAX_CHANGES_PAGE),
+):
+    """
+    Start with since=0 (everything) and keep asking with the returned token; hasMore
+    means the next page is already waiting. Deactivated and archived rows are listed
+    with their last values so the client can drop them.
+    """
+    if not since.isdigit():
+        raise HTTPException(status_code=422, detail="'since' must be a token returned by this endpoint.")
+    try:
+        return await change_feed.changes(int(since), limit)
+    except Exception as e:
+        print(f"Error reading the product change feed: {e}")
+        raise HTTPException(status_code=500, detail=f"Error reading the product change feed: {e}")
+
 # get all productss 
 @router.get("/products")
-async def get_products():
-    conn = await database.get_db_connection()
-    try: 
-        async with conn.cursor() as cursor:
-            await cursor.execute('''
+@singleflight.coalesce
+async def get_products(bypass_replica: bool = False):
+    if use_replica(bypass_replica):
+        return serialization.rows_response(catalogue_replica.replica.listing(), PRODUCTS_MAPPER)
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('''
 select p.productName, p.productDescription,
 p.size, p.color, p.unitPrice, 
 count(pv.variantID) as 'available quantity'
@@ -842,44 +1215,45 @@ on p.productID = pv.productID
 where p.isActive = 1 and pv.isAvailable =1
 group by p.productName, p.productDescription, p.size, p.color, p.unitPrice
 ''')
-            products = await cursor.fetchall()
-            # map column names to row values
-            return [dict(zip([column[0] for column in cursor.description], row)) for row in products]
-    finally: 
-        await conn.close()
+        products = await cursor.fetchall()
+        # map column names to row values (compiled once per query)
+        mapper = serialization.mapper_for("products", cursor.description)
+        return serialization.rows_response(products, mapper)
 
 # get one product
 @router.get('/products/{product_id}')
-async def get_product(product_id: int):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        await cursor.execute('''select p.productName, p.productDescription,
-            p.size, p.color, p.unitPrice,
-            p.size, p.color, p.unitPrice, 
-            p.minStockLevel, p.maxStockLevel,
-            count(pv.variantID) as 'available quantity'
-            from products as p
-            left join ProductVariants as pv
-            on p.productID = pv.productID
-            where p.isActive = 1 and pv.isAvailable =1
-            and p.productID = ?
-            group by p.productName, p.productDescription, p.size, p.color, p.unitPrice, p.minStockLevel, p.maxStockLevel''', product_id)
-        #group by p.productName, p.productDescription, p.size, p.color, p.unitPrice, ''', product_id)
-        product = await cursor.fetchone()
-        if not product:
-            raise HTTPException(status_code=404, detail='product not found')
-        return dict(zip([column[0] for column in cursor.description], product))
-    finally:
-        await conn.close()
+async def get_product(product_id: int, include_inactive: bool = False, bypass_replica: bool = False):
+    if use_replica(bypass_replica):
+        product = catalogue_replica.replica.product(product_id)
+    else:
+        # Point lookups from concurrent requests are batched into one IN (...) query
+        product = await loaders.product_loader.load(product_id)
+    if not product and include_inactive:
+        # soft-deleted (or out of stock) products, including the archived ones
+        async with database.unit_of_work() as cursor:
+            await cursor.execute('''
+                SELECT p.productName, p.productDescription, p.size, p.color, p.unitPrice,
+                       p.minStockLevel, p.maxStockLevel,
+                       (SELECT COUNT(*) FROM ProductVariants AS pv
+                        WHERE pv.productID = p.productID AND pv.isAvailable = 1),
+                       p.isActive, p.isArchived
+                FROM AllProducts AS p
+                WHERE p.productID = ?''', (product_id,))
+            row = await cursor.fetchone()
+        if row:
+            product = dict(zip(("productName", "productDescription", "size", "color", "unitPrice",
+                                "minStockLevel", "maxStockLevel", "available quantity",
+                                "isActive", "isArchived"), row))
+    if not product:
+        raise HTTPException(status_code=404, detail='product not found')
+    return product
 
 # get all product variants 
 @router.get("/product/variants")
+@singleflight.coalesce
 async def get_product_variants():
-    conn = await database.get_db_connection()
-    try: 
-        async with conn.cursor() as cursor:
-            await cursor.execute('''
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('''
 select p.productName, pv.barcode, pv.productCode, 
 p.productDescription, p.size, p.color, p.unitPrice, 
 p.minStockLevel, p.maxStockLevel
@@ -887,11 +1261,10 @@ from Products as p
 full outer join ProductVariants as pv
 on p.productID = pv.productID
 where p.isActive = 1 and pv.isAvailable = 1;''')
-            products = await cursor.fetchall()
-            # map column names to row values
-            return [dict(zip([column[0] for column in cursor.description], row)) for row in products]
-    finally: 
-        await conn.close()
+        products = await cursor.fetchall()
+        # map column names to row values (compiled once per query)
+        mapper = serialization.mapper_for("product_variants", cursor.description)
+        return serialization.rows_response(products, mapper)
 
 # # get one product variant
 # @router.get('/products/variant/{variant_id}', response_model=ProductVariant)
@@ -931,83 +1304,80 @@ where p.isActive = 1 and pv.isAvailable = 1;''')
 
 @router.put('/products')
 async def update_products(productUpdate: Product, image_path: str):
-    conn = await database.get_db_connection()
     try:
-        async with conn.cursor() as cursor:
-            # Update all products with the same productName, productDescription, unitPrice, and category
+        # The products are found by their group (name, description and category), not by float matching on unitPrice
+        group_ids = await product_groups.resolve_group_ids(
+            None, productUpdate.productName, productUpdate.category, productUpdate.productDescription)
+        if not group_ids:
+            raise HTTPException(status_code=404, detail="No products found with the specified criteria.")
+        in_groups = product_groups.placeholders(group_ids)
+
+        async def update_matching(cursor):
+            # Update the price and image of every size of the product
             await cursor.execute(
-                '''
+                f'''
                 UPDATE Products
-                SET productName = ?, productDescription = ?, category = ?, 
-                    unitPrice = ?, image_path = ?
-                WHERE productName = ? AND productDescription = ? AND unitPrice = ? AND category = ?
+                SET unitPrice = ?, image_path = ?
+                OUTPUT inserted.productID
+                WHERE productGroupID IN ({in_groups}) AND isActive = 1
                 ''',
-                product.productName,
-                product.productDescription,
-                product.category,
-                product.unitPrice,
+                productUpdate.unitPrice,
                 image_path,  # Update the image path
-                product.productName,
-                product.productDescription,
-                product.unitPrice,
-                product.category
+                *group_ids
             )
-            await conn.commit()
+            invalidation.publish_after_commit("Products", [row[0] for row in await cursor.fetchall()])
 
             return {'message': 'Products updated successfully!'}
+        return await database.run_in_transaction(update_matching)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        await conn.close()
-
 
 @router.delete('/products/{product_id}')
 async def delete_product(product_id: int):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
     try:
-        # Check if the product exists and is active
-        await cursor.execute('''SELECT productID FROM Products WHERE productID = ? AND isActive = 1''', (product_id,))
-        product = await cursor.fetchone()
+        async def deactivate_product(cursor):
+            # Check if the product exists and is active
+            await cursor.execute('''SELECT productID FROM Products WHERE productID = ? AND isActive = 1''', (product_id,))
+            product = await cursor.fetchone()
 
-        if not product:
-            raise HTTPException(status_code=404, detail='Product not found or already deleted.')
+            if not product:
+                raise HTTPException(status_code=404, detail='Product not found or already deleted.')
 
-        # Mark the product as inactive
-        await cursor.execute('''UPDATE Products SET isActive = 0 WHERE productID = ?''', (product_id,))
-        await conn.commit()
+            # Mark the product as inactive
+            await cursor.execute('''UPDATE Products SET isActive = 0 WHERE productID = ?''', (product_id,))
+            await stock_alerts.refresh(cursor, [product_id])
+            invalidation.publish_after_commit("Products", [product_id])
 
-        return {'message': f'Product with ID {product_id} has been deleted (marked as inactive).'}
+            return {'message': f'Product with ID {product_id} has been deleted (marked as inactive).'}
+        return await database.run_in_transaction(deactivate_product)
     except Exception as e:
-        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
 
 
 # delete a product variant
 @router.delete('/products/variant/{variant_id}')
 async def delete_product_variant(variant_id: int):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
     try:
-        # Check if the variant exists and is available
-        await cursor.execute('''SELECT variantID FROM ProductVariants WHERE variantID = ? AND isAvailable = 1''', (variant_id,))
-        variant = await cursor.fetchone()
-
-        if not variant:
-            raise HTTPException(status_code=404, detail='Product variant not found or already deleted.')
-
-        # Mark the variant as unavailable
-        await cursor.execute('''UPDATE ProductVariants SET isAvailable = 0 WHERE variantID = ?''', (variant_id,))
-        await conn.commit()
-
-        return {'message': f'Product variant with ID {variant_id} has been deleted (marked as unavailable).'}
+        async def deactivate_variant(cursor):
+            # Check if the variant exists and is available
+            await cursor.execute('''SELECT barcode, productID FROM ProductVariants WHERE variantID = ? AND isAvailable = 1''', (variant_id,))
+            variant = await cursor.fetchone()
+
+            if not variant:
+                raise HTTPException(status_code=404, detail='Product variant not found or already deleted.')
+
+            # Mark the variant as unavailable
+            await cursor.execute('''UPDATE ProductVariants SET isAvailable = 0 WHERE variantID = ?''', (variant_id,))
+            database.after_commit(lambda: barcode_index.index.set_available([variant[0]], False))
+            invalidation.publish_after_commit("ProductVariants", [variant[0]])
+            await stock_ledger.record(cursor, 'softDelete', {variant[1]: -1})
+            await stock_alerts.refresh(cursor, [variant[1]])
+
+            return {'message': f'Product variant with ID {variant_id} has been deleted (marked as unavailable).'}
+        return await database.run_in_transaction(deactivate_variant)
     except Exception as e:
-        await conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,137 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field, StringConstraints
+from typing import Annotated, List, Literal
+import json
+import barcode_index
+import database
+import invalidation
+import stock_alerts
+
+router = APIRouter()
+
+# Most codes a scanner may resolve in one batch request
+MAX_BATCH_SIZE = 5000
+# Most codes one condition batch (e.g. a returns delivery) may flag
+MAX_CONDITION_BATCH_SIZE = 20000
+
+# Condition -> flag column on ProductVariants
+CONDITION_COLUMNS = {
+    "damaged": "isDamaged",
+    "wrongItem": "isWrongItem",
+    "returned": "isReturned",
+}
+
+# Flag a whole batch in one round-trip: the codes arrive as one JSON array
+# parameter, flagged variants leave the available pool (and any reservation),
+# Products.currentStock drops by the units that were available (one stock ledger
+# movement per product). Returns one outcome (and the flagged variant's
+# productID) per distinct barcode; archived variants can no longer be flagged.
+CONDITION_BATCH_SQL = '''
+SET NOCOUNT ON;
+DECLARE @codes TABLE (barcode NVARCHAR(50) PRIMARY KEY);
+DECLARE @flagged TABLE (variantID INT PRIMARY KEY, barcode NVARCHAR(50), productID INT, wasAvailable BIT);
+
+INSERT INTO @codes (barcode)
+SELECT DISTINCT value FROM OPENJSON(?);
+
+UPDATE pv
+SET {column} = 1, isAvailable = 0, reservedOrderID = NULL
+OUTPUT inserted.variantID, inserted.barcode, inserted.productID, deleted.isAvailable INTO @flagged
+FROM ProductVariants AS pv
+JOIN @codes AS c ON c.barcode = pv.barcode
+WHERE pv.{column} = 0;
+
+UPDATE p
+SET currentStock = p.currentStock - f.units
+FROM Products AS p
+JOIN (SELECT productID, COUNT(*) AS units FROM @flagged WHERE wasAvailable = 1 GROUP BY productID) AS f
+    ON f.productID = p.productID;
+
+INSERT INTO StockMovements (productID, movementType, quantity)
+SELECT productID, '{condition}', -COUNT(*) FROM @flagged WHERE wasAvailable = 1 GROUP BY productID;
+
+SELECT c.barcode,
+    CASE WHEN EXISTS (SELECT 1 FROM @flagged AS f WHERE f.barcode = c.barcode) THEN 'flagged'
+         WHEN EXISTS (SELECT 1 FROM ProductVariants AS pv WHERE pv.barcode = c.barcode) THEN 'alreadyFlagged'
+         WHEN EXISTS (SELECT 1 FROM ProductVariantsArchive AS pa WHERE pa.barcode = c.barcode) THEN 'archived'
+         ELSE 'notFound' END,
+    (SELECT TOP 1 f.productID FROM @flagged AS f WHERE f.barcode = c.barcode)
+FROM @codes AS c;
+'''
+
+
+class BarcodeBatch(BaseModel):
+    barcodes: List[str] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class ConditionBatch(BaseModel):
+    barcodes: List[Annotated[str, StringConstraints(min_length=1, max_length=50)]] = Field(
+        min_length=1, max_length=MAX_CONDITION_BATCH_SIZE)
+    condition: Literal["damaged", "wrongItem", "returned"]
+
+
+# resolve one scanned barcode
+@router.get('/by-barcode/{code}')
+async def get_variant_by_barcode(code: str, include_archived: bool = False):
+    variant = barcode_index.index.lookup(code)
+    if variant is None:
+        # not indexed yet, e.g. inserted by another worker since startup
+        variant = (await barcode_index.fetch_variants([code])).get(code)
+    if variant is None and include_archived:
+        variant = (await barcode_index.fetch_archived_variants([code])).get(code)
+    if variant is None:
+        raise HTTPException(status_code=404, detail='barcode not found')
+    return variant
+
+
+# resolve a list of scanned barcodes
+@router.post('/by-barcode')
+async def get_variants_by_barcode(batch: BarcodeBatch, include_archived: bool = False):
+    found = {}
+    unseen = []
+    for code in dict.fromkeys(batch.barcodes):
+        variant = barcode_index.index.lookup(code)
+        if variant is None:
+            unseen.append(code)
+        else:
+            found[code] = variant
+    if unseen:
+        found.update(await barcode_index.fetch_variants(unseen))
+    missing = [code for code in unseen if code not in found]
+    if missing and include_archived:
+        found.update(await barcode_index.fetch_archived_variants(missing))
+    return {
+        "variants": list(found.values()),
+        "notFound": [code for code in unseen if code not in found],
+    }
+
+
+# flag a batch of variants as damaged, wrong item or returned
+@router.post('/condition')
+async def set_variant_condition(batch: ConditionBatch):
+    query = CONDITION_BATCH_SQL.format(column=CONDITION_COLUMNS[batch.condition], condition=batch.condition)
+    codes = json.dumps(batch.barcodes)
+
+    async def flag(cursor):
+        await cursor.execute(query, (codes,))
+        outcomes = await cursor.fetchall()
+        flagged = [row[0] for row in outcomes if row[1] == 'flagged']
+        database.after_commit(lambda: barcode_index.index.set_available(flagged, False))
+        invalidation.publish_after_commit("ProductVariants", flagged)
+        await stock_alerts.refresh(cursor, [row[2] for row in outcomes if row[1] == 'flagged'])
+        return outcomes
+
+    try:
+        outcomes = await database.run_in_transaction(flag)
+    except Exception as e:
+        print(f"Error flagging variants: {e}")
+        raise HTTPException(status_code=500, detail=f"Error flagging variants: {e}")
+
+    summary = {"flagged": 0, "alreadyFlagged": 0, "archived": 0, "notFound": 0}
+    for _, outcome, _ in outcomes:
+        summary[outcome] += 1
+    return {
+        "condition": batch.condition,
+        "summary": summary,
+        "outcomes": [{"barcode": barcode, "outcome": outcome} for barcode, outcome, _ in outcomes],
+    }
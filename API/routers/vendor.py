@@ -3,6 +3,7 @@ from routers.auth import get_current_user
 from pydantic import BaseModel
 import aioodbc
 import database as database
+import loaders
 from datetime import datetime
 
 # Initialize Router
@@ -24,13 +25,12 @@ class Vendor(BaseModel):
 
 # Create a Vendor
 @router.post("/")
-async def create_vendor(vendor: Vendor, db=Depends(database.get_db_connection)):
+async def create_vendor(vendor: Vendor):
     """
     Add a new vendor to the database.
     """
     try:
-        cursor = await db.cursor()
-        try:
+        async def insert_vendor(cursor):
             created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Get current timestamp
             await cursor.execute(
                 """
@@ -40,29 +40,24 @@ async def create_vendor(vendor: Vendor, db=Depends(database.get_db_connection)):
                 (vendor.vendorName, vendor.contactNumber, vendor.contactEmail, vendor.building, vendor.street,
                  vendor.barangay, vendor.city, vendor.country, vendor.zipcode, vendor.isActive, created_at),
             )
-            await db.commit()
-            return {"message": "Vendor created successfully"}
-        finally:
-            await cursor.close()
+        await database.run_in_transaction(insert_vendor)
+        return {"message": "Vendor created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating vendor: {str(e)}")
 
 
 # List All Active Vendors
 @router.get("/")
-async def list_vendors(db=Depends(database.get_db_connection)):
+async def list_vendors():
     """
     Retrieve all active vendors (exclude soft-deleted).
     """
     try:
-        cursor = await db.cursor()
-        try:
+        async with database.unit_of_work() as cursor:
             await cursor.execute("SELECT * FROM Vendors WHERE isActive = 1")
             rows = await cursor.fetchall()
             if not rows:
                 raise HTTPException(status_code=404, detail="No active vendors found")
-        finally:
-            await cursor.close()
 
         return [
             {
@@ -87,40 +82,17 @@ async def list_vendors(db=Depends(database.get_db_connection)):
 
 # Get Vendor by ID
 @router.get("/{vendor_id}")
-async def get_vendor(vendor_id: int, include_inactive: bool = False, db=Depends(database.get_db_connection)):
+async def get_vendor(vendor_id: int, include_inactive: bool = False):
     """
     Retrieve details of a specific vendor by ID.
     Optionally include soft-deleted vendors by setting `include_inactive` to True.
     """
     try:
-        cursor = await db.cursor()
-        try:
-            query = "SELECT * FROM Vendors WHERE VendorID = ?"
-            params = [vendor_id]
+        # Point lookups from concurrent requests are batched into one IN (...) query
+        vendor = await loaders.vendor_loader.load(vendor_id)
 
-            if not include_inactive:
-                query += " AND isActive = 1"
-
-            await cursor.execute(query, params)
-            row = await cursor.fetchone()
-        finally:
-            await cursor.close()
-
-        if row:
-            return {
-                "VendorID": row[0],
-                "VendorName": row[1],
-                "ContactNumber": row[2],
-                "ContactEmail": row[3],
-                "Building": row[4],
-                "Street": row[5],
-                "Barangay": row[6],
-                "City": row[7],
-                "Country": row[8],
-                "Zipcode": row[9],
-                "CreatedAt": row[10],
-                "UpdatedAt": row[11],
-            }
+        if vendor and (include_inactive or vendor["isActive"]):
+            return {key: value for key, value in vendor.items() if key != "isActive"}
         else:
             raise HTTPException(status_code=404, detail="Vendor not found")
     except Exception as e:
@@ -129,85 +101,85 @@ async def get_vendor(vendor_id: int, include_inactive: bool = False, db=Depends(
 
 # Update a Vendor
 @router.put("/{vendor_id}")
-async def update_vendor(vendor_id: int, vendor: Vendor, db=Depends(database.get_db_connection)):
+async def update_vendor(vendor_id: int, vendor: Vendor):
     """
     Update an existing vendor by ID.
     """
     try:
-        cursor = await db.cursor()
-        try:
+        async def apply_update(cursor):
             updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Get current timestamp
             # Update vendor details
             await cursor.execute(
                 """
                 UPDATE Vendors
                 SET VendorName = ?, ContactNumber = ?, ContactEmail = ?, Building = ?, Street = ?, Barangay = ?, City = ?, Country = ?, Zipcode = ?, UpdatedAt = ?
+                OUTPUT inserted.VendorID
                 WHERE VendorID = ? AND isActive = 1
                 """,
                 (vendor.vendorName, vendor.contactNumber, vendor.contactEmail, vendor.building, vendor.street,
                  vendor.barangay, vendor.city, vendor.country, vendor.zipcode, updated_at, vendor_id),
             )
-            if cursor.rowcount == 0:
+            if await cursor.fetchone() is None:
                 raise HTTPException(status_code=404, detail="Vendor not found or already inactive")
-            await db.commit()
-            return {"message": "Vendor updated successfully"}
-        finally:
-            await cursor.close()
+        await database.run_in_transaction(apply_update)
+        return {"message": "Vendor updated successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating vendor: {str(e)}")
 
 
 # Soft Delete a Vendor
 @router.delete("/{vendor_id}")
-async def delete_vendor(vendor_id: int, db=Depends(database.get_db_connection)):
+async def delete_vendor(vendor_id: int):
     """
     Soft delete a vendor by setting isActive to False (0).
     """
     try:
-        cursor = await db.cursor()
-        try:
+        async def apply_delete(cursor):
             updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Get current timestamp
             await cursor.execute(
                 """
                 UPDATE Vendors
                 SET isActive = 0, UpdatedAt = ?
+                OUTPUT inserted.VendorID
                 WHERE VendorID = ? AND isActive = 1
                 """,
                 (updated_at, vendor_id),
             )
-            if cursor.rowcount == 0:
+            if await cursor.fetchone() is None:
                 raise HTTPException(status_code=404, detail="Vendor not found or already inactive")
-            await db.commit()
-            return {"message": "Vendor soft-deleted successfully"}
-        finally:
-            await cursor.close()
+        await database.run_in_transaction(apply_delete)
+        return {"message": "Vendor soft-deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to soft delete vendor")
 
 
 # Reactivate a Soft-Deleted Vendor
 @router.put("/{vendor_id}/reactivate")
-async def reactivate_vendor(vendor_id: int, db=Depends(database.get_db_connection)):
+async def reactivate_vendor(vendor_id: int):
     """
     Reactivate a soft-deleted vendor by setting isActive to True (1).
     """
     try:
-        cursor = await db.cursor()
-        try:
+        async def apply_reactivation(cursor):
             updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Get current timestamp
             await cursor.execute(
                 """
                 UPDATE Vendors
                 SET isActive = 1, UpdatedAt = ?
+                OUTPUT inserted.VendorID
                 WHERE VendorID = ? AND isActive = 0
                 """,
                 (updated_at, vendor_id),
             )
-            if cursor.rowcount == 0:
+            if await cursor.fetchone() is None:
                 raise HTTPException(status_code=404, detail="Vendor not found or already active")
-            await db.commit()
-            return {"message": "Vendor reactivated successfully"}
-        finally:
-            await cursor.close()
+        await database.run_in_transaction(apply_reactivation)
+        return {"message": "Vendor reactivated successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to reactivate vendor")
@@ -0,0 +1,49 @@
+import decimal
+import orjson
+from fastapi.responses import Response
+
+
+# Precompiled mapping from DB row tuples to output dicts. Column names are
+# resolved once per query instead of once per row, and computed fields are
+# (source column index, function) pairs applied on top of the plain columns.
+class RowMapper:
+    def __init__(self, columns, computed=None):
+        self.columns = tuple(columns)
+        self.computed = tuple((name, index, func) for name, (index, func) in (computed or {}).items())
+
+    def __call__(self, row):
+        item = dict(zip(self.columns, row))
+        for name, index, func in self.computed:
+            item[name] = func(row[index])
+        return item
+
+    def map_rows(self, rows):
+        return [self(row) for row in rows]
+
+
+# Mappers compiled from cursor.description, one per query
+_description_mappers = {}
+
+
+def mapper_for(key: str, description, computed=None) -> RowMapper:
+    """Return the mapper registered under key, compiling it from the cursor description on first use."""
+    mapper = _description_mappers.get(key)
+    if mapper is None:
+        mapper = _description_mappers[key] = RowMapper([column[0] for column in description], computed)
+    return mapper
+
+
+# orjson handles str/int/float/datetime natively; SQL Server money and decimal columns arrive as Decimal
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+def rows_response(rows, mapper: RowMapper, status_code: int = 200) -> Response:
+    """Encode DB rows straight to a JSON response, skipping per-row model validation."""
+    return Response(content=dumps(mapper.map_rows(rows)), status_code=status_code, media_type="application/json")
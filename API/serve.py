@@ -0,0 +1,83 @@
+# Production launcher: several worker processes sharing one listening socket,
+# on uvloop and httptools. main.py's own __main__ stays the development server.
+#
+#   cd API && python serve.py [workers]
+#
+# Every worker reads the same environment (and .env):
+#   HOST, PORT            address to listen on (127.0.0.1:8001)
+#   WORKERS               worker processes (one per CPU)
+#   GRACEFUL_TIMEOUT      seconds a stopping worker lets its requests run (30)
+#   INVALIDATION_BUS_DIR  where the workers meet (see invalidation.py)
+#
+# The one-off startup work, checking the database and creating the default
+# user, runs here once before the workers start; they skip it (STARTUP_DONE=1).
+# Each worker still opens its own connection pool. One worker, the holder of
+# main.MAINTENANCE_LOCK, runs the maintenance loops.
+#
+# A worker accepts connections as soon as it has imported, and warms its pool,
+# caches and IMS client in the background: point the load balancer's liveness
+# check at /healthz and its readiness check at /readyz (200 once warm).
+#
+# On SIGTERM (or Ctrl+C) every worker stops accepting connections, ends its
+# stock-alert event streams, and lets the requests in flight finish, including
+# their calls to IMS, for up to GRACEFUL_TIMEOUT seconds. It then sends its
+# queued invalidations and closes its pool.
+import asyncio
+import os
+import sys
+import uvicorn
+from dotenv import load_dotenv
+from uvicorn.supervisors import Multiprocess
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", 8001))
+WORKERS = int(os.getenv("WORKERS", os.cpu_count() or 1))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+# uvloop does not exist on Windows
+LOOP = "asyncio" if sys.platform == "win32" else "uvloop"
+
+
+class DrainingServer(uvicorn.Server):
+    def handle_exit(self, sig, frame):
+        if not self.should_exit:
+            # an open event stream would otherwise hold the drain until GRACEFUL_TIMEOUT
+            import stock_alerts
+            try:
+                asyncio.get_running_loop().call_soon_threadsafe(stock_alerts.close_streams)
+            except RuntimeError:
+                pass
+        super().handle_exit(sig, frame)
+
+
+async def prestart():
+    """Startup work done once for all the workers; fails the launch when the database is unreachable."""
+    import database
+    from routers import auth
+    try:
+        await auth.create_default_user()
+    finally:
+        await database.close_pool()
+
+
+def main(workers: int):
+    asyncio.run(prestart())
+    os.environ["STARTUP_DONE"] = "1"
+
+    config = uvicorn.Config(
+        "main:app", host=HOST, port=PORT, workers=workers,
+        loop=LOOP, http="httptools", timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+    server = DrainingServer(config)
+    print(f"Serving on http://{HOST}:{PORT} with {workers} worker(s)")
+    if workers > 1:
+        # the workers inherit the bound socket and the environment above
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS)
@@ -0,0 +1,59 @@
+import asyncio
+import functools
+from collections import Counter
+
+
+# Coalesces identical concurrent calls: while a call for a key is in flight,
+# every other caller with the same key waits for that call instead of running
+# its own query, and all of them receive the same result (or exception).
+class SingleFlight:
+    def __init__(self):
+        self._in_flight = {}
+        self._stats = {}
+
+    async def do(self, key, label: str, func, *args, **kwargs):
+        """Run func(*args, **kwargs) once for all concurrent callers sharing key."""
+        flight = self._in_flight.get(key)
+        if flight is None:
+            # Run the call in its own task so a caller that disconnects doesn't cancel it for the others
+            flight = self._in_flight[key] = [asyncio.ensure_future(func(*args, **kwargs)), 1]
+            flight[0].add_done_callback(lambda _: self._land(key, label))
+        else:
+            flight[1] += 1
+        return await asyncio.shield(flight[0])
+
+    def _land(self, key, label: str):
+        _, callers = self._in_flight.pop(key)
+        stats = self._stats.setdefault(label, {"flights": 0, "callers": 0, "absorbed": Counter()})
+        stats["flights"] += 1
+        stats["callers"] += callers
+        stats["absorbed"][callers - 1] += 1
+
+    def stats(self):
+        """Per-call-site flight counts and a histogram of how many callers each flight absorbed."""
+        return {
+            label: {
+                "flights": stats["flights"],
+                "callers": stats["callers"],
+                "absorbed": stats["callers"] - stats["flights"],
+                "absorbedPerFlight": {str(size): count for size, count in sorted(stats["absorbed"].items())},
+            }
+            for label, stats in self._stats.items()
+        }
+
+
+# Shared by every coalesced handler and query helper in this process
+group = SingleFlight()
+
+
+# Decorator for GET handlers and read-only query helpers. Calls are considered
+# identical when they hit the same function with the same arguments.
+def coalesce(func):
+    label = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = (func, args, tuple(sorted(kwargs.items())))
+        return await group.do(key, label, func, *args, **kwargs)
+
+    return wrapper
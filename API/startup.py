@@ -0,0 +1,92 @@
+import asyncio
+import importlib.util
+import sys
+import time
+from contextlib import contextmanager
+
+# Startup timing and readiness of this worker. main.py imports this module
+# first, times its imports and startup hooks against STARTED, and warms the
+# pool, the caches and the IMS client in the background once it accepts
+# connections. /healthz answers as soon as the worker serves at all; /readyz
+# answers 200 only once every component given to warm_up() is warm, so a load
+# balancer sends a new worker traffic only when it is fast.
+
+# When main.py started importing
+STARTED = time.perf_counter()
+# Seconds between retries of a failed warm-up step, doubled up to the maximum
+RETRY_SECONDS = 1
+MAX_RETRY_SECONDS = 30
+
+# phase -> seconds it took (imports, startup hooks, warm-up steps)
+phases = {}
+# milestone -> seconds after STARTED it was reached
+milestones = {}
+# component -> True once warm
+components = {}
+
+
+def lazy_import(name: str):
+    """
+    Return module name, executed on its first attribute access instead of now.
+    For heavy modules that only some requests use (NumPy, httpx).
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[phase] = round(time.perf_counter() - started, 4)
+
+
+def mark(milestone: str):
+    milestones[milestone] = round(time.perf_counter() - STARTED, 4)
+
+
+def ready() -> bool:
+    return all(components.values())
+
+
+async def _warm(name: str, step):
+    delay = RETRY_SECONDS
+    started = time.perf_counter()
+    while True:
+        try:
+            await step()
+            break
+        except Exception as e:
+            print(f"Error warming up {name}, retrying in {delay} s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RETRY_SECONDS)
+    phases[f"warm up {name}"] = round(time.perf_counter() - started, 4)
+    components[name] = True
+    if ready():
+        mark("ready")
+
+
+def warm_up(name: str, step):
+    """Run step() in the background until it succeeds; the worker is not ready until it has."""
+    components[name] = False
+    return asyncio.ensure_future(_warm(name, step))
+
+
+def stats():
+    return {
+        "ready": ready(),
+        "components": components,
+        "milestones": milestones,
+        "phases": phases,
+        "uptime": round(time.perf_counter() - STARTED, 1),
+    }
@@ -0,0 +1,157 @@
+# Low-stock / reorder alerts.
+# ProductStockLevels keeps the free variant count (available, not reserved) and
+# the stock state of every product. Each stock-changing write calls refresh()
+# in its own transaction for the products it touched; a product whose state
+# changes gets a StockAlerts row, and committed alerts are pushed to the
+# subscribers of the event stream.
+import asyncio
+import json
+import database
+import invalidation
+
+# Alerts replayed per request to /inventory/alerts or on an event-stream reconnect
+MAX_ALERTS_PER_PAGE = 1000
+# Alerts a slow event-stream subscriber may fall behind before it is dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Recount the free variants of the given products, store their stock state and
+# return an alert for every product whose state changed.
+REFRESH_SQL = '''
+SET NOCOUNT ON;
+DECLARE @ids TABLE (productID INT PRIMARY KEY);
+DECLARE @levels TABLE (productID INT PRIMARY KEY, availableCount INT, stockState VARCHAR(10));
+DECLARE @changed TABLE (productID INT, oldState VARCHAR(10), newState VARCHAR(10), availableCount INT);
+
+INSERT INTO @ids (productID)
+SELECT DISTINCT CAST(value AS INT) FROM OPENJSON(?);
+
+INSERT INTO @levels (productID, availableCount, stockState)
+SELECT p.productID, f.freeCount,
+    CASE WHEN p.isActive = 1 AND f.freeCount < p.minStockLevel THEN 'low'
+         WHEN p.isActive = 1 AND f.freeCount > p.maxStockLevel THEN 'over'
+         ELSE 'ok' END
+FROM @ids AS i
+JOIN Products AS p ON p.productID = i.productID
+CROSS APPLY (SELECT COUNT(*) AS freeCount FROM ProductVariants AS pv
+             WHERE pv.productID = p.productID AND pv.isAvailable = 1 AND pv.reservedOrderID IS NULL) AS f;
+
+MERGE ProductStockLevels WITH (HOLDLOCK) AS t
+USING @levels AS s ON t.productID = s.productID
+WHEN MATCHED THEN
+    UPDATE SET availableCount = s.availableCount, stockState = s.stockState, updatedAt = GETUTCDATE()
+WHEN NOT MATCHED THEN
+    INSERT (productID, availableCount, stockState) VALUES (s.productID, s.availableCount, s.stockState)
+OUTPUT inserted.productID, ISNULL(deleted.stockState, 'ok'), inserted.stockState, inserted.availableCount INTO @changed;
+
+INSERT INTO StockAlerts (productID, alertType, availableCount, minStockLevel, maxStockLevel)
+OUTPUT inserted.alertID, inserted.productID, inserted.alertType, inserted.availableCount,
+       inserted.minStockLevel, inserted.maxStockLevel, inserted.createdAt
+SELECT c.productID,
+    CASE c.newState WHEN 'low' THEN 'lowStock' WHEN 'over' THEN 'overStock' ELSE 'backToNormal' END,
+    c.availableCount, p.minStockLevel, p.maxStockLevel
+FROM @changed AS c
+JOIN Products AS p ON p.productID = c.productID
+WHERE c.oldState <> c.newState;
+'''
+
+# Products on an order, refreshed when its reservation is taken, released or delivered
+ORDER_PRODUCTS_SQL = 'SELECT DISTINCT productID FROM purchaseOrderDetails WHERE orderID = ?'
+
+ALERT_COLUMNS = ("alertID", "productID", "alertType", "availableCount", "minStockLevel", "maxStockLevel", "createdAt")
+
+# Queues of the connected event-stream clients
+_subscribers = set()
+
+
+def _alert(row):
+    return dict(zip(ALERT_COLUMNS, row))
+
+
+async def refresh(cursor, product_ids):
+    """
+    Recount the stock of products touched by the caller's unit of work and record
+    their threshold crossings. The alerts reach the event stream once it commits.
+    """
+    product_ids = list({int(product_id) for product_id in product_ids})
+    if not product_ids:
+        return []
+    await cursor.execute(REFRESH_SQL, (json.dumps(product_ids),))
+    alerts = [_alert(row) for row in await cursor.fetchall()]
+    if alerts:
+        database.after_commit(lambda: publish(alerts))
+        # the event-stream clients connected to the other workers get them through the invalidation bus
+        invalidation.publish_after_commit("StockAlerts", [alert["alertID"] for alert in alerts])
+    return alerts
+
+
+async def refresh_order(cursor, order_id: int):
+    """Refresh the products on an order."""
+    await cursor.execute(ORDER_PRODUCTS_SQL, (order_id,))
+    return await refresh(cursor, [row[0] for row in await cursor.fetchall()])
+
+
+def publish(alerts):
+    for queue in list(_subscribers):
+        for alert in alerts:
+            try:
+                queue.put_nowait(alert)
+            except asyncio.QueueFull:
+                # end the stream (None); the client reconnects with Last-Event-ID and replays from the table
+                _subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                break
+
+
+# Function to hand the alerts another worker recorded to this worker's event-stream clients
+@invalidation.subscribe("StockAlerts", own_writes=False)
+def _relay(alert_ids):
+    if _subscribers and alert_ids:
+        asyncio.ensure_future(_relay_alerts(list(alert_ids)))
+
+
+async def _relay_alerts(alert_ids):
+    try:
+        async with database.unit_of_work() as cursor:
+            await cursor.execute(f'''
+                SELECT {", ".join(ALERT_COLUMNS)} FROM StockAlerts
+                WHERE alertID IN (SELECT CAST(value AS INT) FROM OPENJSON(?)) ORDER BY alertID''',
+                (json.dumps(alert_ids),))
+            alerts = [_alert(row) for row in await cursor.fetchall()]
+    except Exception as e:
+        print(f"Error relaying stock alerts: {e}")
+        return
+    publish(alerts)
+
+
+def close_streams():
+    """End every event stream of this process, e.g. before it stops; the clients reconnect to another worker."""
+    for queue in list(_subscribers):
+        _subscribers.discard(queue)
+        try:
+            queue.put_nowait(None)
+        except asyncio.QueueFull:
+            # the replay from Last-Event-ID covers what is dropped here
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+
+def subscribe() -> asyncio.Queue:
+    queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    _subscribers.discard(queue)
+
+
+async def alerts_after(alert_id: int, limit: int = MAX_ALERTS_PER_PAGE):
+    """Return the alerts recorded after alert_id, oldest first."""
+    async with database.unit_of_work() as cursor:
+        await cursor.execute(f'''
+            SELECT TOP ({int(limit)}) {", ".join(ALERT_COLUMNS)}
+            FROM StockAlerts WHERE alertID > ? ORDER BY alertID''', (alert_id,))
+        return [_alert(row) for row in await cursor.fetchall()]
@@ -0,0 +1,138 @@
+# Stock movement ledger.
+# Every stock-changing write appends its movements (signed changes of the units
+# on hand per product) in its own transaction; batches that already hold the
+# affected rows in a table variable (delivery claims, condition flags) append
+# them in SQL. A periodic snapshot folds the ledger tail into the previous
+# snapshot, so an as-of query reads one snapshot plus a bounded tail.
+import asyncio
+import json
+from datetime import datetime, timedelta
+import database
+
+# A new snapshot is taken once this many movements follow the last one...
+SNAPSHOT_EVERY_MOVEMENTS = 50000
+# ...or once the last one is this old and movements followed it
+SNAPSHOT_MAX_AGE = timedelta(hours=24)
+# How often the snapshot task checks
+SNAPSHOT_CHECK_SECONDS = 300
+
+RECORD_SQL = '''
+INSERT INTO StockMovements (productID, movementType, quantity, referenceID)
+SELECT productID, ?, quantity, ?
+FROM OPENJSON(?) WITH (productID INT '$[0]', quantity INT '$[1]')
+WHERE quantity <> 0
+'''
+
+# Fold the movements since the last snapshot into a new one. The table lock waits
+# for in-flight movements to commit, so none can land below lastMovementID later.
+SNAPSHOT_SQL = '''
+SET NOCOUNT ON;
+DECLARE @previousID INT, @previousLast BIGINT, @last BIGINT;
+DECLARE @snapshot TABLE (snapshotID INT);
+
+SELECT TOP 1 @previousID = snapshotID, @previousLast = lastMovementID
+FROM StockSnapshots ORDER BY takenAt DESC, snapshotID DESC;
+
+SELECT @last = ISNULL(MAX(movementID), @previousLast) FROM StockMovements WITH (TABLOCK, HOLDLOCK);
+
+IF @last > @previousLast
+BEGIN
+    INSERT INTO StockSnapshots (takenAt, lastMovementID)
+    OUTPUT inserted.snapshotID INTO @snapshot
+    VALUES (SYSUTCDATETIME(), @last);
+
+    INSERT INTO StockSnapshotLines (snapshotID, productID, onHand)
+    SELECT (SELECT snapshotID FROM @snapshot), productID, SUM(onHand)
+    FROM (
+        SELECT productID, onHand FROM StockSnapshotLines WHERE snapshotID = @previousID
+        UNION ALL
+        SELECT productID, quantity FROM StockMovements
+        WHERE movementID > @previousLast AND movementID <= @last
+    ) AS stock
+    GROUP BY productID
+    HAVING SUM(onHand) <> 0;
+END
+
+SELECT snapshotID FROM @snapshot;
+'''
+
+# Units on hand per product at @asOf: the latest snapshot taken by then plus the movements
+# after it. Products archived since then are still listed.
+AS_OF_SQL = '''
+SET NOCOUNT ON;
+DECLARE @asOf DATETIME2(3) = ?;
+DECLARE @snapshotID INT, @takenAt DATETIME2(3), @lastMovementID BIGINT;
+
+SELECT TOP 1 @snapshotID = snapshotID, @takenAt = takenAt, @lastMovementID = lastMovementID
+FROM StockSnapshots WHERE takenAt <= @asOf ORDER BY takenAt DESC, snapshotID DESC;
+
+SELECT @snapshotID, @takenAt, (SELECT MIN(takenAt) FROM StockSnapshots);
+
+SELECT p.productID, p.productName, p.category, p.size, p.productGroupID, stock.onHand
+FROM (
+    SELECT productID, SUM(onHand) AS onHand
+    FROM (
+        SELECT productID, onHand FROM StockSnapshotLines WHERE snapshotID = @snapshotID
+        UNION ALL
+        SELECT productID, quantity FROM StockMovements
+        WHERE @snapshotID IS NOT NULL AND movementID > @lastMovementID AND createdAt <= @asOf
+    ) AS lines
+    GROUP BY productID
+    HAVING SUM(onHand) <> 0
+) AS stock
+JOIN AllProducts AS p ON p.productID = stock.productID
+WHERE (? IS NULL OR p.category = ?) AND (? IS NULL OR p.productID = ?)
+ORDER BY p.productID;
+'''
+
+
+async def record(cursor, movement_type: str, quantities: dict, reference_id: int = None):
+    """Append one movement per product ({productID: signed quantity}) in the caller's unit of work."""
+    if quantities:
+        await cursor.execute(RECORD_SQL, (
+            movement_type, reference_id, json.dumps([[int(product_id), int(quantity)]
+                                                     for product_id, quantity in quantities.items()])))
+
+
+async def take_snapshot():
+    """Fold the ledger tail into a new snapshot; returns its snapshotID (None when nothing moved)."""
+    async with database.unit_of_work() as cursor:
+        await cursor.execute(SNAPSHOT_SQL)
+        row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+async def snapshot_due() -> bool:
+    async with database.unit_of_work() as cursor:
+        await cursor.execute('''
+            SELECT TOP 1 s.takenAt,
+                   (SELECT COUNT_BIG(*) FROM StockMovements AS m WHERE m.movementID > s.lastMovementID)
+            FROM StockSnapshots AS s ORDER BY s.takenAt DESC, s.snapshotID DESC''')
+        row = await cursor.fetchone()
+    if not row:
+        return False
+    taken_at, pending = row
+    return pending >= SNAPSHOT_EVERY_MOVEMENTS or (pending > 0 and datetime.utcnow() - taken_at >= SNAPSHOT_MAX_AGE)
+
+
+async def snapshot_loop():
+    """Take a snapshot whenever one is due, for as long as the server runs."""
+    while True:
+        try:
+            if await snapshot_due():
+                snapshot_id = await take_snapshot()
+                if snapshot_id:
+                    print(f"Stock snapshot {snapshot_id} taken")
+        except Exception as e:
+            print(f"Error taking stock snapshot: {e}")
+        await asyncio.sleep(SNAPSHOT_CHECK_SECONDS)
+
+
+async def on_hand_as_of(as_of: datetime, category: str = None, product_id: int = None):
+    """Return (snapshot info, rows of productID, productName, category, size, productGroupID, onHand)."""
+    async with database.unit_of_work() as cursor:
+        await cursor.execute(AS_OF_SQL, (as_of, category, category, product_id, product_id))
+        snapshot_id, taken_at, first_snapshot_at = await cursor.fetchone()
+        await cursor.nextset()
+        rows = await cursor.fetchall()
+    return {"snapshotID": snapshot_id, "snapshotTakenAt": taken_at, "historyStartsAt": first_snapshot_at}, rows